@@ -0,0 +1,69 @@
+"""add client statements
+
+Revision ID: a7c9e1f3b568
+Revises: f6b8d0a2c457
+Create Date: 2026-10-18 16:21:07.318442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c9e1f3b568'
+down_revision: Union[str, None] = 'f6b8d0a2c457'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'client_statements',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('client_id', sa.Integer(), sa.ForeignKey('clients.id'), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('period_end', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.Enum('ISSUED', 'PAID', name='client_statement_status'), nullable=False),
+        sa.Column('total_deliveries', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('coop_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('yo_le_debo_al_cliente', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('cliente_me_debe', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('saldo_neto', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('invoice_file', sa.String(64), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('paid_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('client_id', 'period_start', 'period_end', name='uq_client_statements_period'),
+    )
+    op.create_index('ix_client_statements_status_client_id', 'client_statements', ['status', 'client_id'])
+
+    op.create_table(
+        'client_statement_lines',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('statement_id', sa.Integer(), sa.ForeignKey('client_statements.id'), nullable=False),
+        sa.Column('payment_id', sa.Integer(), sa.ForeignKey('payments.id'), nullable=False, unique=True),
+        sa.Column('delivery_id', sa.Integer(), sa.ForeignKey('deliveries.id'), nullable=False),
+        sa.Column('payment_created_at', sa.DateTime(), nullable=True),
+        sa.Column('payment_status', sa.Enum('COURIER', 'OFFICE', 'OFFICE_RECIEVED_TRANSFER',
+                                            'CLIENT_RECIEVED_TRANSFER', 'CLIENT', 'CANCELLED',
+                                            name='Status_of_payment'), nullable=True),
+        sa.Column('settlement_status', sa.Enum('PENDING', 'CLEARED', 'SETTLED', 'TRANSFER_TO_OFFICE',
+                                               'TRANFERRED_TO_CLIENT', 'CANCELLED', name='settlement_status'),
+                  nullable=True),
+        sa.Column('total_amount', sa.Float(), nullable=False),
+        sa.Column('coop_amount', sa.Float(), nullable=False),
+        sa.Column('yo_le_debo_al_cliente', sa.Float(), nullable=False),
+        sa.Column('cliente_me_debe', sa.Float(), nullable=False),
+    )
+    op.create_index('ix_client_statement_lines_statement_id', 'client_statement_lines', ['statement_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_client_statement_lines_statement_id', table_name='client_statement_lines')
+    op.drop_table('client_statement_lines')
+    op.drop_index('ix_client_statements_status_client_id', table_name='client_statements')
+    op.drop_table('client_statements')
@@ -0,0 +1,30 @@
+"""add deliveries keyset indexes
+
+Revision ID: b2d4f6a8c013
+Revises: a1c3e5f7b901
+Create Date: 2026-10-18 10:03:17.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d4f6a8c013'
+down_revision: Union[str, None] = 'a1c3e5f7b901'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_deliveries_state_created_at_id', 'deliveries', ['state', 'created_at', 'id'])
+    op.create_index('ix_deliveries_created_at_id', 'deliveries', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_deliveries_created_at_id', table_name='deliveries')
+    op.drop_index('ix_deliveries_state_created_at_id', table_name='deliveries')
@@ -0,0 +1,32 @@
+"""add payments report indexes
+
+Revision ID: b8d0f2a4c679
+Revises: a7c9e1f3b568
+Create Date: 2026-10-18 17:05:44.902316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d0f2a4c679'
+down_revision: Union[str, None] = 'a7c9e1f3b568'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_payments_delivery_id_created_at', 'payments', ['delivery_id', 'created_at'])
+    op.create_index('ix_payments_created_at_delivery_id', 'payments', ['created_at', 'delivery_id'])
+    op.create_index('ix_payments_settlement_status_created_at', 'payments', ['settlement_status', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payments_settlement_status_created_at', table_name='payments')
+    op.drop_index('ix_payments_created_at_delivery_id', table_name='payments')
+    op.drop_index('ix_payments_delivery_id_created_at', table_name='payments')
@@ -0,0 +1,72 @@
+"""add deliveries delivery_location
+
+Revision ID: c3e5a7b9d124
+Revises: b2d4f6a8c013
+Create Date: 2026-10-18 11:42:05.118374
+
+"""
+import re
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d124'
+down_revision: Union[str, None] = 'b2d4f6a8c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia congelada de DeliveryLocations: valor del sufijo -> nombre guardado en la columna
+LOCATIONS = {
+    'medellín': 'MEDELLIN',
+    'belen': 'BELEN',
+    'la estrella': 'LA_ESTRELLA',
+    'envigado': 'ENVIGADO',
+    'itagui': 'ITAGUI',
+    'caldas': 'CALDAS',
+    'sabaneta': 'SABANETA',
+    'san antonio de prado': 'SAN_ANTONIO',
+    'bello': 'BELLO',
+    'copacabana': 'COPACABANA',
+    'barbosa': 'BARBOSA',
+    'girardota': 'GIRARDOTA',
+    'san cristobal': 'SAN_CRISTOBAL',
+    'machado': 'MACHADO',
+}
+
+BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('deliveries', sa.Column(
+        'delivery_location',
+        sa.Enum(*LOCATIONS.values(), name='delivery_location'),
+        nullable=True
+    ))
+    op.create_index('ix_deliveries_delivery_location', 'deliveries', ['delivery_location'])
+
+    # Backfill: la zona estaba guardada como sufijo "(Zona)" de la dirección
+    bind = op.get_bind()
+    ids_by_location = defaultdict(list)
+    rows = bind.execute(sa.text("SELECT id, delivery_address FROM deliveries"))
+    for delivery_id, delivery_address in rows:
+        match = re.search(r'\(([^)]+)\)\s*$', delivery_address or '')
+        location = LOCATIONS.get(match.group(1).strip().lower()) if match else None
+        if location:
+            ids_by_location[location].append(delivery_id)
+
+    update = sa.text("UPDATE deliveries SET delivery_location = :location WHERE id IN :ids") \
+        .bindparams(sa.bindparam('ids', expanding=True))
+    for location, ids in ids_by_location.items():
+        for start in range(0, len(ids), BATCH_SIZE):
+            bind.execute(update, {"location": location, "ids": ids[start:start + BATCH_SIZE]})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_deliveries_delivery_location', table_name='deliveries')
+    op.drop_column('deliveries', 'delivery_location')
@@ -0,0 +1,90 @@
+"""payment ledger non null keys
+
+Revision ID: c9e1a3b5d780
+Revises: b8d0f2a4c679
+Create Date: 2026-10-18 18:12:30.551907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e1a3b5d780'
+down_revision: Union[str, None] = 'b8d0f2a4c679'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _amount_columns():
+    return [
+        sa.Column('payments_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('rider_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('coop_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # El ledger se puede reconstruir: se crea de nuevo con llaves NOT NULL ('' = NULL)
+    # para que uq_payment_ledger_key también impida llaves duplicadas con NULL
+    op.drop_table('payment_ledger')
+    op.create_table(
+        'payment_ledger',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('settlement_status', sa.String(32), nullable=False, server_default=''),
+        sa.Column('payment_status', sa.String(32), nullable=False, server_default=''),
+        sa.Column('client_settlement_status', sa.String(32), nullable=False, server_default=''),
+        sa.Column('delivery_state', sa.String(32), nullable=False, server_default=''),
+        *_amount_columns(),
+        sa.UniqueConstraint('settlement_status', 'payment_status', 'client_settlement_status', 'delivery_state',
+                            name='uq_payment_ledger_key'),
+    )
+
+    op.execute("""
+        INSERT INTO payment_ledger (settlement_status, payment_status, client_settlement_status, delivery_state,
+                                    payments_count, total_amount, rider_amount, coop_amount)
+        SELECT COALESCE(p.settlement_status, ''), COALESCE(p.payment_status, ''),
+               COALESCE(p.client_settlement_status, ''), COALESCE(d.state, ''),
+               COUNT(p.id), COALESCE(SUM(p.total_amount), 0), COALESCE(SUM(p.rider_amount), 0),
+               COALESCE(SUM(p.coop_amount), 0)
+        FROM payments p JOIN deliveries d ON p.delivery_id = d.id
+        GROUP BY COALESCE(p.settlement_status, ''), COALESCE(p.payment_status, ''),
+                 COALESCE(p.client_settlement_status, ''), COALESCE(d.state, '')
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('payment_ledger')
+    op.create_table(
+        'payment_ledger',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('settlement_status', sa.Enum('PENDING', 'CLEARED', 'SETTLED', 'TRANSFER_TO_OFFICE',
+                                               'TRANFERRED_TO_CLIENT', 'CANCELLED', name='settlement_status'),
+                  nullable=True),
+        sa.Column('payment_status', sa.Enum('COURIER', 'OFFICE', 'OFFICE_RECIEVED_TRANSFER',
+                                            'CLIENT_RECIEVED_TRANSFER', 'CLIENT', 'CANCELLED',
+                                            name='Status_of_payment'), nullable=True),
+        sa.Column('client_settlement_status', sa.Enum('PENDING', 'SETTLED', 'CANCELLED',
+                                                      name='clientsettlementstatus'), nullable=True),
+        sa.Column('delivery_state', sa.Enum('PENDING', 'IN_PROGRESS', 'DELIVERED', 'CANCELED', 'ASSIGNED',
+                                            name='delivery_state'), nullable=True),
+        *_amount_columns(),
+        sa.UniqueConstraint('settlement_status', 'payment_status', 'client_settlement_status', 'delivery_state',
+                            name='uq_payment_ledger_key'),
+    )
+
+    op.execute("""
+        INSERT INTO payment_ledger (settlement_status, payment_status, client_settlement_status, delivery_state,
+                                    payments_count, total_amount, rider_amount, coop_amount)
+        SELECT p.settlement_status, p.payment_status, p.client_settlement_status, d.state,
+               COUNT(p.id), COALESCE(SUM(p.total_amount), 0), COALESCE(SUM(p.rider_amount), 0),
+               COALESCE(SUM(p.coop_amount), 0)
+        FROM payments p JOIN deliveries d ON p.delivery_id = d.id
+        GROUP BY p.settlement_status, p.payment_status, p.client_settlement_status, d.state
+    """)
@@ -0,0 +1,74 @@
+"""payment ledger has delivery
+
+Revision ID: d2f4a6c8e013
+Revises: c9e1a3b5d780
+Create Date: 2026-10-18 21:40:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f4a6c8e013'
+down_revision: Union[str, None] = 'c9e1a3b5d780'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+_KEY_COLUMNS = ('settlement_status', 'payment_status', 'client_settlement_status', 'delivery_state')
+
+
+def _create_ledger(*extra_keys):
+    op.create_table(
+        'payment_ledger',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        *[sa.Column(name, sa.String(32), nullable=False, server_default='') for name in _KEY_COLUMNS],
+        *extra_keys,
+        sa.Column('payments_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('rider_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('coop_amount', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint(*_KEY_COLUMNS, *[column.name for column in extra_keys], name='uq_payment_ledger_key'),
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # El ledger se puede reconstruir: se crea de nuevo con has_delivery en la llave para
+    # que los pagos sin domicilio sumen en totalTransactions/totalAmount
+    op.drop_table('payment_ledger')
+    _create_ledger(sa.Column('has_delivery', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+    op.execute("""
+        INSERT INTO payment_ledger (settlement_status, payment_status, client_settlement_status, delivery_state,
+                                    has_delivery, payments_count, total_amount, rider_amount, coop_amount)
+        SELECT COALESCE(p.settlement_status, ''), COALESCE(p.payment_status, ''),
+               COALESCE(p.client_settlement_status, ''), COALESCE(d.state, ''), d.id IS NOT NULL,
+               COUNT(p.id), COALESCE(SUM(p.total_amount), 0), COALESCE(SUM(p.rider_amount), 0),
+               COALESCE(SUM(p.coop_amount), 0)
+        FROM payments p LEFT JOIN deliveries d ON p.delivery_id = d.id
+        GROUP BY COALESCE(p.settlement_status, ''), COALESCE(p.payment_status, ''),
+                 COALESCE(p.client_settlement_status, ''), COALESCE(d.state, ''), d.id IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('payment_ledger')
+    _create_ledger()
+
+    op.execute("""
+        INSERT INTO payment_ledger (settlement_status, payment_status, client_settlement_status, delivery_state,
+                                    payments_count, total_amount, rider_amount, coop_amount)
+        SELECT COALESCE(p.settlement_status, ''), COALESCE(p.payment_status, ''),
+               COALESCE(p.client_settlement_status, ''), COALESCE(d.state, ''),
+               COUNT(p.id), COALESCE(SUM(p.total_amount), 0), COALESCE(SUM(p.rider_amount), 0),
+               COALESCE(SUM(p.coop_amount), 0)
+        FROM payments p JOIN deliveries d ON p.delivery_id = d.id
+        GROUP BY COALESCE(p.settlement_status, ''), COALESCE(p.payment_status, ''),
+                 COALESCE(p.client_settlement_status, ''), COALESCE(d.state, '')
+    """)
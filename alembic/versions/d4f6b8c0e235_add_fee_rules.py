@@ -0,0 +1,55 @@
+"""add fee rules
+
+Revision ID: d4f6b8c0e235
+Revises: c3e5a7b9d124
+Create Date: 2026-10-18 12:27:44.903516
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f6b8c0e235'
+down_revision: Union[str, None] = 'c3e5a7b9d124'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LOCATIONS = ('MEDELLIN', 'BELEN', 'LA_ESTRELLA', 'ENVIGADO', 'ITAGUI', 'CALDAS', 'SABANETA', 'SAN_ANTONIO',
+             'BELLO', 'COPACABANA', 'BARBOSA', 'GIRARDOTA', 'SAN_CRISTOBAL', 'MACHADO')
+PACKAGE_SIZES = ('SMALL', 'MEDIUM', 'LARGE')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('deliveries', sa.Column(
+        'package_size',
+        sa.Enum(*PACKAGE_SIZES, name='package_size'),
+        nullable=True,
+        server_default='SMALL'
+    ))
+
+    op.create_table(
+        'fee_rules',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('delivery_location', sa.Enum(*LOCATIONS, name='delivery_location'), nullable=True),
+        sa.Column('client_id', sa.Integer(), sa.ForeignKey('clients.id'), nullable=True),
+        sa.Column('package_size', sa.Enum(*PACKAGE_SIZES, name='package_size'), nullable=True),
+        sa.Column('valid_from', sa.DateTime(), nullable=False),
+        sa.Column('valid_to', sa.DateTime(), nullable=True),
+        sa.Column('total_amount', sa.Float(), nullable=False),
+        sa.Column('coop_amount', sa.Float(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_fee_rules_version', 'fee_rules', ['version'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_fee_rules_version', table_name='fee_rules')
+    op.drop_table('fee_rules')
+    op.drop_column('deliveries', 'package_size')
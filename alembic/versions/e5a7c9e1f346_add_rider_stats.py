@@ -0,0 +1,42 @@
+"""add rider stats
+
+Revision ID: e5a7c9e1f346
+Revises: d4f6b8c0e235
+Create Date: 2026-10-18 13:14:52.377105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c9e1f346'
+down_revision: Union[str, None] = 'd4f6b8c0e235'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_deliveries_rider_id_created_at_id', 'deliveries', ['rider_id', 'created_at', 'id'])
+
+    # Se llena con `python -m utils.rider_stats rebuild` o al arrancar con RIDER_STATS_COUNTERS=true
+    op.create_table(
+        'rider_stats',
+        sa.Column('rider_id', sa.Integer(), sa.ForeignKey('riders.id'), primary_key=True),
+        sa.Column('total_deliveries', sa.Integer(), nullable=False),
+        sa.Column('pending_deliveries', sa.Integer(), nullable=False),
+        sa.Column('in_progress_deliveries', sa.Integer(), nullable=False),
+        sa.Column('completed_deliveries', sa.Integer(), nullable=False),
+        sa.Column('total_earnings', sa.Float(), nullable=False),
+        sa.Column('pending_payments', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rider_stats')
+    op.drop_index('ix_deliveries_rider_id_created_at_id', table_name='deliveries')
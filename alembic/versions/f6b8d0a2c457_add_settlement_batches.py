@@ -0,0 +1,50 @@
+"""add settlement batches
+
+Revision ID: f6b8d0a2c457
+Revises: e5a7c9e1f346
+Create Date: 2026-10-18 14:02:39.650218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b8d0a2c457'
+down_revision: Union[str, None] = 'e5a7c9e1f346'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'settlement_batches',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('kind', sa.Enum('RIDER_SETTLEMENT', 'CLIENT_RECEIPT', name='settlement_batch_kind'), nullable=False),
+        sa.Column('rider_id', sa.Integer(), sa.ForeignKey('riders.id'), nullable=True),
+        sa.Column('client_id', sa.Integer(), sa.ForeignKey('clients.id'), nullable=True),
+        sa.Column('idempotency_key', sa.String(255), nullable=True, unique=True),
+        sa.Column('payment_ids', sa.Text(), nullable=False),
+        sa.Column('payments_count', sa.Integer(), nullable=False),
+        sa.Column('total_amount', sa.Float(), nullable=False),
+        sa.Column('rider_amount', sa.Float(), nullable=False),
+        sa.Column('coop_amount', sa.Float(), nullable=False),
+        sa.Column('actor', sa.String(255), nullable=True),
+        sa.Column('comments', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_settlement_batches_rider_id', 'settlement_batches', ['rider_id'])
+    op.create_index('ix_settlement_batches_client_id', 'settlement_batches', ['client_id'])
+    op.create_index('ix_settlement_batches_kind_created_at', 'settlement_batches', ['kind', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_settlement_batches_kind_created_at', table_name='settlement_batches')
+    op.drop_index('ix_settlement_batches_client_id', table_name='settlement_batches')
+    op.drop_index('ix_settlement_batches_rider_id', table_name='settlement_batches')
+    op.drop_table('settlement_batches')
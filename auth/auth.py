@@ -1,3 +1,9 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
@@ -5,15 +11,33 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from starlette import status
 
+from db.db import get_db
+from models.models import User
 from schemas.schemas import TokenData
 
 SECRET_KEY = "secret"  # Cambia esto por una clave segura
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Caché de tokens ya verificados: evita decodificar el JWT y consultar el usuario en cada llamada
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Costo de bcrypt: min y max iguales al default hacen que needs_update marque
+# cualquier hash con otro costo, y el login lo re-hashea de forma transparente
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=BCRYPT_ROUNDS,
+                           bcrypt__min_rounds=BCRYPT_ROUNDS,
+                           bcrypt__max_rounds=BCRYPT_ROUNDS)
+
+# Pool acotado para bcrypt: el event loop no se bloquea y el CPU dedicado a hashes tiene techo
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 
 def hash_password(password: str):
@@ -23,6 +47,21 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def hash_password_async(password: str):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, hash_password, password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    """Devuelve (válido, nuevo_hash); nuevo_hash no es None si el hash usa otro costo."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(hours=8))
@@ -30,8 +69,68 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def auth_user(token: str = Depends(oauth2_scheme)):
-    """Dependencia que valida el JWT y extrae la información del usuario."""
+class TokenCache:
+    """LRU acotado de token -> TokenData que nunca sobrevive al ``exp`` del token."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+
+            principal, expires_at = entry
+            if expires_at <= time.time():
+                self._discard(token)
+                return None
+
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token, principal, token_exp):
+        with self._lock:
+            expires_at = min(token_exp, time.time() + self.ttl_seconds)
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            self._tokens_by_user.setdefault(principal.username, set()).add(token)
+
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, token):
+        principal, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(principal.username)
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[principal.username]
+
+    def invalidate_user(self, username):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(username, ())):
+                self._discard(token)
+
+
+token_cache = TokenCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(username: str):
+    """Hook para cuando un usuario se desactiva o cambia su rol o su username."""
+    token_cache.invalidate_user(username)
+
+
+def auth_user(token: str = Depends(oauth2_scheme), db = Depends(get_db)):
+    """Dependencia que valida el JWT y extrae la información del usuario (id y rol incluidos)."""
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -41,10 +140,28 @@ def auth_user(token: str = Depends(oauth2_scheme)):
                 detail="Token inválido",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return TokenData(username=username)
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido o expirado",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+    user = db.query(User.id, User.role, User.is_active).filter(User.username == username).first()
+    if not user or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario inactivo o inexistente",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    principal = TokenData(username=username, id=user.id, role=user.role)
+    token_cache.put(token, principal, payload.get("exp", time.time()))
+    return principal
+
+
+def optional_auth_user(token: str | None = Depends(optional_oauth2_scheme), db = Depends(get_db)):
+    """Como auth_user, pero devuelve None si la petición no trae token."""
+    if token is None:
+        return None
+    return auth_user(token, db)
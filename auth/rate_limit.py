@@ -0,0 +1,139 @@
+"""Limitador de intentos de login con token buckets por username y por IP.
+
+Cada intento consume una ficha del bucket del username y otra del de la IP; si
+alguno está vacío el intento se rechaza antes de verificar el password con bcrypt.
+El store es en memoria por defecto; con LOGIN_RATE_LIMIT_STORE=sqlite los buckets
+se comparten entre workers en un archivo SQLite.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+LOGIN_RATE_LIMIT_STORE = os.getenv("LOGIN_RATE_LIMIT_STORE", "memory")
+LOGIN_RATE_LIMIT_DB = os.getenv("LOGIN_RATE_LIMIT_DB", "./login_buckets.db")
+
+# Capacidad del bucket y fichas que recupera por minuto
+LOGIN_USER_CAPACITY = int(os.getenv("LOGIN_USER_CAPACITY", "5"))
+LOGIN_USER_PER_MINUTE = float(os.getenv("LOGIN_USER_PER_MINUTE", "5"))
+LOGIN_IP_CAPACITY = int(os.getenv("LOGIN_IP_CAPACITY", "20"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "20"))
+
+
+def _consume(tokens, updated_at, capacity, rate, now):
+    """Recarga el bucket según el tiempo transcurrido y trata de sacar una ficha.
+
+    Devuelve (fichas restantes, permitido, segundos hasta la próxima ficha).
+    """
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, True, 0.0
+    return tokens, False, (1 - tokens) / rate
+
+
+class InMemoryBucketStore:
+    """Buckets del proceso actual, acotados en número de llaves."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, allowed, retry_after = _consume(tokens, updated_at, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+
+class SQLiteBucketStore:
+    """Buckets compartidos entre workers; BEGIN IMMEDIATE serializa cada lectura-escritura."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS login_buckets "
+                         "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+            # Los buckets sin uso en un día ya estarían llenos
+            conn.execute("DELETE FROM login_buckets WHERE updated_at < ?", (time.time() - 86400,))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated_at FROM login_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, allowed, retry_after = _consume(tokens, updated_at, capacity, rate, now)
+            conn.execute("INSERT INTO login_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                         (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return allowed, retry_after
+
+
+class LoginRateLimiter:
+
+    def __init__(self, store, user_capacity, user_per_minute, ip_capacity, ip_per_minute):
+        self.store = store
+        self.user_capacity = user_capacity
+        self.user_rate = user_per_minute / 60
+        self.ip_capacity = ip_capacity
+        self.ip_rate = ip_per_minute / 60
+        self._counters = {"allowed": 0, "rejected_ip": 0, "rejected_username": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def check(self, username, client_ip):
+        """Devuelve (permitido, segundos a esperar) para un intento de login."""
+        allowed, retry_after = self.store.take(f"ip:{client_ip}", self.ip_capacity, self.ip_rate)
+        if not allowed:
+            self._count("rejected_ip")
+            return False, retry_after
+
+        allowed, retry_after = self.store.take(f"user:{username}", self.user_capacity, self.user_rate)
+        if not allowed:
+            self._count("rejected_username")
+            return False, retry_after
+
+        self._count("allowed")
+        return True, 0.0
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters["rejected"] = counters["rejected_ip"] + counters["rejected_username"]
+        counters["store"] = type(self.store).__name__
+        return counters
+
+
+def _build_store():
+    if LOGIN_RATE_LIMIT_STORE == "sqlite":
+        return SQLiteBucketStore(LOGIN_RATE_LIMIT_DB)
+    return InMemoryBucketStore()
+
+
+login_limiter = LoginRateLimiter(_build_store(), LOGIN_USER_CAPACITY, LOGIN_USER_PER_MINUTE,
+                                 LOGIN_IP_CAPACITY, LOGIN_IP_PER_MINUTE)
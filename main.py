@@ -1,19 +1,36 @@
 from fastapi import FastAPI
-from db.db import Base, engine
+from db.db import Base, engine, SessionLocal
 from routes.auth import auth_route
 from routes.users import user_route
 from routes.client_route import client_route
 from routes.delivery_route import dely_route
 from routes.riders_route import rider_route
 from routes.payment_route import payment_route
+from routes.fee_route import fee_route
+from routes.statement_route import statement_route
 from fastapi.middleware.cors import CORSMiddleware
+from utils import ledger, rider_stats, client_statements
+from utils.fees import fee_table
 
 app = FastAPI()
 
 Base.metadata.create_all(bind=engine)
+
+# El ledger del dashboard se construye una sola vez si la base ya tenía pagos
+with SessionLocal() as session:
+    ledger.ensure_built(session)
+    rider_stats.ensure_built(session)
+    # Las reglas de tarifa se compilan en memoria; el hilo recarga si otro worker las cambia
+    fee_table.load(session)
+
+fee_table.start_watcher(SessionLocal)
+# Cierre automático de estados de cuenta de clientes (CLIENT_STATEMENT_PERIOD=weekly|monthly)
+client_statements.start_scheduler(SessionLocal)
+
 routers = [user_route, rider_route,
            dely_route, client_route,
-           auth_route, payment_route]
+           auth_route, payment_route,
+           fee_route, statement_route]
 
 
 
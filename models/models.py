@@ -1,11 +1,13 @@
 
 from db.db import Base
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Enum, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Enum, Boolean, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 import datetime
 
 from schemas.schemas import (DeliveryStanding, UserRole, PaymentType,
-                             PaymentStatus, SettlementStatus, AccountType, ClientSettlementStatus)
+                             PaymentStatus, SettlementStatus, AccountType, ClientSettlementStatus,
+                             DeliveryLocations, PackageSize, SettlementBatchKind, ClientStatementStatus)
 
 
 class User(Base):
@@ -48,6 +50,8 @@ class Delivery(Base):
     receptor_number = Column(Integer, nullable = False)
 
     delivery_address = Column(String, nullable=False)
+    delivery_location = Column(Enum(DeliveryLocations, name="delivery_location"), nullable=True, index=True)
+    package_size = Column(Enum(PackageSize, name="package_size"), default=PackageSize.SMALL, nullable=True)
     state = Column(Enum(DeliveryStanding, name="delivery_state"), default=DeliveryStanding.PENDING )
 
     delivery_total_amount = Column(Float, nullable= False, default=0.0)
@@ -61,6 +65,14 @@ class Delivery(Base):
     rider = relationship("Rider", back_populates="deliveries")
     payments = relationship("Payment", back_populates="delivery")
 
+    # Soportan la paginación por cursor (created_at, id), con y sin filtro de estado
+    __table_args__ = (
+        Index("ix_deliveries_state_created_at_id", "state", "created_at", "id"),
+        Index("ix_deliveries_created_at_id", "created_at", "id"),
+        # Domicilios recientes de un rider
+        Index("ix_deliveries_rider_id_created_at_id", "rider_id", "created_at", "id"),
+    )
+
 
 # Modelo de Domiciliario (quien entrega el paquete)
 class Rider(Base):
@@ -97,4 +109,158 @@ class Payment(Base):
 
     delivery = relationship("Delivery", back_populates="payments")
 
+    # Filtros por rango de fechas de /payments/riders-payments y demás reportes de pagos
+    __table_args__ = (
+        Index("ix_payments_delivery_id_created_at", "delivery_id", "created_at"),
+        Index("ix_payments_created_at_delivery_id", "created_at", "delivery_id"),
+        Index("ix_payments_settlement_status_created_at", "settlement_status", "created_at"),
+    )
+
+
+
+# Llave del ledger: el nombre del enum, o LEDGER_NULL_KEY cuando el valor es NULL.
+# Así la restricción única también cubre las llaves con NULL (SQLite y MySQL no las comparan)
+LEDGER_NULL_KEY = ""
+
+
+class LedgerKey(TypeDecorator):
+    impl = String(32)
+    cache_ok = True
+
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return LEDGER_NULL_KEY
+        return value.name if isinstance(value, self.enum_class) else value
+
+    def process_result_value(self, value, dialect):
+        if value is None or value == LEDGER_NULL_KEY:
+            return None
+        return self.enum_class[value]
+
+# Agregados materializados de pagos por combinación de estados (ver utils/ledger.py)
+class PaymentLedger(Base):
+    __tablename__ = 'payment_ledger'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    settlement_status = Column(LedgerKey(SettlementStatus), nullable=False, default=LEDGER_NULL_KEY)
+    payment_status = Column(LedgerKey(PaymentStatus), nullable=False, default=LEDGER_NULL_KEY)
+    client_settlement_status = Column(LedgerKey(ClientSettlementStatus), nullable=False, default=LEDGER_NULL_KEY)
+    delivery_state = Column(LedgerKey(DeliveryStanding), nullable=False, default=LEDGER_NULL_KEY)
+    # False para pagos sin domicilio: solo cuentan en totalTransactions/totalAmount
+    has_delivery = Column(Boolean, nullable=False, default=True)
+
+    payments_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    rider_amount = Column(Float, nullable=False, default=0.0)
+    coop_amount = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("settlement_status", "payment_status", "client_settlement_status", "delivery_state",
+                         "has_delivery", name="uq_payment_ledger_key"),
+    )
+
+
+# Contadores por rider para /rider/{rider_id} (ver utils/rider_stats.py)
+class RiderStats(Base):
+    __tablename__ = 'rider_stats'
 
+    rider_id = Column(Integer, ForeignKey('riders.id'), primary_key=True)
+    total_deliveries = Column(Integer, nullable=False, default=0)
+    pending_deliveries = Column(Integer, nullable=False, default=0)
+    in_progress_deliveries = Column(Integer, nullable=False, default=0)
+    completed_deliveries = Column(Integer, nullable=False, default=0)
+    total_earnings = Column(Float, nullable=False, default=0.0)
+    pending_payments = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+# Diario de lotes de liquidación a riders y de pagos recibidos de clientes
+class SettlementBatch(Base):
+    __tablename__ = 'settlement_batches'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(Enum(SettlementBatchKind, name="settlement_batch_kind"), nullable=False)
+    rider_id = Column(Integer, ForeignKey('riders.id'), nullable=True, index=True)
+    client_id = Column(Integer, ForeignKey('clients.id'), nullable=True, index=True)
+    idempotency_key = Column(String(255), nullable=True, unique=True)
+    payment_ids = Column(Text, nullable=False)  # lista JSON
+    payments_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    rider_amount = Column(Float, nullable=False, default=0.0)
+    coop_amount = Column(Float, nullable=False, default=0.0)
+    actor = Column(String(255), nullable=True)
+    comments = Column(Text, nullable=True)
+    result = Column(Text, nullable=False)  # respuesta JSON devuelta en los reintentos
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_settlement_batches_kind_created_at", "kind", "created_at"),
+    )
+
+
+# Estados de cuenta de clientes por periodo cerrado (ver utils/client_statements.py)
+class ClientStatement(Base):
+    __tablename__ = 'client_statements'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    client_id = Column(Integer, ForeignKey('clients.id'), nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    period_end = Column(DateTime, nullable=False)
+    status = Column(Enum(ClientStatementStatus, name="client_statement_status"),
+                    default=ClientStatementStatus.ISSUED, nullable=False)
+    total_deliveries = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    coop_amount = Column(Float, nullable=False, default=0.0)
+    yo_le_debo_al_cliente = Column(Float, nullable=False, default=0.0)
+    cliente_me_debe = Column(Float, nullable=False, default=0.0)
+    saldo_neto = Column(Float, nullable=False, default=0.0)
+    invoice_file = Column(String(64), nullable=True)  # hash del PDF en el caché de extractos
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    paid_at = Column(DateTime, nullable=True)
+
+    lines = relationship("ClientStatementLine", back_populates="statement")
+
+    __table_args__ = (
+        UniqueConstraint("client_id", "period_start", "period_end", name="uq_client_statements_period"),
+        Index("ix_client_statements_status_client_id", "status", "client_id"),
+    )
+
+
+class ClientStatementLine(Base):
+    __tablename__ = 'client_statement_lines'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    statement_id = Column(Integer, ForeignKey('client_statements.id'), nullable=False, index=True)
+    payment_id = Column(Integer, ForeignKey('payments.id'), nullable=False, unique=True)
+    delivery_id = Column(Integer, ForeignKey('deliveries.id'), nullable=False)
+    payment_created_at = Column(DateTime, nullable=True)
+    payment_status = Column(Enum(PaymentStatus, name="Status_of_payment"), nullable=True)
+    settlement_status = Column(Enum(SettlementStatus, name="settlement_status"), nullable=True)
+    total_amount = Column(Float, nullable=False)
+    coop_amount = Column(Float, nullable=False)  # rider_amount + coop_amount, como en /clients-payments
+    yo_le_debo_al_cliente = Column(Float, nullable=False)
+    cliente_me_debe = Column(Float, nullable=False)
+
+    statement = relationship("ClientStatement", back_populates="lines")
+
+
+# Reglas de tarifa versionadas (ver utils/fees.py); None en zona, cliente o tamaño aplica a todos
+class FeeRule(Base):
+    __tablename__ = 'fee_rules'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    version = Column(Integer, nullable=False, index=True)
+    delivery_location = Column(Enum(DeliveryLocations, name="delivery_location"), nullable=True)
+    client_id = Column(Integer, ForeignKey('clients.id'), nullable=True)
+    package_size = Column(Enum(PackageSize, name="package_size"), nullable=True)
+    valid_from = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    valid_to = Column(DateTime, nullable=True)
+    total_amount = Column(Float, nullable=False)
+    coop_amount = Column(Float, nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
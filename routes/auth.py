@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import math
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
 
-from auth.auth import hash_password, verify_password, create_access_token, auth_user
-from db.db import get_db, db_dependency
+from auth.auth import hash_password, verify_password, create_access_token, auth_user, \
+    verify_and_update_password_async
+from auth.rate_limit import login_limiter
+from db.db import db_dependency, async_db_dependency
 from models.models import User
 from schemas.schemas import UserCreate, UserResponse, UserToUpdate, UserUpdated, UserRole
 from fastapi.security import OAuth2PasswordRequestForm
@@ -13,10 +17,35 @@ auth_route = APIRouter(tags=["Auth"])
 
 
 @auth_route.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username.lower()).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db=async_db_dependency):
+    # Se rechaza por username o IP antes de gastar CPU en bcrypt
+    client_ip = request.client.host if request.client else "unknown"
+    # El store SQLite espera el lock del archivo (hasta 5 s): en el threadpool, no en el loop
+    allowed, retry_after = await run_in_threadpool(login_limiter.check, form_data.username.lower(), client_ip)
+    if not allowed:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Demasiados intentos de login, intente más tarde",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+    # Sesión async: ni la consulta del usuario ni el commit bloquean el event loop
+    user = await db.scalar(select(User).where(User.username == form_data.username.lower()))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales incorrectas")
+
+    # bcrypt corre en el pool de hashing, fuera del event loop
+    valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales incorrectas")
 
+    # Si cambió BCRYPT_ROUNDS el hash se actualiza con el costo nuevo
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@auth_route.get("/token/metrics")
+async def login_rate_limit_metrics():
+    return login_limiter.metrics()
@@ -66,9 +66,8 @@ async def get_user_by_name(name: str, db = db_dependency):
 
 @client_route.put("/update")
 async def update_client(client: ClientUpdate, client_id: int, db = db_dependency, identity = Depends(auth_user)):
-    user_identity: User = db.query(User).filter(User.username == identity.username).first()
-
-    if not user_identity.role == UserRole.ADMIN:
+    # El rol viene del principal cacheado por auth_user, sin consultar User
+    if not identity.role == UserRole.ADMIN:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="UNAUTHORIZE YOU MUST BE ADMIN")
 
@@ -101,8 +100,7 @@ async def update_client(client: ClientUpdate, client_id: int, db = db_dependency
 @client_route.delete("/delete")
 async def delete_client( client_id, db = db_dependency, identity = Depends(auth_user) ):
 
-    user_identity = db.query(User).filter(User.username == identity.username).first()
-    if not user_identity:
+    if not identity.id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="you must be ADMIN")
 
 
@@ -1,22 +1,35 @@
+import asyncio
+import base64
+import csv
+import io
+import json
 import math
-from typing import Optional
-
-from fastapi import APIRouter, HTTPException, status, Query, Response
-from sqlalchemy import desc
-
-from db.db import db_dependency
+import time
+from collections import defaultdict
+from enum import Enum
+from typing import Optional, List
+
+from fastapi import APIRouter, HTTPException, status, Query, Response, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import desc, or_, and_, select, func, insert, update
+
+from db.db import db_dependency, async_db_dependency, SessionLocal
 from models.models import Delivery, Rider, Payment, Client
 from schemas.schemas import CreatePackage, PackageResponse, DeliveryStanding, DeliveryUpdate, DeliveryUpdateRespose, \
-    PaymentCreate, PaymentType, PaymentStatus, SettlementStatus, Etiqueta
-from sqlalchemy.orm import joinedload
+    PaymentCreate, PaymentType, PaymentStatus, SettlementStatus, Etiqueta, LabelBatch, BulkPackage, \
+    BulkRiderAssignment
+from sqlalchemy.orm import joinedload, selectinload
 import datetime
-from utils.mapping import get_delivery_fee
+from utils import ledger, rider_stats
+from utils.dispatch import plan_assignments
+from utils.fees import fee_table
+from utils.zones import location_from_address, order_zones, route_legs
 
 from datetime import datetime, timedelta
 
-from reportlab.lib.pagesizes import A6, letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from utils.labels import label_from_delivery, render_label, render_labels, get_executor, label_hash, label_cache
 
 dely_route = APIRouter(prefix="/deliveries", tags=["Deliveries"])
 
@@ -24,65 +37,20 @@ dely_route = APIRouter(prefix="/deliveries", tags=["Deliveries"])
 
 
 
-@dely_route.get("/")
-async def get_all_deliveries(
-        page: int = 1,
-        size: int = 20,
-        state: DeliveryStanding = None,
-        db=db_dependency
-):
-    query = db.query(Delivery).options(
-        joinedload(Delivery.rider),
-        joinedload(Delivery.client),
-        joinedload(Delivery.payments)
-    )
-
-    if state:
-        query = query.filter(Delivery.state == state)
-
-    # Ordenar por fecha de creación descendente
-    query = query.order_by(desc(Delivery.created_at))
-
-    # Contar total antes de paginar
-    total = query.count()
-
-    # Aplicar paginación
-    query = query.offset((page - 1) * size).limit(size)
-
-    deliveries = query.all()
-
-
-
-    return {
-        "items": deliveries,
-        "total": total,
-        "page": page,
-        "size": size,
-        "pages": math.ceil(total / size)
-    }
+def _encode_cursor(delivery):
+    raw = f"{delivery.created_at.isoformat()}|{delivery.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
 
-@dely_route.get("/filtered")
-async def get_filtered_deliveries(
-        time_period: str = Query(..., description="Periodo de tiempo: 'today', 'week', 'month', 'custom'"),
-        start_date: Optional[datetime] = Query(None, description="Fecha de inicio para filtro personalizado"),
-        end_date: Optional[datetime] = Query(None, description="Fecha de fin para filtro personalizado"),
-        page: int = 1,
-        size: int = 20,
-        state: DeliveryStanding = None,
-        db=db_dependency
-):
-    # Iniciamos la query con los joins necesarios
-    query = db.query(Delivery).options(
-        joinedload(Delivery.rider),
-        joinedload(Delivery.client),
-        joinedload(Delivery.payments)
-    )
+def _decode_cursor(cursor: str):
+    try:
+        created_at, delivery_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(delivery_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
 
-    # Aplicamos filtro de estado si existe
-    if state:
-        query = query.filter(Delivery.state == state)
 
+def _filter_by_period(query, time_period, start_date=None, end_date=None):
     # Obtenemos la fecha y hora actual
     current_datetime = datetime.now()
 
@@ -112,86 +80,250 @@ async def get_filtered_deliveries(
             end_of_day = datetime(end_date.year, end_date.month, end_date.day, 23, 59, 59)
             query = query.filter(Delivery.created_at <= end_of_day)
 
-    # Ordenar por fecha de creación descendente
-    query = query.order_by(desc(Delivery.created_at))
+    return query
+
 
-    # Contar total de resultados con los filtros aplicados
-    total = query.count()
+def _page_statement(query, page, size, cursor):
+    """Aplica orden, cursor (created_at, id) u offset y límite a un Query o a un select()."""
+    # Ordenar por fecha de creación descendente, el id desempata
+    query = query.options(
+        joinedload(Delivery.rider),
+        joinedload(Delivery.client),
+        selectinload(Delivery.payments)
+    ).order_by(desc(Delivery.created_at), desc(Delivery.id))
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            Delivery.created_at < cursor_created_at,
+            and_(Delivery.created_at == cursor_created_at, Delivery.id < cursor_id)
+        ))
+    else:
+        query = query.offset((page - 1) * size)
 
-    # Aplicar paginación
-    query = query.offset((page - 1) * size).limit(size)
+    return query.limit(size)
 
-    deliveries = query.all()
 
+def _page_response(deliveries, total, page, size):
     return {
         "items": deliveries,
         "total": total,
         "page": page,
         "size": size,
-        "pages": math.ceil(total / size),
-        "filter": {
-            "time_period": time_period,
-            "start_date": start_date,
-            "end_date": end_date
-        }
+        "pages": math.ceil(total / size) if total is not None else None,
+        "next_cursor": _encode_cursor(deliveries[-1]) if len(deliveries) == size else None
     }
 
 
+def _paginate_deliveries(query, page, size, cursor, include_total):
+    """Pagina por cursor (created_at, id) si se envía cursor, si no por número de página."""
+    # El conteo se hace sobre la consulta filtrada sin joins ni orden
+    total = query.count() if include_total else None
+    deliveries = _page_statement(query, page, size, cursor).all()
 
+    return _page_response(deliveries, total, page, size)
 
-@dely_route.post("/new_delivery", response_model=PackageResponse)
-def new_delivery( package: CreatePackage, client, rider = 0,
-                  total_amount = 10000, coop_amount = 2000, db = db_dependency):
 
-    if rider == "null":
-        rider = None
+@dely_route.get("/")
+async def get_all_deliveries(
+        page: int = 1,
+        size: int = 20,
+        state: DeliveryStanding = None,
+        cursor: Optional[str] = Query(None, description="Cursor opaco devuelto como next_cursor"),
+        include_total: bool = Query(True, description="Calcular el total de resultados"),
+        db=async_db_dependency
+):
+    # Sesión async: las consultas no bloquean el event loop
+    statement = select(Delivery)
+
+    if state:
+        statement = statement.filter(Delivery.state == state)
+
+    total = await db.scalar(select(func.count()).select_from(statement.subquery())) if include_total else None
+    deliveries = (await db.scalars(_page_statement(statement, page, size, cursor))).unique().all()
+
+    return _page_response(deliveries, total, page, size)
+
+
+@dely_route.get("/filtered")
+async def get_filtered_deliveries(
+        time_period: str = Query(..., description="Periodo de tiempo: 'today', 'week', 'month', 'custom'"),
+        start_date: Optional[datetime] = Query(None, description="Fecha de inicio para filtro personalizado"),
+        end_date: Optional[datetime] = Query(None, description="Fecha de fin para filtro personalizado"),
+        page: int = 1,
+        size: int = 20,
+        state: DeliveryStanding = None,
+        cursor: Optional[str] = Query(None, description="Cursor opaco devuelto como next_cursor"),
+        include_total: bool = Query(True, description="Calcular el total de resultados"),
+        db=db_dependency
+):
+    query = db.query(Delivery)
+
+    # Aplicamos filtro de estado si existe
+    if state:
+        query = query.filter(Delivery.state == state)
+
+    query = _filter_by_period(query, time_period, start_date, end_date)
+
+    result = _paginate_deliveries(query, page, size, cursor, include_total)
+    result["filter"] = {
+        "time_period": time_period,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+    return result
+
+
+
+
+# Columnas planas de la exportación: una fila por pago, con los datos del domicilio
+EXPORT_COLUMNS = [
+    Delivery.id.label("delivery_id"),
+    Delivery.created_at.label("delivery_created_at"),
+    Delivery.delivery_date.label("delivery_date"),
+    Delivery.state.label("delivery_state"),
+    Delivery.package_name.label("package_name"),
+    Delivery.receptor_name.label("receptor_name"),
+    Delivery.delivery_address.label("delivery_address"),
+    Delivery.delivery_total_amount.label("delivery_total_amount"),
+    Client.id.label("client_id"),
+    Client.client_name.label("client_name"),
+    Rider.id.label("rider_id"),
+    Rider.name.label("rider_name"),
+    Payment.id.label("payment_id"),
+    Payment.payment_type.label("payment_type"),
+    Payment.payment_status.label("payment_status"),
+    Payment.settlement_status.label("settlement_status"),
+    Payment.client_settlement_status.label("client_settlement_status"),
+    Payment.total_amount.label("total_amount"),
+    Payment.rider_amount.label("rider_amount"),
+    Payment.coop_amount.label("coop_amount"),
+    Payment.payment_reference.label("payment_reference"),
+    Payment.created_at.label("payment_created_at"),
+]
+
+
+def _csv_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _stream_export(statement, export_format, batch_size=1000):
+    """Itera la consulta con un cursor del lado del servidor y emite un bloque por lote."""
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        header = list(result.keys())
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(header)
+            yield buffer.getvalue()
+
+        for partition in result.partitions():
+            buffer = io.StringIO()
+            if export_format == "csv":
+                writer = csv.writer(buffer)
+                writer.writerows([_csv_value(value) for value in row] for row in partition)
+            else:
+                for row in partition:
+                    buffer.write(json.dumps(jsonable_encoder(row._asdict())) + "\n")
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+@dely_route.get("/export")
+async def export_deliveries(
+        export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        time_period: str = Query("custom", description="Periodo de tiempo: 'today', 'week', 'month', 'custom'"),
+        start_date: Optional[datetime] = Query(None, description="Fecha de inicio para filtro personalizado"),
+        end_date: Optional[datetime] = Query(None, description="Fecha de fin para filtro personalizado"),
+        state: DeliveryStanding = None
+):
+    # Mismos filtros que /filtered, pero sin conteo ni paginación: las filas se envían
+    # a medida que se leen, con memoria constante sin importar cuántas sean
+    statement = select(*EXPORT_COLUMNS).select_from(Delivery) \
+        .join(Client, Delivery.client_id == Client.id) \
+        .outerjoin(Rider, Delivery.rider_id == Rider.id) \
+        .outerjoin(Payment, Payment.delivery_id == Delivery.id)
+
+    if state:
+        statement = statement.filter(Delivery.state == state)
+
+    statement = _filter_by_period(statement, time_period, start_date, end_date) \
+        .order_by(Delivery.created_at, Delivery.id, Payment.id)
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"deliveries_{datetime.now():%Y%m%d_%H%M%S}.{export_format}"
 
-    new_package = {
-        "client_id": client,
-        "rider_id": rider,
+    return StreamingResponse(_stream_export(statement, export_format), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def _delivery_values(package: CreatePackage, client_id, rider_id):
+    return {
+        "client_id": client_id,
+        "rider_id": rider_id,
         "package_name": package.package_name,
         "receptor_name": package.receptor_name,
         "receptor_number": package.receptor_number,
         "delivery_total_amount": package.delivery_total_amount,
         "delivery_address": f"{package.delivery_address} ({package.delivery_location.value})",
+        "delivery_location": package.delivery_location,
+        "package_size": package.package_size,
         "delivery_comment": package.delivery_comment,
         "state": package.state,
         "created_at": package.created_at,
         "delivery_date": package.delivery_date
     }
 
-    package_to_save = Delivery(** new_package)
 
+def _package_fee(package: CreatePackage, client_id, total_amount=None, coop_amount=None):
+    """total_amount y coop_amount explícitos o, si faltan, los de la regla de tarifa vigente."""
+    if total_amount is None or coop_amount is None:
+        fee = fee_table.quote(package.delivery_location, int(client_id), package.package_size, package.created_at)
+        total_amount = fee.total_amount if total_amount is None else total_amount
+        coop_amount = fee.coop_amount if coop_amount is None else coop_amount
+    return total_amount, coop_amount
 
-    db.add(package_to_save)
-    db.flush()
-
-    monto_domicilio = package.monto_domicilio
 
+def _payment_values(delivery_id, monto_domicilio, total_amount, coop_amount):
     total_amount = float(total_amount)
     coop_amount = float(coop_amount)
-    rider_amount = monto_domicilio - coop_amount
 
-    client_amount = total_amount - monto_domicilio
-
-    print("tipo del rider_amount", rider_amount, type(rider_amount))
-    print("tipo del coop amount", coop_amount, type(coop_amount))
-    print("tota del coop amount", coop_amount, type(coop_amount))
-
-    payment_data = {
-        "delivery_id": package_to_save.id,
+    return {
+        "delivery_id": delivery_id,
         "total_amount": total_amount,
-        "rider_amount": rider_amount,
+        "rider_amount": monto_domicilio - coop_amount,
         "coop_amount": coop_amount,
         "payment_type": PaymentType.PENDING,
         "payment_status": PaymentStatus.COURIER,
         "settlement_status": SettlementStatus.PENDING,
         "payment_reference": None,
         "created_at": datetime.utcnow()
-
     }
 
-    new_payment: PaymentCreate = Payment(**payment_data)
+
+@dely_route.post("/new_delivery", response_model=PackageResponse)
+def new_delivery( package: CreatePackage, client, rider = 0,
+                  total_amount: Optional[float] = None, coop_amount: Optional[float] = None, db = db_dependency):
+
+    if rider == "null":
+        rider = None
+
+    total_amount, coop_amount = _package_fee(package, client, total_amount, coop_amount)
+
+    package_to_save = Delivery(**_delivery_values(package, client, rider))
+
+
+    db.add(package_to_save)
+    db.flush()
+
+    new_payment = Payment(**_payment_values(package_to_save.id, package.monto_domicilio, total_amount, coop_amount))
 
     db.add(new_payment)
 
@@ -203,68 +335,218 @@ def new_delivery( package: CreatePackage, client, rider = 0,
     return package_to_save
 
 
+BULK_MAX_ROWS = 2000
+
+
+def _bulk_create(rows: List[dict], atomic: bool, db):
+    """Valida las filas y guarda las válidas con un INSERT multi-fila por tabla en una transacción."""
+    started = time.perf_counter()
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Máximo {BULK_MAX_ROWS} paquetes por carga")
+
+    results = [{"row": index} for index in range(len(rows))]
+    packages = {}
+    for index, row in enumerate(rows):
+        try:
+            packages[index] = BulkPackage.model_validate(row)
+        except ValidationError as error:
+            results[index].update(status="error", errors=[
+                f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+            ])
+
+    # Clientes y riders referenciados, verificados con una consulta por tabla
+    client_ids = {package.client_id for package in packages.values()}
+    rider_ids = {package.rider_id for package in packages.values() if package.rider_id}
+    known_clients = {row.id for row in db.query(Client.id).filter(Client.id.in_(client_ids))} if client_ids else set()
+    known_riders = {row.id for row in db.query(Rider.id).filter(Rider.id.in_(rider_ids))} if rider_ids else set()
+
+    for index, package in list(packages.items()):
+        errors = []
+        if package.client_id not in known_clients:
+            errors.append(f"client_id: client {package.client_id} not found")
+        if package.rider_id and package.rider_id not in known_riders:
+            errors.append(f"rider_id: rider {package.rider_id} not found")
+        if errors:
+            results[index].update(status="error", errors=errors)
+            del packages[index]
+
+    failed = len(rows) - len(packages)
+    if packages and not (atomic and failed):
+        indexes = list(packages)
+        delivery_rows = [_delivery_values(packages[i], packages[i].client_id, packages[i].rider_id) for i in indexes]
+
+        if db.bind.dialect.insert_executemany_returning_sort_by_parameter_order:
+            delivery_ids = db.scalars(
+                insert(Delivery).returning(Delivery.id, sort_by_parameter_order=True), delivery_rows
+            ).all()
+            rider_stats.record_inserted(db, delivery_ids)
+        else:
+            # Sin RETURNING en executemany (MySQL) el ORM recupera los ids fila por fila
+            deliveries = [Delivery(**values) for values in delivery_rows]
+            db.add_all(deliveries)
+            db.flush()
+            delivery_ids = [delivery.id for delivery in deliveries]
+
+        payment_rows = [
+            _payment_values(delivery_id, packages[i].monto_domicilio,
+                            *_package_fee(packages[i], packages[i].client_id,
+                                          packages[i].total_amount, packages[i].coop_amount))
+            for i, delivery_id in zip(indexes, delivery_ids)
+        ]
+        with ledger.tracking(db, Payment.delivery_id.in_(delivery_ids)), \
+                rider_stats.tracking(db, Delivery.id.in_(delivery_ids)):
+            db.execute(insert(Payment), payment_rows)
+
+        db.commit()
+
+        for i, delivery_id in zip(indexes, delivery_ids):
+            results[i].update(status="created", delivery_id=delivery_id)
+    else:
+        for i in packages:
+            results[i].update(status="skipped")
+
+    created = sum(1 for result in results if result["status"] == "created")
+    elapsed = time.perf_counter() - started
+
+    return {
+        "created": created,
+        "failed": failed,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "rows_per_second": round(created / elapsed, 1) if elapsed and created else 0,
+        "results": results
+    }
+
+
+@dely_route.post("/bulk")
+def new_deliveries_bulk(packages: List[dict], atomic: bool = False, db = db_dependency):
+    return _bulk_create(packages, atomic, db)
+
+
+@dely_route.post("/bulk/csv")
+def new_deliveries_bulk_csv(file: UploadFile = File(...), atomic: bool = False, db = db_dependency):
+    content = file.file.read().decode("utf-8-sig")
+
+    # Las celdas vacías se omiten para que apliquen los valores por defecto
+    rows = [
+        {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        for row in csv.DictReader(io.StringIO(content))
+    ]
+    return _bulk_create(rows, atomic, db)
+
+
 
 
 @dely_route.post("/generate-label/")
 def generate_label(domicilio: dict, db=db_dependency):
 
+    domi = db.query(Delivery).options(
+        joinedload(Delivery.rider),
+        joinedload(Delivery.client)
+    ).filter(Delivery.id == domicilio['id']).first()
+
+    if not domi:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"delivery with id {domicilio['id']} not found")
+
+    # Los datos del paquete vienen del formulario; rider, cliente y fecha de la base
+    label = {
+        **label_from_delivery(domi),
+        "package_name": domicilio['package_name'],
+        "delivery_address": domicilio['delivery_address'],
+        "delivery_location": domicilio['delivery_location'],
+        "receptor_name": domicilio['receptor_name'],
+        "receptor_number": domicilio['receptor_number'],
+        "delivery_comment": domicilio['delivery_comment'],
+        "delivery_total_amount": domicilio['delivery_total_amount'],
+    }
+
+    key = label_hash(label)
+    pdf = label_cache.get(key)
+    if pdf is None:
+        pdf = render_label(label)
+        label_cache.put(key, pdf, [domi.id])
+
+    return Response(content=pdf, media_type="application/pdf")
+
 
+@dely_route.post("/generate-labels/")
+async def generate_labels(batch: LabelBatch, db=db_dependency):
+    # Todos los domicilios del lote en una sola consulta, por ids o por filtro
     query = db.query(Delivery).options(
         joinedload(Delivery.rider),
-        joinedload(Delivery.client),
-        joinedload(Delivery.payments)
+        joinedload(Delivery.client)
     )
 
-    domi = query.filter(Delivery.id == domicilio['id']).first()
+    if batch.delivery_ids:
+        query = query.filter(Delivery.id.in_(batch.delivery_ids))
+    elif batch.state or batch.start_date:
+        if batch.state:
+            query = query.filter(Delivery.state == batch.state)
+        query = _filter_by_period(query, "custom", batch.start_date, batch.end_date)
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Envíe delivery_ids o un filtro (state, start_date, end_date)")
 
-    print("domicilio", domi)
+    deliveries = query.order_by(Delivery.id).all()
 
-    client_name = domi.client.client_name if domi.client else "Desconocido"
-    rider_name = domi.rider.name if domi.rider else "Sin asignar"
-    fecha_creacion = domi.created_at
+    if not deliveries:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No deliveries found for the labels")
 
-    print("client_name", client_name)
-    print("rider_name", rider_name)
-    print("fecha_creacion", fecha_creacion)
+    labels = [label_from_delivery(delivery) for delivery in deliveries]
 
-    half_letter = (letter[0], letter[1] / 2)  # (612, 396)
-    altura_hoja = half_letter[1]
+    # Un lote idéntico (mismas etiquetas, mismo formato) se sirve desde el caché
+    key = label_hash({"labels": [label_hash(label) for label in labels], "per_sheet": batch.labels_per_sheet})
+    pdf = label_cache.get(key)
 
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=half_letter)
-    p.setFont("Helvetica", 14)
+    if pdf is None:
+        # El render corre en el pool de procesos para no bloquear el event loop
+        loop = asyncio.get_running_loop()
+        pdf = await loop.run_in_executor(get_executor(), render_labels, labels, batch.labels_per_sheet)
+        label_cache.put(key, pdf, [delivery.id for delivery in deliveries])
 
+    return Response(content=pdf, media_type="application/pdf")
 
-    p.drawString(30, 350, f"ID: {domicilio['id']}")
-    p.drawString(30, 330, f"Rider: {rider_name}")
-    p.drawString(30, 310, f"Cliente: {client_name}")
-    p.drawString(30, 290, f"Nombre Paquete: {domicilio['package_name']}")
-    p.drawString(30, 270, f"Dirección: {domicilio['delivery_address']} ")
-    p.drawString(30, 250, f"Barrio: {domicilio['delivery_location']}")
-    p.drawString(30, 230, f"Receptor: {domicilio['receptor_name']} ")
-    p.drawString(30, 210, f"Número Receptor: {domicilio['receptor_number']} ")
-    p.drawString(30, 190, f"Fecha creación: {fecha_creacion}")
-    p.drawString(30, 170, f"Comentario: {domicilio['delivery_comment']}")
-    p.drawString(30, 150, f"Monto a cobrar: {domicilio['delivery_total_amount']}")
-    p.showPage()
-    p.save()
 
-    buffer.seek(0)
-    return Response(content=buffer.getvalue(), media_type="application/pdf")
+@dely_route.get("/label-cache/stats")
+async def get_label_cache_stats():
+    return label_cache.stats()
 
 
 
-@dely_route.get("/get_deliveries_by_status")
-async def get_deliveries_by_status(delivery_status: DeliveryStanding, db = db_dependency ):
+def _stream_ndjson(build_query, batch_size=500):
+    """Genera una línea JSON por fila iterando la consulta por lotes del lado del servidor.
 
-    deliveries = [delivery for delivery in db.query(Delivery).all() if delivery.state == delivery_status]
+    Usa su propia sesión porque la del dependency se cierra antes de que termine el streaming.
+    """
+    db = SessionLocal()
+    try:
+        for row in build_query(db).yield_per(batch_size):
+            yield json.dumps(jsonable_encoder(row)) + "\n"
+    finally:
+        db.close()
 
-    for delivery in deliveries:
-        client = db.query(Client).filter(Client.id == delivery.client_id).first()
 
-        cliente = delivery.client
+@dely_route.get("/get_deliveries_by_status")
+async def get_deliveries_by_status(
+        delivery_status: DeliveryStanding,
+        page: int = 1,
+        size: int = Query(100, le=500),
+        stream: bool = Query(False, description="Devolver todas las filas como NDJSON en streaming"),
+        db = db_dependency
+):
+    # El filtro por estado se hace en SQL (índice por state, created_at, id) y el cliente
+    # se carga en el mismo SELECT
+    def build_query(session):
+        return session.query(Delivery).options(joinedload(Delivery.client)) \
+            .filter(Delivery.state == delivery_status) \
+            .order_by(desc(Delivery.created_at), desc(Delivery.id))
 
+    if stream:
+        return StreamingResponse(_stream_ndjson(build_query), media_type="application/x-ndjson")
 
+    deliveries = build_query(db).offset((page - 1) * size).limit(size).all()
 
     if not deliveries:
         raise HTTPException(status_code=status.HTTP_200_OK,
@@ -301,6 +583,9 @@ async def add_rider_to_delivery(rider_id, delivery_id, db = db_dependency):
         db.commit()
         db.refresh(delivery)
 
+        # La etiqueta imprime el nombre del rider
+        label_cache.invalidate(delivery.id)
+
         return delivery
 
     else:
@@ -308,6 +593,175 @@ async def add_rider_to_delivery(rider_id, delivery_id, db = db_dependency):
 
 
 
+def _assign_rider(db, rider_id: int, delivery_ids: List[int]):
+    """Asigna el rider a los domicilios aún libres con un único UPDATE condicional.
+
+    La condición rider_id IS NULL hace que, entre despachadores concurrentes, cada
+    domicilio lo gane solo uno de ellos. No hace commit.
+    """
+    delivery_ids = list(set(delivery_ids))
+    existing = {row.id: row.rider_id for row in
+                db.query(Delivery.id, Delivery.rider_id).filter(Delivery.id.in_(delivery_ids))}
+
+    statement = update(Delivery) \
+        .where(Delivery.id.in_(delivery_ids), Delivery.rider_id.is_(None)) \
+        .values(rider_id=rider_id, state=DeliveryStanding.ASSIGNED) \
+        .execution_options(synchronize_session=False)
+
+    with ledger.tracking(db, Payment.delivery_id.in_(delivery_ids)), \
+            rider_stats.tracking(db, Delivery.id.in_(delivery_ids)):
+        if db.bind.dialect.update_returning:
+            assigned = set(db.scalars(statement.returning(Delivery.id)).all())
+        else:
+            db.execute(statement)
+            already_mine = {delivery_id for delivery_id, owner in existing.items() if owner == rider_id}
+            assigned = {row.id for row in db.query(Delivery.id).filter(
+                Delivery.id.in_(delivery_ids), Delivery.rider_id == rider_id)} - already_mine
+
+    return {
+        "assigned": sorted(assigned),
+        "already_assigned": sorted(set(existing) - assigned),
+        "not_found": sorted(set(delivery_ids) - set(existing)),
+    }
+
+
+@dely_route.put("/add_rider/bulk")
+async def add_rider_to_deliveries(assignment: BulkRiderAssignment, db = db_dependency):
+
+    check_rider = db.query(Rider.id).filter(Rider.id == assignment.rider_id).first()
+    if not check_rider:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Rider with id {assignment.rider_id} not found")
+
+    result = _assign_rider(db, assignment.rider_id, assignment.delivery_ids)
+    db.commit()
+
+    # Las etiquetas imprimen el nombre del rider
+    for delivery_id in result["assigned"]:
+        label_cache.invalidate(delivery_id)
+
+    return {"rider_id": assignment.rider_id, **result}
+
+
+def _dispatch_plan(db):
+    """Plan de asignación de los domicilios PENDING sin rider entre los riders activos."""
+    started = time.perf_counter()
+
+    pending = db.query(Delivery.id, Delivery.delivery_location, Delivery.delivery_address) \
+        .filter(Delivery.state == DeliveryStanding.PENDING, Delivery.rider_id.is_(None)) \
+        .order_by(Delivery.created_at, Delivery.id).all()
+
+    riders = {row.id: [0, set()] for row in db.query(Rider.id).filter(Rider.is_active)}
+
+    # Carga y zonas de cada rider según sus domicilios abiertos
+    open_deliveries = db.query(Delivery.rider_id, Delivery.delivery_location, Delivery.delivery_address) \
+        .filter(Delivery.state.in_([DeliveryStanding.ASSIGNED, DeliveryStanding.IN_PROGRESS]),
+                Delivery.rider_id.in_(riders.keys())).all() if riders else []
+    for rider_id, delivery_location, delivery_address in open_deliveries:
+        riders[rider_id][0] += 1
+        zone = delivery_location or location_from_address(delivery_address)
+        if zone is not None:
+            riders[rider_id][1].add(zone)
+
+    loads_before = {rider_id: load for rider_id, (load, _) in riders.items()}
+    assignments, unassigned = plan_assignments(
+        [(row.id, row.delivery_location or location_from_address(row.delivery_address)) for row in pending],
+        {rider_id: (load, zones) for rider_id, (load, zones) in riders.items()}
+    )
+
+    per_rider = defaultdict(list)
+    for delivery_id, rider_id, _ in assignments:
+        per_rider[rider_id].append(delivery_id)
+
+    return {
+        "assignments": [
+            {"delivery_id": delivery_id, "rider_id": rider_id, "zone": zone.value if zone else None}
+            for delivery_id, rider_id, zone in assignments
+        ],
+        "per_rider": {
+            rider_id: {"load_before": loads_before[rider_id], "delivery_ids": delivery_ids}
+            for rider_id, delivery_ids in per_rider.items()
+        },
+        "unassigned": unassigned,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+@dely_route.get("/dispatch/plan")
+async def get_dispatch_plan(db = db_dependency):
+    # Dry run: solo propone, no modifica nada
+    return _dispatch_plan(db)
+
+
+@dely_route.post("/dispatch/apply")
+async def apply_dispatch_plan(db = db_dependency):
+    plan = _dispatch_plan(db)
+
+    # Un UPDATE condicional por rider: si otro despachador tomó un domicilio
+    # mientras tanto, queda en already_assigned
+    results = {
+        rider_id: _assign_rider(db, rider_id, entry["delivery_ids"])
+        for rider_id, entry in plan["per_rider"].items()
+    }
+    db.commit()
+
+    for result in results.values():
+        for delivery_id in result["assigned"]:
+            label_cache.invalidate(delivery_id)
+
+    return {
+        "assigned": sum(len(result["assigned"]) for result in results.values()),
+        "already_assigned": sorted(delivery_id for result in results.values()
+                                   for delivery_id in result["already_assigned"]),
+        "unassigned": plan["unassigned"],
+        "per_rider": {rider_id: result["assigned"] for rider_id, result in results.items()}
+    }
+
+
+def _route_run(deliveries_by_zone):
+    """Zonas en orden de recorrido con los domicilios de cada una."""
+    route = order_zones(deliveries_by_zone.keys())
+    legs = route_legs(route)
+    return {
+        "stops": [
+            {"zone": zone.value, "distance_km": km, "delivery_ids": deliveries_by_zone[zone]}
+            for zone, km in zip(route, legs)
+        ],
+        "total_km": round(sum(legs), 1)
+    }
+
+
+@dely_route.get("/routes")
+async def get_route_batches(rider_id: Optional[int] = None, db = db_dependency):
+    """Recorridos por rider: domicilios abiertos agrupados por zona y zonas ordenadas desde la oficina."""
+    query = db.query(Delivery.id, Delivery.rider_id, Delivery.state, Delivery.delivery_location,
+                     Delivery.delivery_address) \
+        .filter(Delivery.state.in_([DeliveryStanding.PENDING, DeliveryStanding.ASSIGNED,
+                                    DeliveryStanding.IN_PROGRESS]))
+    if rider_id is not None:
+        query = query.filter(Delivery.rider_id == rider_id)
+
+    # rider_id -> zona -> ids; los PENDING sin rider quedan bajo None
+    by_rider = defaultdict(lambda: defaultdict(list))
+    without_zone = []
+    for row in query.order_by(Delivery.created_at, Delivery.id):
+        zone = row.delivery_location or location_from_address(row.delivery_address)
+        if zone is None:
+            without_zone.append(row.id)
+            continue
+        by_rider[row.rider_id][zone].append(row.id)
+
+    unassigned = by_rider.pop(None, None)
+    return {
+        "runs": [
+            {"rider_id": rider, **_route_run(zones)}
+            for rider, zones in sorted(by_rider.items())
+        ],
+        "unassigned": _route_run(unassigned) if unassigned else None,
+        "without_zone": without_zone
+    }
+
+
 @dely_route.put("/update", response_model=DeliveryUpdateRespose)
 async def update_delivery( delivery_id, delivery: DeliveryUpdate, db = db_dependency,):
 
@@ -319,6 +773,8 @@ async def update_delivery( delivery_id, delivery: DeliveryUpdate, db = db_depend
 
     if delivery.delivery_address:
         delivery_db.delivery_address = delivery.delivery_address
+        delivery_db.delivery_location = location_from_address(delivery.delivery_address) \
+            or delivery_db.delivery_location
     if delivery.delivery_date:
         delivery_db.delivery_date = delivery.delivery_date
     if delivery.state:
@@ -329,6 +785,8 @@ async def update_delivery( delivery_id, delivery: DeliveryUpdate, db = db_depend
     db.commit()
     db.refresh(delivery_db)
 
+    label_cache.invalidate(delivery_db.id)
+
     return delivery_db
 
 
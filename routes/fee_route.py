@@ -0,0 +1,154 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, status
+from sqlalchemy import select, update, or_
+
+from db.db import db_dependency
+from models.models import FeeRule, Client, Payment, Delivery
+from schemas.schemas import FeeRuleCreate, FeeRuleResponse, FeeReprice, DeliveryLocations, PackageSize, \
+    SettlementStatus, ClientSettlementStatus
+from utils import ledger, rider_stats
+from utils.fees import fee_table, next_version
+from utils.zones import location_from_address
+
+fee_route = APIRouter(prefix="/fees", tags=["Fees"])
+
+REPRICE_CHUNK_SIZE = 500
+
+
+@fee_route.get("/", response_model=list[FeeRuleResponse])
+async def get_fee_rules(include_inactive: bool = False, db = db_dependency):
+    query = db.query(FeeRule)
+    if not include_inactive:
+        query = query.filter(FeeRule.is_active)
+    return query.order_by(FeeRule.id).all()
+
+
+@fee_route.post("/", response_model=FeeRuleResponse)
+async def new_fee_rule(rule: FeeRuleCreate, db = db_dependency):
+
+    if rule.valid_to and rule.valid_to <= rule.valid_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="valid_to must be after valid_from")
+
+    if rule.client_id and not db.query(Client.id).filter(Client.id == rule.client_id).first():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"client with id {rule.client_id} not found")
+
+    fee_rule = FeeRule(**rule.model_dump(), version=next_version(db))
+    db.add(fee_rule)
+    db.commit()
+    db.refresh(fee_rule)
+
+    fee_table.load(db)
+
+    return fee_rule
+
+
+@fee_route.delete("/{rule_id}", response_model=FeeRuleResponse)
+async def deactivate_fee_rule(rule_id: int, db = db_dependency):
+
+    fee_rule = db.query(FeeRule).filter(FeeRule.id == rule_id).first()
+    if not fee_rule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"fee rule with id {rule_id} not found")
+
+    # Las reglas no se borran: quedan inactivas con una versión nueva
+    if fee_rule.is_active:
+        fee_rule.is_active = False
+        fee_rule.version = next_version(db)
+        db.commit()
+        db.refresh(fee_rule)
+        fee_table.load(db)
+
+    return fee_rule
+
+
+@fee_route.get("/quote")
+async def get_fee_quote(delivery_location: DeliveryLocations, client_id: int | None = None,
+                        package_size: PackageSize = PackageSize.SMALL, at: datetime | None = None):
+    fee = fee_table.quote(delivery_location, client_id, package_size, at)
+    return {**fee._asdict(), "version": fee_table.version}
+
+
+@fee_route.get("/stats")
+async def get_fee_table_stats():
+    return fee_table.stats()
+
+
+@fee_route.post("/reload")
+async def reload_fee_table(db = db_dependency):
+    keys = fee_table.load(db)
+    return {"keys": keys, "version": fee_table.version}
+
+
+def _unsettled():
+    """Pagos sin liquidar ni con el rider ni con el cliente."""
+    return (Payment.settlement_status == SettlementStatus.PENDING,
+            or_(Payment.client_settlement_status == ClientSettlementStatus.PENDING,
+                Payment.client_settlement_status.is_(None)))
+
+
+@fee_route.post("/reprice")
+def reprice_payments(reprice: FeeReprice, db = db_dependency):
+    """Recalcula con las reglas vigentes a la fecha de cada domicilio los pagos aún sin liquidar."""
+    started = time.perf_counter()
+
+    query = db.query(Payment.id, Payment.total_amount, Payment.coop_amount, Delivery.client_id,
+                     Delivery.delivery_location, Delivery.delivery_address, Delivery.package_size,
+                     Delivery.created_at) \
+        .join(Delivery, Payment.delivery_id == Delivery.id) \
+        .filter(*_unsettled())
+    if reprice.start_date:
+        query = query.filter(Delivery.created_at >= reprice.start_date)
+    if reprice.end_date:
+        query = query.filter(Delivery.created_at <= reprice.end_date)
+    if reprice.client_id:
+        query = query.filter(Delivery.client_id == reprice.client_id)
+    if reprice.delivery_location:
+        query = query.filter(Delivery.delivery_location == reprice.delivery_location)
+
+    # Pagos a cambiar agrupados por la tarifa nueva, para un UPDATE por grupo
+    changes = defaultdict(list)
+    unchanged, unpriced = 0, []
+    total_delta = coop_delta = 0.0
+    for row in query:
+        location = row.delivery_location or location_from_address(row.delivery_address)
+        fee = fee_table.quote(location, row.client_id, row.package_size or PackageSize.SMALL, row.created_at)
+        if fee is None:
+            unpriced.append(row.id)
+        elif (fee.total_amount, fee.coop_amount) == (row.total_amount, row.coop_amount):
+            unchanged += 1
+        else:
+            changes[(fee.total_amount, fee.coop_amount)].append(row.id)
+            total_delta += fee.total_amount - row.total_amount
+            coop_delta += fee.coop_amount - row.coop_amount
+
+    if not reprice.dry_run:
+        for (total_amount, coop_amount), payment_ids in changes.items():
+            for start in range(0, len(payment_ids), REPRICE_CHUNK_SIZE):
+                chunk = payment_ids[start:start + REPRICE_CHUNK_SIZE]
+                # rider_amount conserva el monto del domicilio: sube o baja lo que cambie la cooperativa
+                statement = update(Payment) \
+                    .where(Payment.id.in_(chunk), *_unsettled()) \
+                    .values(total_amount=total_amount, coop_amount=coop_amount,
+                            rider_amount=Payment.rider_amount + Payment.coop_amount - coop_amount) \
+                    .execution_options(synchronize_session=False)
+                with ledger.tracking(db, Payment.id.in_(chunk)), \
+                        rider_stats.tracking(db, Delivery.id.in_(select(Payment.delivery_id)
+                                                                 .where(Payment.id.in_(chunk)))):
+                    db.execute(statement)
+        db.commit()
+
+    return {
+        "dry_run": reprice.dry_run,
+        "fee_version": fee_table.version,
+        "repriced": sum(len(payment_ids) for payment_ids in changes.values()),
+        "unchanged": unchanged,
+        "unpriced": unpriced,
+        "total_amount_delta": total_delta,
+        "coop_amount_delta": coop_delta,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
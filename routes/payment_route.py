@@ -1,18 +1,32 @@
 # payment_routes.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import json
+import time
+from collections import defaultdict
+from itertools import chain
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
+from fastapi.responses import JSONResponse, FileResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, case, not_, and_
+from sqlalchemy import func, desc, case, not_, and_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from typing import List, Optional
 
-from db.db import db_dependency
+from auth.auth import optional_auth_user
+from db.db import db_dependency, async_db_dependency
 from datetime import datetime, timedelta
-from models.models import Payment, Delivery, Rider, Client
-from schemas.schemas import PaymentStatus, SettlementStatus, PaymentType, ClientSettlementStatus
+from models.models import Payment, Delivery, Rider, Client, SettlementBatch, ClientStatement, ClientStatementLine
+from schemas.schemas import PaymentStatus, SettlementStatus, PaymentType, ClientSettlementStatus, \
+    SettlementBatchKind, ClientStatementStatus, ClientStatementClose
 from pydantic import BaseModel, Field
+from utils import ledger, rider_stats, client_statements
+from utils.statements import statement_store, MEDIA_TYPES
 
 payment_route = APIRouter(prefix="/payments", tags=["Payments"])
 
+# Tamaño de los bloques de ids en las validaciones y UPDATE masivos
+SETTLE_CHUNK_SIZE = 500
+
 
 # Esquemas de respuesta
 class DashboardSummary(BaseModel):
@@ -70,128 +84,34 @@ class PaymentUpdate(BaseModel):
 
 # Dashboard endpoint
 @payment_route.get("/dashboard", response_model=DashboardSummary)
-async def get_dashboard_summary(db=db_dependency):
-
-
-    # Consulta para pagos pendientes de domiciliarios
-    rider_payments_query = db.query(
-        func.count(Payment.id).label("count"),
-        func.sum((Payment.total_amount - Payment.rider_amount)).label("total")
-    ).join(Delivery, Payment.delivery_id == Delivery.id) \
-        .filter(Payment.settlement_status == SettlementStatus.PENDING) \
-        .filter(Payment.payment_status == PaymentStatus.COURIER).filter(Delivery.state == "DELIVERED")
-
-    rider_result = rider_payments_query.first()
-    print(rider_result)
-
-
-#############################################################
-
-    rider_payments_query = db.query(
-        func.count(Payment.id).label("count"),
-        func.sum(Payment.rider_amount).label("total")
-    ).join(Delivery, Payment.delivery_id == Delivery.id) \
-        .filter(Payment.payment_status != PaymentStatus.OFFICE) \
-        .filter(Payment.settlement_status != SettlementStatus.SETTLED) \
-        .filter(
-        not_(
-            and_(
-                Payment.settlement_status == SettlementStatus.PENDING,
-                Payment.payment_status == PaymentStatus.COURIER
-
-            )
-        )
-    )
-
-    to_pay_rider = rider_payments_query.first()
-
-    print("to_pay_rider: ", to_pay_rider)
-
-############################################################
-
-
-
-    # Consulta para ver cuanto se le debe al domiciliario desde el client
-
-    payments_to_rider_for_client = (db.query(
-        func.count(Payment.id).label("count"),
-        func.sum(Payment.rider_amount).label("total")
-    ).join(Delivery, Payment.delivery_id == Delivery.id) \
-         .filter(Payment.settlement_status == SettlementStatus.TRANFERRED_TO_CLIENT )) \
-         .filter(Payment.payment_status == PaymentStatus.CLIENT_RECIEVED_TRANSFER)
-
-    payment_to_rider_from_client = payments_to_rider_for_client.first()
-
-
-    # Consulta para ver cuanto se le debe al domiciliario desde la oficina
-
-    payments_to_rider_for_office = (db.query(
-        func.count(Payment.id).label("count"),
-        func.sum(Payment.rider_amount).label("total")
-    ).join(Delivery, Payment.delivery_id == Delivery.id) \
-        .filter(Payment.settlement_status == SettlementStatus.TRANSFER_TO_OFFICE)) \
-        .filter(Payment.payment_status == PaymentStatus.OFFICE_RECIEVED_TRANSFER)
-
-
-    payment_to_rider_from_office = payments_to_rider_for_office.first()
-
-
-
-
-    # Consulta para pagos pendientes de oficina a cliente
-    office_to_client_payments_query = (db.query(
-        func.count(Payment.id).label("count"),
-        func.sum(Payment.total_amount - (Payment.rider_amount + Payment.coop_amount) ).label("total")
-    ).join(Delivery, Payment.delivery_id == Delivery.id).filter(Delivery.state == "DELIVERED") \
-        .filter(Payment.client_settlement_status != ClientSettlementStatus.SETTLED) \
-        .filter(Payment.settlement_status != SettlementStatus.PENDING) \
-        .filter(Payment.payment_status.in_([PaymentStatus.OFFICE_RECIEVED_TRANSFER, PaymentStatus.OFFICE, PaymentStatus.COURIER ]) ))
-        #.filter(Payment.payment_status == PaymentStatus.OFFICE) \
-        #.filter(Payment.payment_status == PaymentStatus.COURIER)
-
-    office_client_result = office_to_client_payments_query.first()
-    print("ESTE ES EL CLIENTE QUERY: ", office_client_result)
-    # Total de transacciones y montos
-
-    # consulta de pagos de cliente que debe a oficina
-    clients_payments_query = (db.query(
-        func.count(Payment.id).label("count"),
-        func.sum((Payment.rider_amount + Payment.coop_amount)).label("total")
-    ).join(Delivery, Payment.delivery_id == Delivery.id).filter(Delivery.state == "DELIVERED") \
-        .filter(Payment.client_settlement_status != ClientSettlementStatus.SETTLED) \
-        .filter(Payment.settlement_status != SettlementStatus.PENDING)
-        .filter(Payment.payment_status == PaymentStatus.CLIENT_RECIEVED_TRANSFER))
-
-    client_result = clients_payments_query.first()
-
-    print("CLIENT RESULT", client_result)
+async def get_dashboard_summary(
+        mode: Optional[str] = Query(None, description="Modo de consulta: 'ledger' o 'single_pass'"),
+        db=async_db_dependency
+):
+    if mode and mode not in ledger.DASHBOARD_QUERY_MODES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Modo inválido, use uno de {ledger.DASHBOARD_QUERY_MODES}")
 
+    # Por defecto los contadores salen del ledger materializado (utils/ledger.py);
+    # 'single_pass' los calcula en un solo recorrido de payments JOIN deliveries
+    return await db.run_sync(ledger.summary_for_mode, mode)
 
-    total_query = db.query(
-        func.count(Payment.id).label("count"),
-        func.sum(Payment.total_amount).label("total")
-    )
 
-    total_result = total_query.first()
+@payment_route.post("/dashboard/rebuild")
+async def rebuild_dashboard_ledger(db=db_dependency):
+    keys = ledger.rebuild(db)
+    return {"message": f"Ledger reconstruido con {keys} llaves"}
 
-    print("este es el pending:", payment_to_rider_from_office.total, payment_to_rider_from_client.total)
-    return {
-        "to_pay_rider_total": float(to_pay_rider.total or 0),
-        "to_pay_rider_count": to_pay_rider.count or 0,
-        "pending_to_rider_from_client": float(payment_to_rider_from_client.total or 0),
-        "pending_to_rider_from_office": float(payment_to_rider_from_office.total or 0),
-        "pendingRiderPayments":  rider_result.count or 0 if rider_result else 0,
-        "pendingRiderAmount": float(rider_result.total or 0) if rider_result and rider_result.total else 0,
 
-        "pendingClientPayments": client_result.count or 0 if client_result else 0,
-        "pendingClientAmount": float(client_result.total or 0) if client_result and client_result.total else 0,
+@payment_route.get("/dashboard/check")
+async def check_dashboard_ledger(db=db_dependency):
+    differences = ledger.check(db)
+    return {"consistent": not differences, "differences": differences}
 
-        "pendingOfficeToClient": office_client_result.count or 0 if office_client_result else 0,
-        "pendingOfficeToClientAmount": float(office_client_result.total or 0) if office_client_result and office_client_result.total else 0,
 
-        "totalTransactions": total_result.count or 0 if total_result else 0,
-        "totalAmount": float(total_result.total or 0) if total_result and total_result.total else 0
-    }
+@payment_route.get("/dashboard/parity")
+async def check_dashboard_parity(db=db_dependency):
+    return ledger.parity(db)
 
 
 # Endpoints para gestión de pagos de domiciliarios
@@ -202,8 +122,7 @@ async def get_riders_payments(
         end_date: Optional[datetime] = None,
         db=db_dependency
 ):
-    # Consulta base
-    # print("ESTE ES EL SETTLEMENTsTATUS", settlement_status)
+    # Una fila por rider y estado de liquidación; el resumen del rider se arma con sus filas
     query = (db.query(
         Rider.id.label("rider_id"),
         Rider.name.label("rider_name"),
@@ -211,12 +130,14 @@ async def get_riders_payments(
         Payment.settlement_status.label("settlement_status"),
         func.count(Payment.id).label("total_deliveries"),
         func.sum(Payment.total_amount).label("total_amount"),
+        func.sum(Payment.rider_amount).label("rider_amount"),
+        # CASE en SQL como la consulta original: settlement_status NULL no cuenta como pendiente
         func.sum(case((Payment.settlement_status != SettlementStatus.SETTLED, Payment.rider_amount), else_=0)).label(
             "pending_amount")
     ).join(Delivery, Delivery.rider_id == Rider.id) \
         .join(Payment, Payment.delivery_id == Delivery.id) \
         .filter(Payment.payment_status != PaymentStatus.OFFICE) \
-        .filter(Delivery.state == "DELIVERED")) \
+        .filter(Delivery.state == "DELIVERED"))
 
     # Aplicar filtros opcionales
     if settlement_status:
@@ -228,26 +149,40 @@ async def get_riders_payments(
     if end_date:
         query = query.filter(Payment.created_at <= end_date)
 
-    # Agrupar por domiciliario
-    query = query.group_by(Rider.id, Rider.name, Rider.phone)
+    # Agrupar por domiciliario y estado
+    query = query.group_by(Rider.id, Rider.name, Rider.phone, Payment.settlement_status) \
+        .order_by(Rider.id, Payment.settlement_status)
 
-    # Ordenar por monto pendiente de mayor a menor
-    query = query.order_by(desc("pending_amount"))
-
-    results = query.all()
-    print("RESULTS PARA DASHBOARD", results)
-    return [
-        {
+    riders = {}
+    for result in query.all():
+        rider = riders.setdefault(result.rider_id, {
             "rider_id": result.rider_id,
             "rider_name": result.rider_name,
             "rider_phone": result.rider_phone,
-            "total_deliveries": result.total_deliveries,
+            "total_deliveries": 0,
             "settlement_status": result.settlement_status,
-            "total_amount": float(result.total_amount) if result.total_amount else 0,
-            "pending_amount": float(result.pending_amount) if result.pending_amount else 0
-        }
-        for result in results
-    ]
+            "total_amount": 0.0,
+            "pending_amount": 0.0,
+            "by_settlement_status": []
+        })
+        rider_amount = float(result.rider_amount or 0)
+        pending_amount = float(result.pending_amount or 0)
+        rider["by_settlement_status"].append({
+            "settlement_status": result.settlement_status,
+            "total_deliveries": result.total_deliveries,
+            "total_amount": float(result.total_amount or 0),
+            "rider_amount": rider_amount,
+            "pending_amount": pending_amount
+        })
+        rider["total_deliveries"] += result.total_deliveries
+        rider["total_amount"] += float(result.total_amount or 0)
+        rider["pending_amount"] += pending_amount
+        # Con pagos en varios estados no hay un estado único del rider
+        if rider["settlement_status"] != result.settlement_status:
+            rider["settlement_status"] = None
+
+    # Ordenar por monto pendiente de mayor a menor
+    return sorted(riders.values(), key=lambda rider: rider["pending_amount"], reverse=True)
 
 
 @payment_route.get("/riders-payments/{rider_id}", response_model=List[dict])
@@ -333,10 +268,119 @@ class SettlePaymentsRequest(BaseModel):
     payment_ids: List[int]
     comments: Optional[str] = None
 
+
+def _chunks(ids, size=SETTLE_CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _owned_payments(db, payment_ids, owner_column, owner_id, detail, status_column=None):
+    """Montos de los pagos pedidos; 400 con los que no existen o son de otro rider/cliente.
+
+    Con ``status_column`` cada fila trae también el estado actual del pago en ``current_status``.
+    """
+    columns = [Payment.id, owner_column.label("owner_id"),
+               Payment.total_amount, Payment.rider_amount, Payment.coop_amount]
+    if status_column is not None:
+        columns.append(status_column.label("current_status"))
+
+    rows = {}
+    for chunk in _chunks(payment_ids):
+        rows.update((row.id, row) for row in db.query(*columns)
+                    .outerjoin(Delivery, Payment.delivery_id == Delivery.id).filter(Payment.id.in_(chunk)))
+
+    missing = [payment_id for payment_id in payment_ids if payment_id not in rows]
+    foreign = [payment_id for payment_id, row in rows.items() if row.owner_id != owner_id]
+    if missing or foreign:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={
+            "msg": detail,
+            "missing": missing,
+            f"other_{owner_column.key.removesuffix('_id')}": foreign
+        })
+    return list(rows.values())
+
+
+def _skip_already(payments, target_status):
+    """(pagos por cambiar, ids que ya están en target_status): un reintento no vuelve a tocar los segundos."""
+    pending = [payment for payment in payments if payment.current_status != target_status]
+    already = [payment.id for payment in payments if payment.current_status == target_status]
+    return pending, already
+
+
+_SKIPPED_KEYS = ("already_settled", "already_received")
+
+
+def _replayed_batch(db, idempotency_key, kind, payment_ids, rider_id=None, client_id=None):
+    """Respuesta guardada si el lote ya se procesó con la misma Idempotency-Key."""
+    if not idempotency_key:
+        return None
+
+    batch = db.query(SettlementBatch).filter(SettlementBatch.idempotency_key == idempotency_key).first()
+    if batch is None:
+        return None
+
+    # El lote guarda solo los pagos que cambió; los que ya estaban se reportaron en la respuesta
+    result = json.loads(batch.result)
+    requested = set(json.loads(batch.payment_ids)).union(*(result.get(key, []) for key in _SKIPPED_KEYS))
+    if (batch.kind, batch.rider_id, batch.client_id) != (kind, rider_id, client_id) \
+            or requested != set(payment_ids):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="La Idempotency-Key ya se usó para otro lote")
+
+    return JSONResponse(result, headers={"Idempotent-Replayed": "true"})
+
+
+def _record_batch(db, kind, payments, result, idempotency_key, actor, comments, rider_id=None, client_id=None):
+    """Agrega el lote al diario y hace commit junto con el UPDATE de los pagos.
+
+    Si otra petición con la misma llave hizo commit primero, se descarta todo y se
+    devuelve la respuesta de esa petición. Sin pagos por cambiar no se registra lote:
+    el diario solo lleva lo que de verdad se liquidó o recibió.
+    """
+    if not payments:
+        db.commit()
+        return {**result, "batch_id": None, "payments_count": 0, "total_amount": 0.0,
+                "rider_amount": 0.0, "coop_amount": 0.0}
+
+    batch = SettlementBatch(
+        kind=kind,
+        rider_id=rider_id,
+        client_id=client_id,
+        idempotency_key=idempotency_key,
+        payment_ids=json.dumps([payment.id for payment in payments]),
+        payments_count=len(payments),
+        total_amount=sum(payment.total_amount for payment in payments),
+        rider_amount=sum(payment.rider_amount for payment in payments),
+        coop_amount=sum(payment.coop_amount for payment in payments),
+        actor=actor.username if actor else None,
+        comments=comments,
+        result="{}"
+    )
+    db.add(batch)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        replay = _replayed_batch(db, idempotency_key, kind, [payment.id for payment in payments],
+                                 rider_id, client_id)
+        if replay is None:
+            raise
+        return replay
+
+    result = {**result, "batch_id": batch.id, "payments_count": batch.payments_count,
+              "total_amount": batch.total_amount, "rider_amount": batch.rider_amount,
+              "coop_amount": batch.coop_amount}
+    batch.result = json.dumps(result)
+    db.commit()
+    return result
+
+
 @payment_route.post("/riders-payments/{rider_id}/settle")
-async def settle_rider_payments(
+def settle_rider_payments(
     rider_id: int,
     body: SettlePaymentsRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    actor=Depends(optional_auth_user),
     db=db_dependency
 ):
     if not body.payment_ids:
@@ -345,29 +389,34 @@ async def settle_rider_payments(
             detail="Se requiere al menos un ID de pago para liquidar"
         )
 
-    print(rider_id, body.payment_ids, body.comments)
+    payment_ids = list(dict.fromkeys(body.payment_ids))
 
-    # Buscar los pagos que coincidan con los IDs y el rider
-    payments = db.query(Payment).join(Delivery).filter(
-        Payment.id.in_(body.payment_ids),
-        Delivery.rider_id == rider_id
-    ).all()
-
-    if len(payments) != len(body.payment_ids):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Algunos pagos no existen o no corresponden al domiciliario especificado"
-        )
+    # Un reintento con la misma llave devuelve el resultado guardado sin volver a liquidar
+    replay = _replayed_batch(db, idempotency_key, SettlementBatchKind.RIDER_SETTLEMENT, payment_ids, rider_id=rider_id)
+    if replay is not None:
+        return replay
 
-    # Actualizar estado de cada pago
-    for payment in payments:
-        payment.settlement_status = SettlementStatus.SETTLED
-        payment.comments = body.comments
-        payment.updated_at = datetime.utcnow()
+    # Los pagos deben existir y corresponder al rider; los ya liquidados no entran al lote
+    payments = _owned_payments(db, payment_ids, Delivery.rider_id, rider_id,
+                               "Algunos pagos no existen o no corresponden al domiciliario especificado",
+                               Payment.settlement_status)
+    payments, already = _skip_already(payments, SettlementStatus.SETTLED)
 
-    db.commit()
+    rider_deliveries = select(Delivery.id).where(Delivery.rider_id == rider_id)
+    for chunk in _chunks([payment.id for payment in payments]):
+        statement = update(Payment) \
+            .where(Payment.id.in_(chunk), Payment.delivery_id.in_(rider_deliveries)) \
+            .values(settlement_status=SettlementStatus.SETTLED, comments=body.comments,
+                    updated_at=datetime.utcnow()) \
+            .execution_options(synchronize_session=False)
+        with ledger.tracking(db, Payment.id.in_(chunk)), \
+                rider_stats.tracking(db, Delivery.id.in_(select(Payment.delivery_id)
+                                                         .where(Payment.id.in_(chunk)))):
+            db.execute(statement)
 
-    return {"message": f"Se han liquidado {len(payments)} pagos"}
+    return _record_batch(db, SettlementBatchKind.RIDER_SETTLEMENT, payments,
+                         {"message": f"Se han liquidado {len(payments)} pagos", "already_settled": already},
+                         idempotency_key, actor, body.comments, rider_id=rider_id)
 
 
 
@@ -378,7 +427,10 @@ async def get_clients_payments(
         end_date: Optional[datetime] = None,
         db=db_dependency
 ):
-    query = (db.query(
+    amount_columns = ("total_deliveries", "total_amount", "coop_amount", "yo_le_debo_al_cliente", "cliente_me_debe")
+
+    # Pagos aún no facturados: se calculan en vivo
+    live = db.query(
         Client.id.label("client_id"),
         Client.client_name.label("client_name"),
         Client.phone.label("client_phone"),
@@ -387,107 +439,86 @@ async def get_clients_payments(
         func.count(Payment.id).label("total_deliveries"),
         func.sum(Payment.total_amount).label("total_amount"),
         func.sum(Payment.rider_amount + Payment.coop_amount).label("coop_amount"),
-
         # Empresa le debe al cliente
-        func.sum(
-            case(
-                (
-                    and_(
-                        Payment.payment_status.in_([
-                            PaymentStatus.COURIER,
-                            PaymentStatus.OFFICE,
-                            PaymentStatus.OFFICE_RECIEVED_TRANSFER
-                        ]),
-                        Payment.settlement_status != SettlementStatus.PENDING
-                    ),
-                    (Payment.total_amount - (Payment.rider_amount + Payment.coop_amount))
-                ),
-                else_=0
-            )
-        ).label("yo_le_debo_al_cliente"),
-
+        func.sum(client_statements.owed_to_client()).label("yo_le_debo_al_cliente"),
         # Cliente le debe a la empresa
-        func.sum(
-            case(
-                (
-                    Payment.payment_status.in_([
-                        PaymentStatus.CLIENT,
-                        PaymentStatus.CLIENT_RECIEVED_TRANSFER
-                    ]),
-                    (Payment.rider_amount + Payment.coop_amount)
-                ),
-                else_=0
-            )
-        ).label("cliente_me_debe"),
-
-        # Saldo neto: lo que el cliente me debe menos lo que yo le debo
-        (
-                func.sum(
-                    case(
-                        (
-                            Payment.payment_status.in_([
-                                PaymentStatus.CLIENT,
-                                PaymentStatus.CLIENT_RECIEVED_TRANSFER
-                            ]),
-                            Payment.total_amount - (Payment.rider_amount + Payment.coop_amount)
-                        ),
-                        else_=0
-                    )
-                ) - func.sum(
-            case(
-                (
-                    and_(
-                        Payment.payment_status.in_([
-                            PaymentStatus.COURIER,
-                            PaymentStatus.OFFICE,
-                            PaymentStatus.OFFICE_RECIEVED_TRANSFER
-                        ]),
-                        Payment.settlement_status != SettlementStatus.PENDING
-                    ),
-                    Payment.rider_amount + Payment.coop_amount
-                ),
-                else_=0
-            )
-        )
-        ).label("saldo_neto")
+        func.sum(client_statements.client_owes()).label("cliente_me_debe"),
 
     ).join(Delivery, Delivery.client_id == Client.id) \
         .join(Payment, Payment.delivery_id == Delivery.id) \
-        .group_by(Client.id, Client.client_name, Client.phone).filter(Delivery.state == 'DELIVERED') \
-        .filter(Payment.client_settlement_status != ClientSettlementStatus.SETTLED))
+        .filter(*client_statements.open_balance_filters(), client_statements.unbilled()) \
+        .group_by(Client.id, Client.client_name, Client.phone)
 
+    # Periodos cerrados: montos congelados en las líneas de los estados de cuenta emitidos,
+    # sin los pagos que ya se liquidaron con el cliente
+    billed = db.query(
+        Client.id.label("client_id"),
+        Client.client_name.label("client_name"),
+        Client.phone.label("client_phone"),
+        Payment.client_settlement_status.label("client_settlement_status"),
 
-    results = query.all()
-    # result_dicts = [row._asdict() for row in results]
-
-    # payments_id = (db.query(Payment.id.label('payments_ids'))
-    #               .join(Payment, Delivery.client_id == Client.id)).filter(Payment.client_settlement_status != ClientSettlementStatus.SETTLED)
-
-    payment_ids_list = []
-    for result in results:
-        payment_ids = db.query(Payment.id).join(Delivery).filter(
-            Delivery.client_id == result.client_id,
-            Payment.client_settlement_status != ClientSettlementStatus.SETTLED
-        ).all()
-
-        payment_ids_list = [row.id for row in payment_ids]
-
-    result_new = [
-        {'client_id': result.client_id,
-         'client_name': result.client_name,
-         'client_phone': result.client_phone,
-         'total_deliveries': result.total_deliveries,
-         'total_amount': result.total_amount,
-         'coop_amount': result.coop_amount,
-         'yo_le_debo_al_cliente': result.yo_le_debo_al_cliente,
-         'cliente_me_debe': result.cliente_me_debe,
-         'saldo_neto': (result.yo_le_debo_al_cliente - result.cliente_me_debe),
-         'client_settlement_status': result.client_settlement_status,
-         'payment_ids_list': payment_ids_list
-         }
-
-        for result in results]
-    print(result_new)
+        func.count(ClientStatementLine.id).label("total_deliveries"),
+        func.sum(ClientStatementLine.total_amount).label("total_amount"),
+        func.sum(ClientStatementLine.coop_amount).label("coop_amount"),
+        func.sum(ClientStatementLine.yo_le_debo_al_cliente).label("yo_le_debo_al_cliente"),
+        func.sum(ClientStatementLine.cliente_me_debe).label("cliente_me_debe"),
+
+    ).join(ClientStatement, ClientStatement.client_id == Client.id) \
+        .join(ClientStatementLine, ClientStatementLine.statement_id == ClientStatement.id) \
+        .join(Payment, Payment.id == ClientStatementLine.payment_id) \
+        .filter(ClientStatement.status == ClientStatementStatus.ISSUED,
+                Payment.client_settlement_status != ClientSettlementStatus.SETTLED) \
+        .group_by(Client.id, Client.client_name, Client.phone)
+
+    results = {}
+    for result in chain(billed.all(), live.all()):
+        entry = results.get(result.client_id)
+        if entry is None:
+            results[result.client_id] = {
+                'client_id': result.client_id,
+                'client_name': result.client_name,
+                'client_phone': result.client_phone,
+                **{name: getattr(result, name) for name in amount_columns},
+                'client_settlement_status': result.client_settlement_status,
+                'statements': []
+            }
+        else:
+            for name in amount_columns:
+                entry[name] += getattr(result, name)
+
+    statements = db.query(ClientStatement) \
+        .filter(ClientStatement.status == ClientStatementStatus.ISSUED,
+                ClientStatement.client_id.in_(list(results))) \
+        .order_by(ClientStatement.period_start).all() if results else []
+    for statement in statements:
+        results[statement.client_id]['statements'].append({
+            'id': statement.id,
+            'period_start': statement.period_start,
+            'period_end': statement.period_end,
+            'total_deliveries': statement.total_deliveries,
+            'saldo_neto': statement.saldo_neto
+        })
+
+    # Ids de pagos sin liquidar de todos los clientes en una sola consulta,
+    # agrupados por cliente en memoria (antes era una consulta por cliente)
+    payment_ids_by_client = defaultdict(list)
+    client_ids = list(results)
+    if client_ids:
+        payment_rows = db.query(Delivery.client_id, Payment.id) \
+            .join(Payment, Payment.delivery_id == Delivery.id) \
+            .filter(Delivery.client_id.in_(client_ids),
+                    Payment.client_settlement_status != ClientSettlementStatus.SETTLED) \
+            .order_by(Payment.id).all()
+
+        for client_id, payment_id in payment_rows:
+            payment_ids_by_client[client_id].append(payment_id)
+
+    result_new = []
+    for client_id in sorted(results):
+        entry = results[client_id]
+        entry['saldo_neto'] = entry['yo_le_debo_al_cliente'] - entry['cliente_me_debe']
+        entry['payment_ids_list'] = payment_ids_by_client[client_id]
+        result_new.append(entry)
     return result_new
 
 
@@ -532,37 +563,241 @@ async def get_client_payment_details(
 
 
 @payment_route.post("/clients-payments/{client_id}/receive")
-async def receive_client_payments(
+def receive_client_payments(
         client_id: int,
         payment_ids: List[int],
         payment_type: str,
         payment_reference: Optional[str] = None,
         comments: Optional[str] = None,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+        actor=Depends(optional_auth_user),
         db=db_dependency
 ):
-    # Verificar que los pagos existan y correspondan al cliente
-    payments = db.query(Payment).join(Delivery).filter(
-        Payment.id.in_(payment_ids),
-        Delivery.client_id == client_id
-    ).all()
+    try:
+        payment_type = PaymentType(payment_type)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Tipo de pago inválido: {payment_type}")
+
+    payment_ids = list(dict.fromkeys(payment_ids))
+
+    replay = _replayed_batch(db, idempotency_key, SettlementBatchKind.CLIENT_RECEIPT, payment_ids,
+                             client_id=client_id)
+    if replay is not None:
+        return replay
+
+    # Verificar que los pagos existan y correspondan al cliente; los ya recibidos no entran al lote
+    payments = _owned_payments(db, payment_ids, Delivery.client_id, client_id,
+                               "Algunos pagos no existen o no corresponden al cliente especificado",
+                               Payment.payment_status)
+    payments, already = _skip_already(payments, PaymentStatus.OFFICE_RECIEVED_TRANSFER)
+
+    # Actualizar estado de los pagos a recibido en la oficina
+    client_deliveries = select(Delivery.id).where(Delivery.client_id == client_id)
+    for chunk in _chunks([payment.id for payment in payments]):
+        statement = update(Payment) \
+            .where(Payment.id.in_(chunk), Payment.delivery_id.in_(client_deliveries)) \
+            .values(payment_status=PaymentStatus.OFFICE_RECIEVED_TRANSFER, payment_type=payment_type,
+                    payment_reference=payment_reference, comments=comments, updated_at=datetime.utcnow()) \
+            .execution_options(synchronize_session=False)
+        with ledger.tracking(db, Payment.id.in_(chunk)):
+            db.execute(statement)
+
+    return _record_batch(db, SettlementBatchKind.CLIENT_RECEIPT, payments,
+                         {"message": f"Se han registrado {len(payments)} pagos recibidos",
+                          "already_received": already},
+                         idempotency_key, actor, comments, client_id=client_id)
+
+
+def _batches_query(db, kind, start_date, end_date, *columns):
+    query = db.query(*columns) if columns else db.query(SettlementBatch)
+    if kind:
+        query = query.filter(SettlementBatch.kind == kind)
+    if start_date:
+        query = query.filter(SettlementBatch.created_at >= start_date)
+    if end_date:
+        query = query.filter(SettlementBatch.created_at <= end_date)
+    return query
 
-    if len(payments) != len(payment_ids):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Algunos pagos no existen o no corresponden al cliente especificado"
-        )
 
-    # Actualizar estado de los pagos a recibido
-    for payment in payments:
-        payment.payment_status = PaymentStatus.RECEIVED
-        payment.payment_type = PaymentType(payment_type)
-        payment.payment_reference = payment_reference
-        payment.comments = comments
-        payment.updated_at = datetime.utcnow()
+@payment_route.get("/settlement-batches")
+async def get_settlement_batches(
+        kind: Optional[SettlementBatchKind] = None,
+        rider_id: Optional[int] = None,
+        client_id: Optional[int] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        page: int = 1,
+        size: int = Query(50, ge=1, le=500),
+        db=db_dependency
+):
+    query = _batches_query(db, kind, start_date, end_date)
+    if rider_id is not None:
+        query = query.filter(SettlementBatch.rider_id == rider_id)
+    if client_id is not None:
+        query = query.filter(SettlementBatch.client_id == client_id)
 
-    db.commit()
+    batches = query.order_by(desc(SettlementBatch.created_at), desc(SettlementBatch.id)) \
+        .offset((page - 1) * size).limit(size).all()
 
-    return {"message": f"Se han registrado {len(payments)} pagos recibidos"}
+    return [
+        {
+            "id": batch.id,
+            "kind": batch.kind.value,
+            "rider_id": batch.rider_id,
+            "client_id": batch.client_id,
+            "payment_ids": json.loads(batch.payment_ids),
+            "payments_count": batch.payments_count,
+            "total_amount": batch.total_amount,
+            "rider_amount": batch.rider_amount,
+            "coop_amount": batch.coop_amount,
+            "actor": batch.actor,
+            "comments": batch.comments,
+            "created_at": batch.created_at
+        }
+        for batch in batches
+    ]
+
+
+@payment_route.get("/reconciliation")
+async def get_reconciliation(
+        kind: Optional[SettlementBatchKind] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        db=db_dependency
+):
+    """Totales liquidados por rider y recibidos por cliente, leídos del diario de lotes."""
+    rows = _batches_query(
+        db, kind, start_date, end_date,
+        SettlementBatch.kind,
+        SettlementBatch.rider_id,
+        SettlementBatch.client_id,
+        func.count(SettlementBatch.id).label("batches"),
+        func.sum(SettlementBatch.payments_count).label("payments_count"),
+        func.sum(SettlementBatch.total_amount).label("total_amount"),
+        func.sum(SettlementBatch.rider_amount).label("rider_amount"),
+        func.sum(SettlementBatch.coop_amount).label("coop_amount"),
+        func.max(SettlementBatch.created_at).label("last_batch_at")
+    ).group_by(SettlementBatch.kind, SettlementBatch.rider_id, SettlementBatch.client_id).all()
+
+    riders, clients = [], []
+    for row in rows:
+        entry = {
+            "batches": row.batches,
+            "payments_count": int(row.payments_count or 0),
+            "total_amount": float(row.total_amount or 0),
+            "rider_amount": float(row.rider_amount or 0),
+            "coop_amount": float(row.coop_amount or 0),
+            "last_batch_at": row.last_batch_at
+        }
+        if row.kind == SettlementBatchKind.RIDER_SETTLEMENT:
+            riders.append({"rider_id": row.rider_id, **entry})
+        else:
+            clients.append({"client_id": row.client_id, **entry})
+
+    return {"riders": riders, "clients": clients}
+
+
+def _statement_or_404(db, statement_id):
+    statement = db.query(ClientStatement).filter(ClientStatement.id == statement_id).first()
+    if not statement:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Estado de cuenta {statement_id} no encontrado")
+    return statement
+
+
+def _statement_summary(statement):
+    return {
+        "id": statement.id,
+        "client_id": statement.client_id,
+        "period_start": statement.period_start,
+        "period_end": statement.period_end,
+        "status": statement.status.value,
+        **{name: getattr(statement, name) for name in (*client_statements.AMOUNT_COLUMNS, "saldo_neto")},
+        "has_invoice": statement.invoice_file is not None,
+        "created_at": statement.created_at,
+        "paid_at": statement.paid_at
+    }
+
+
+@payment_route.post("/client-statements/close")
+def close_client_statements(data: ClientStatementClose, db=db_dependency):
+    """Cierra un periodo: estados de cuenta por cliente y sus cuentas de cobro en PDF."""
+    # Las fechas que falten se toman del último periodo completo
+    default_start, default_end = client_statements.last_complete_period(
+        client_statements.CLIENT_STATEMENT_PERIOD or "monthly")
+    period_start = data.period_start or default_start
+    period_end = data.period_end or default_end
+    if period_end <= period_start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="period_end debe ser posterior a period_start")
+
+    started = time.perf_counter()
+    report = client_statements.close_and_render(db, period_start, period_end, data.client_ids,
+                                                data.render_invoices)
+    return {**report, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+@payment_route.get("/client-statements")
+async def get_client_statements(
+        client_id: Optional[int] = None,
+        statement_status: Optional[ClientStatementStatus] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        page: int = 1,
+        size: int = Query(50, ge=1, le=500),
+        db=db_dependency
+):
+    query = db.query(ClientStatement)
+    if client_id is not None:
+        query = query.filter(ClientStatement.client_id == client_id)
+    if statement_status:
+        query = query.filter(ClientStatement.status == statement_status)
+    if start_date:
+        query = query.filter(ClientStatement.period_start >= start_date)
+    if end_date:
+        query = query.filter(ClientStatement.period_end <= end_date)
+
+    statements = query.order_by(desc(ClientStatement.period_start), ClientStatement.client_id) \
+        .offset((page - 1) * size).limit(size).all()
+    return [_statement_summary(statement) for statement in statements]
+
+
+@payment_route.get("/client-statements/{statement_id}")
+async def get_client_statement(statement_id: int, db=db_dependency):
+    statement = _statement_or_404(db, statement_id)
+    lines = db.query(ClientStatementLine) \
+        .filter(ClientStatementLine.statement_id == statement_id) \
+        .order_by(ClientStatementLine.payment_id).all()
+    return {
+        **_statement_summary(statement),
+        "lines": [
+            {
+                "payment_id": line.payment_id,
+                "delivery_id": line.delivery_id,
+                "date": line.payment_created_at,
+                "payment_status": line.payment_status.value if line.payment_status else None,
+                "settlement_status": line.settlement_status.value if line.settlement_status else None,
+                "total_amount": line.total_amount,
+                "coop_amount": line.coop_amount,
+                "yo_le_debo_al_cliente": line.yo_le_debo_al_cliente,
+                "cliente_me_debe": line.cliente_me_debe
+            }
+            for line in lines
+        ]
+    }
+
+
+@payment_route.get("/client-statements/{statement_id}/invoice")
+def get_client_statement_invoice(statement_id: int, db=db_dependency):
+    statement = _statement_or_404(db, statement_id)
+    # Si se cerró sin cuentas de cobro (o se borró el archivo) se genera ahora
+    if not statement.invoice_file or not statement_store.has_file(statement.invoice_file, "pdf"):
+        client_statements.render_invoices(db, [statement_id])
+        db.refresh(statement)
+
+    return FileResponse(statement_store.file_path(statement.invoice_file, "pdf"), media_type=MEDIA_TYPES["pdf"],
+                        filename=f"estado_cuenta_{statement.id}_cliente_{statement.client_id}.pdf")
 
 
 # Endpoint para el resumen general de pagos
@@ -720,6 +955,11 @@ async def update_payment(payment_id: int, data: PaymentUpdate, db=db_dependency)
 
     payment.updated_at = datetime.utcnow()
 
+    # El estado de cuenta que incluye el pago pasa a PAID o vuelve a ISSUED
+    if data.client_settlement_status is not None:
+        db.flush()
+        client_statements.refresh_paid(db, [payment.id])
+
     db.commit()
     db.refresh(payment)
 
@@ -745,24 +985,45 @@ async def delete_payment(payment_id: int, db=db_dependency):
 class PaymentId(BaseModel):
     payments_id: list[int]
 
-@payment_route.put("/client_settled/{client_id}")
-async def settling_payments(data: PaymentId,
-                            client_id: int,
-                            client_settlement_status: ClientSettlementStatus,
-                            db = db_dependency):
-
-    for id in data.payments_id:
-        payment = db.query(Payment).filter(Payment.id == id).first()
-
-        if not payment:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail=f"El pago con id: {id} no se encuentra registrado en db")
 
-        payment.client_settlement_status = client_settlement_status
+@payment_route.put("/client_settled/{client_id}")
+def settling_payments(data: PaymentId,
+                      client_id: int,
+                      client_settlement_status: ClientSettlementStatus,
+                      db = db_dependency):
+    started = time.perf_counter()
+    payment_ids = list(dict.fromkeys(data.payments_id))
+
+    # Validación: una consulta por bloque trae el cliente y el estado de cada pago pedido
+    payments = _owned_payments(db, payment_ids, Delivery.client_id, client_id,
+                               "Algunos pagos no existen o no corresponden al cliente especificado",
+                               Payment.client_settlement_status)
+    # Los que ya están en ese estado no se tocan: un reintento tras un timeout responde 200
+    pending, already = _skip_already(payments, client_settlement_status)
+    pending_ids = [payment.id for payment in pending]
+
+    # Todos los bloques en una sola transacción; el filtro por cliente se repite por si cambió algo
+    client_deliveries = select(Delivery.id).where(Delivery.client_id == client_id)
+    updated = 0
+    for chunk in _chunks(pending_ids):
+        statement = update(Payment) \
+            .where(Payment.id.in_(chunk), Payment.delivery_id.in_(client_deliveries)) \
+            .values(client_settlement_status=client_settlement_status) \
+            .execution_options(synchronize_session=False)
+        with ledger.tracking(db, Payment.id.in_(chunk)):
+            updated += db.execute(statement).rowcount
+
+    # Estados de cuenta que quedan pagados (o vuelven a emitidos) con este cambio
+    for chunk in _chunks(pending_ids):
+        client_statements.refresh_paid(db, chunk)
 
-        db.flush()
-        db.commit()
+    db.commit()
+    elapsed = time.perf_counter() - started
 
     return {'status': "200",
             "msg": "pagos procesados exitosamente",
-            'pagos procesados': data.payments_id}
+            'pagos procesados': payment_ids,
+            "updated": updated,
+            "already_in_status": already,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "payments_per_second": round(updated / elapsed, 1) if elapsed and updated else 0}
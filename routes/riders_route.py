@@ -1,20 +1,27 @@
 import math
-from typing import List
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from auth.auth import hash_password, verify_password, create_access_token, SECRET_KEY, ALGORITHM, auth_user
-from db.db import db_dependency
+from db.db import db_dependency, async_db_dependency
 from models.models import User, Rider, Payment, Delivery
 from schemas.schemas import BikerCreate, BikerResponse, RiderResponseList, RiderSchema, DeliveryStanding, \
     SettlementStatus
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from auth.auth import oauth2_scheme
 from jose import JWTError, jwt
+from utils import rider_stats
 
 rider_route = APIRouter(prefix="/rider", tags=["Riders"])
 
+RECENT_DELIVERIES = 10
+
 
 @rider_route.get("/")
 async def get_all_riders(
@@ -137,26 +144,75 @@ async def get_rider_by_name(name: str, db=db_dependency):
 
 
 
+def _columnar(objects, model):
+    """Lista de objetos como una lista de valores por columna."""
+    return {column.key: [getattr(obj, column.key) for obj in objects] for column in model.__table__.columns}
+
+
 @rider_route.get("/actions")
-async def get_actions(db=db_dependency):
-    riders = (
-        db.query(Rider)
-        .options(
-            joinedload(Rider.deliveries).joinedload(Delivery.payments)  # Precarga Deliveries y Payments
-        )
-        .all()
-    )
+def get_actions(
+        response: Response,
+        page: int = 1,
+        size: int = Query(20, ge=1, le=100),
+        is_active: Optional[bool] = None,
+        deliveries_per_rider: int = Query(20, ge=1, le=500, description="Últimos N domicilios por rider"),
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        format: str = Query("nested", pattern="^(nested|columnar)$"),
+        db=db_dependency):
+
+    query = db.query(Rider)
+    if is_active is not None:
+        query = query.filter(Rider.is_active == is_active)
+
+    total = query.count()
+    riders = query.order_by(Rider.id).offset((page - 1) * size).limit(size).all()
 
     if not riders:
         raise HTTPException(status_code=404, detail="No riders found")
 
+    # Ventana de domicilios por rider: los N más recientes, opcionalmente dentro del rango de fechas
+    rank = func.row_number().over(partition_by=Delivery.rider_id,
+                                  order_by=(Delivery.created_at.desc(), Delivery.id.desc()))
+    window = select(Delivery.id, rank.label("position")) \
+        .where(Delivery.rider_id.in_([rider.id for rider in riders]))
+    if start_date:
+        window = window.where(Delivery.created_at >= start_date)
+    if end_date:
+        window = window.where(Delivery.created_at <= end_date)
+    window = window.subquery()
+
+    deliveries = db.query(Delivery) \
+        .options(selectinload(Delivery.payments)) \
+        .join(window, window.c.id == Delivery.id) \
+        .filter(window.c.position <= deliveries_per_rider) \
+        .order_by(Delivery.rider_id, window.c.position).all()
+
+    # El cuerpo sigue siendo la lista de riders: la paginación va en los headers
+    response.headers.update({"X-Total-Count": str(total), "X-Page": str(page), "X-Page-Size": str(size),
+                             "X-Total-Pages": str(math.ceil(total / size))})
+
+    if format == "columnar":
+        return {
+            "riders": _columnar(riders, Rider),
+            "deliveries": _columnar(deliveries, Delivery),
+            "payments": _columnar([payment for delivery in deliveries for payment in delivery.payments], Payment),
+        }
+
+    by_rider = defaultdict(list)
+    for delivery in deliveries:
+        by_rider[delivery.rider_id].append(delivery)
+    # Se fija la colección ya cargada para no disparar la carga completa de rider.deliveries
+    for rider in riders:
+        set_committed_value(rider, "deliveries", by_rider[rider.id])
+
     return riders
 
 
 @rider_route.get("/{rider_id}")
-async def get_rider_details(rider_id: int, db=db_dependency):
+async def get_rider_details(rider_id: int, db=async_db_dependency):
     # Obtener información básica del domiciliario
-    rider = db.query(Rider).filter(Rider.id == rider_id).first()
+    rider = await db.get(Rider, rider_id)
 
     if not rider:
         raise HTTPException(
@@ -164,25 +220,18 @@ async def get_rider_details(rider_id: int, db=db_dependency):
             detail="Domiciliario no encontrado"
         )
 
-    # Obtener los domicilios con sus pagos asociados
-    deliveries = db.query(Delivery).options(
-        joinedload(Delivery.payments)
-    ).filter(Delivery.rider_id == rider_id).all()
-
-    # Calcular estadísticas
-    total_deliveries = len(deliveries)
-    pending_deliveries = sum(1 for d in deliveries if d.state == DeliveryStanding.PENDING)
-    in_progress_deliveries = sum(1 for d in deliveries if d.state == DeliveryStanding.IN_PROGRESS)
-    completed_deliveries = sum(1 for d in deliveries if d.state == DeliveryStanding.DELIVERED)
+    # Estadísticas con consultas agrupadas (o de rider_stats si está activado)
+    activity_summary = await db.run_sync(rider_stats.summary, rider_id)
 
-    # Calcular ganancias totales
-    total_earnings = 0
-    pending_payments = 0
-    for delivery in deliveries:
-        for payment in delivery.payments:
-            total_earnings += payment.rider_amount
-            if payment.settlement_status == SettlementStatus.PENDING:
-                pending_payments += payment.rider_amount
+    # Los 10 domicilios más recientes con sus pagos y cliente precargados
+    deliveries = (await db.scalars(
+        select(Delivery).options(
+            selectinload(Delivery.payments),
+            joinedload(Delivery.client)
+        ).filter(Delivery.rider_id == rider_id)
+        .order_by(Delivery.created_at.desc(), Delivery.id.desc())
+        .limit(RECENT_DELIVERIES)
+    )).all()
 
     # Organizar datos para respuesta
     result = {
@@ -193,14 +242,7 @@ async def get_rider_details(rider_id: int, db=db_dependency):
             "plate": rider.plate,
             "is_active": rider.is_active
         },
-        "activity_summary": {
-            "total_deliveries": total_deliveries,
-            "pending_deliveries": pending_deliveries,
-            "in_progress_deliveries": in_progress_deliveries,
-            "completed_deliveries": completed_deliveries,
-            "total_earnings": total_earnings,
-            "pending_payments": pending_payments
-        },
+        "activity_summary": activity_summary,
         "recent_deliveries": [
             {
                 "id": delivery.id,
@@ -219,7 +261,7 @@ async def get_rider_details(rider_id: int, db=db_dependency):
                         "payment_status": payment.payment_status.value
                     } for payment in delivery.payments
                 ] if delivery.payments else []
-            } for delivery in deliveries[:10]  # Mostrar solo los 10 más recientes
+            } for delivery in deliveries
         ]
     }
 
@@ -0,0 +1,137 @@
+import asyncio
+import io
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, HTTPException, status, BackgroundTasks, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from db.db import SessionLocal
+from schemas.schemas import RiderStatementRequest
+from utils.statements import build_statements, statement_hash, render_statement, get_executor, \
+    statement_store, MEDIA_TYPES
+
+statement_route = APIRouter(prefix="/statements", tags=["Statements"])
+
+
+def _load_statements(start_date, end_date, rider_ids):
+    # Sesión propia: la de la petición ya se cerró cuando corre el trabajo
+    with SessionLocal() as db:
+        return build_statements(db, start_date, end_date, rider_ids)
+
+
+async def _run_statement_job(job, start_date, end_date, rider_ids, statement_format):
+    job["status"] = "running"
+    statement_store.save_job(job)
+
+    try:
+        statements = await run_in_threadpool(_load_statements, start_date, end_date, rider_ids)
+
+        # Solo se renderizan los extractos que no están ya en el caché de disco
+        loop = asyncio.get_running_loop()
+        renders = []
+        for statement in statements:
+            key = statement_hash(statement, statement_format)
+            cached = statement_store.has_file(key, statement_format)
+            job["statements"][str(statement["rider_id"])] = {
+                "rider_name": statement["rider_name"],
+                "file": key,
+                "cached": cached,
+                "totals": statement["totals"],
+            }
+            if not cached:
+                renders.append((key, loop.run_in_executor(get_executor(), render_statement,
+                                                          statement, statement_format)))
+
+        for key, render in renders:
+            statement_store.write_file(key, statement_format, await render)
+
+        job["status"] = "done"
+    except Exception as error:
+        job["status"] = "failed"
+        job["error"] = str(error)
+    finally:
+        job["finished_at"] = datetime.utcnow().isoformat()
+        statement_store.save_job(job)
+
+
+def _naive_utc(value):
+    """Fechas con zona a UTC sin zona, como se guardan created_at y utcnow()."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@statement_route.post("/riders", status_code=status.HTTP_202_ACCEPTED)
+async def create_rider_statements(request: RiderStatementRequest, background_tasks: BackgroundTasks):
+    end_date = _naive_utc(request.end_date) or datetime.utcnow()
+    start_date = _naive_utc(request.start_date) or end_date - timedelta(days=7)
+
+    if start_date >= end_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="start_date must be before end_date")
+
+    job = statement_store.new_job({
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "format": request.format.value,
+        "rider_ids": request.rider_ids,
+    })
+    background_tasks.add_task(_run_statement_job, job, start_date, end_date, request.rider_ids,
+                              request.format.value)
+
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+def _finished_job(job_id):
+    job = statement_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"job {job_id} not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"job {job_id} is {job['status']}")
+    return job
+
+
+def _statement_filename(job, rider_id):
+    params = job["params"]
+    return f"extracto_rider_{rider_id}_{params['start_date'][:10]}_{params['end_date'][:10]}.{params['format']}"
+
+
+@statement_route.get("/jobs/{job_id}")
+async def get_statement_job(job_id: str):
+    job = statement_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"job {job_id} not found")
+    return job
+
+
+@statement_route.get("/jobs/{job_id}/riders/{rider_id}")
+async def download_rider_statement(job_id: str, rider_id: int):
+    job = _finished_job(job_id)
+    entry = job["statements"].get(str(rider_id))
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"rider {rider_id} is not part of job {job_id}")
+
+    statement_format = job["params"]["format"]
+    return FileResponse(statement_store.file_path(entry["file"], statement_format),
+                        media_type=MEDIA_TYPES[statement_format],
+                        filename=_statement_filename(job, rider_id))
+
+
+@statement_route.get("/jobs/{job_id}/download")
+def download_statement_job(job_id: str):
+    # def y no async def: armar el zip lee cada archivo del disco y corre en el threadpool
+    job = _finished_job(job_id)
+    statement_format = job["params"]["format"]
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for rider_id, entry in job["statements"].items():
+            archive.write(statement_store.file_path(entry["file"], statement_format),
+                          _statement_filename(job, rider_id))
+
+    return Response(content=buffer.getvalue(), media_type="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="extractos_{job_id}.zip"'})
@@ -3,7 +3,8 @@ from fastapi.encoders import jsonable_encoder
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
-from auth.auth import hash_password, verify_password, create_access_token, auth_user
+from auth.auth import hash_password, verify_password, create_access_token, auth_user, invalidate_user, \
+    hash_password_async, verify_password_async
 from db.db import get_db, db_dependency
 from models.models import User
 from schemas.schemas import UserCreate, UserResponse, UserToUpdate, UserUpdated, UserRole
@@ -49,6 +50,7 @@ async def update_user(user_id, user_to_update: UserToUpdate,
                             detail="user not found in db")
 
     db_user = is_user
+    previous_username = db_user.username
 
     if user_to_update.username:
         db_user.username = user_to_update.username.lower()
@@ -58,6 +60,10 @@ async def update_user(user_id, user_to_update: UserToUpdate,
     db.commit()
     db.refresh(db_user)
 
+    # Los tokens emitidos con el username anterior dejan de ser válidos
+    if db_user.username != previous_username:
+        invalidate_user(previous_username)
+
     return db_user
 
 
@@ -66,21 +72,17 @@ async def update_user(user_id, user_to_update: UserToUpdate,
 async def update_password(new_password, old_password,
                           db = db_dependency, auth= Depends(auth_user)):
 
-    user_identity = db.query(User).filter(User.username == auth.username).first()
-
-    print(user_identity)
-
-    user_db = db.query(User).filter(User.id == user_identity.id).first()
+    user_db = db.query(User).filter(User.id == auth.id).first()
     if not user_db:
         raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail=f"user with id do not exist")
 
-    checking_pass = verify_password(old_password, user_db.hashed_password)
+    checking_pass = await verify_password_async(old_password, user_db.hashed_password)
     if not checking_pass:
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED,
                             detail = f"user o password invalid")
 
     if checking_pass:
-        new_hashed_password = hash_password(new_password)
+        new_hashed_password = await hash_password_async(new_password)
         user_db.hashed_password = new_hashed_password
 
         db.commit()
@@ -92,8 +94,7 @@ async def update_password(new_password, old_password,
 @user_route.delete("/delete_user")
 async def delete_user(id_to_delete, auth = Depends(auth_user), db = db_dependency):
 
-    identity_user = db.query(User).filter(User.username == auth.username).first()
-    if not identity_user.role == UserRole.ADMIN:
+    if not auth.role == UserRole.ADMIN:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="FORBIDEN, YOU MUST BE ADMIN")
 
     user_to_deactive = db.query(User).filter(User.id == id_to_delete).first()
@@ -106,6 +107,8 @@ async def delete_user(id_to_delete, auth = Depends(auth_user), db = db_dependenc
         user_to_deactive.is_active = False
         db.commit()
 
+        invalidate_user(user_to_deactive.username)
+
         return {
             "status": status.HTTP_200_OK,
             "msg": "User was deleted"
@@ -37,6 +37,12 @@ class DeliveryLocations(str, Enum):
 
 
 
+class PackageSize(str, Enum):
+    SMALL = "SMALL"
+    MEDIUM = "MEDIUM"
+    LARGE = "LARGE"
+
+
 class UserRole(Enum):
     ADMIN = "Admin",
     RIDER = "Rider",
@@ -80,6 +86,21 @@ class ClientSettlementStatus(str, Enum):
     CANCELLED = "CANCELLED"
 
 
+class SettlementBatchKind(str, Enum):
+    RIDER_SETTLEMENT = "RIDER_SETTLEMENT"
+    CLIENT_RECEIPT = "CLIENT_RECEIPT"
+
+
+class ClientStatementStatus(str, Enum):
+    ISSUED = "ISSUED"
+    PAID = "PAID"
+
+
+class StatementFormat(str, Enum):
+    PDF = "pdf"
+    CSV = "csv"
+
+
 class Etiqueta(BaseModel):
     client_id: int
     rider_id: int
@@ -94,8 +115,18 @@ class Etiqueta(BaseModel):
     state: str
 
 
+class LabelBatch(BaseModel):
+    delivery_ids: List[int] | None = None
+    state: DeliveryStanding | None = None
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    labels_per_sheet: int = Field(1, ge=1, le=2)
+
+
 class TokenData(BaseModel):
     username: str | None = None
+    id: int | None = None
+    role: UserRole | None = None
 
 
 class UserCreate(BaseModel):
@@ -146,6 +177,7 @@ class CreatePackage(BaseModel):
     receptor_number: int
     delivery_address: str
     delivery_location: DeliveryLocations = DeliveryLocations.MEDELLIN
+    package_size: PackageSize = PackageSize.SMALL
     state: DeliveryStanding = DeliveryStanding.PENDING
     delivery_total_amount: float
     monto_domicilio: float
@@ -154,6 +186,64 @@ class CreatePackage(BaseModel):
     delivery_date: datetime | None = None
 
 
+class BulkPackage(CreatePackage):
+    client_id: int
+    rider_id: int | None = None
+    # Sin valor se calculan con las reglas de tarifa
+    total_amount: float | None = None
+    coop_amount: float | None = None
+
+
+class RiderStatementRequest(BaseModel):
+    # Sin fechas: los últimos 7 días
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    format: StatementFormat = StatementFormat.PDF
+    rider_ids: List[int] | None = None
+
+
+class ClientStatementClose(BaseModel):
+    # Sin fechas: el último periodo completo de CLIENT_STATEMENT_PERIOD
+    period_start: datetime | None = None
+    period_end: datetime | None = None
+    client_ids: List[int] | None = None
+    render_invoices: bool = True
+
+
+class FeeRuleCreate(BaseModel):
+    # None en zona, cliente o tamaño hace que la regla aplique a todos
+    delivery_location: DeliveryLocations | None = None
+    client_id: int | None = None
+    package_size: PackageSize | None = None
+    valid_from: datetime = Field(default_factory=datetime.utcnow)
+    valid_to: datetime | None = None
+    total_amount: float = Field(..., ge=0)
+    coop_amount: float = Field(..., ge=0)
+
+
+class FeeRuleResponse(FeeRuleCreate):
+    id: int
+    version: int
+    is_active: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class FeeReprice(BaseModel):
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    client_id: int | None = None
+    delivery_location: DeliveryLocations | None = None
+    dry_run: bool = True
+
+
+class BulkRiderAssignment(BaseModel):
+    rider_id: int
+    delivery_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
 class PackageResponse(BaseModel):
     id: int
     client_id: int
@@ -0,0 +1,133 @@
+"""Benchmark de concurrencia: sesión sync dentro de async def contra la sesión async.
+
+Lanza peticiones concurrentes contra la app en proceso (httpx + ASGITransport, un
+solo event loop como en un worker de uvicorn) y reporta p50/p99 y peticiones por
+segundo de:
+    sync   GET /deliveries/filtered  (Session sync: cada consulta bloquea el loop)
+    async  GET /deliveries/          (AsyncSession: el loop atiende otras peticiones)
+Las dos devuelven la misma página de domicilios con rider, cliente y pagos. Mientras
+corre la carga se mide también el retraso de un endpoint trivial (/token/metrics)
+consultado cada 10 ms, contado desde que debía salir la consulta: es lo que espera
+cualquier otra petición cuando las consultas bloquean el loop.
+
+Con la sesión sync, una concurrencia mayor que DB_POOL_SIZE + DB_MAX_OVERFLOW deja
+el loop esperando una conexión del pool que solo se libera en el mismo loop; por eso
+la concurrencia por defecto es 10.
+
+Uso:
+    python scripts/bench_async_db.py --deliveries 5000 --requests 400 --concurrency 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_TMP_DIR = tempfile.mkdtemp(prefix="domicilios-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/domicilios.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["FEE_RULES_RELOAD_SECONDS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from db.db import SessionLocal  # noqa: E402
+from models.models import Client, Rider, Delivery, Payment  # noqa: E402
+from schemas.schemas import DeliveryStanding  # noqa: E402
+
+ENDPOINTS = {
+    "sync": ("/deliveries/filtered", {"time_period": "custom", "start_date": "2000-01-01T00:00:00"}),
+    "async": ("/deliveries/", {}),
+}
+PROBE_INTERVAL = 0.01
+
+
+def seed(deliveries):
+    with SessionLocal() as db:
+        client = Client(client_name="cliente", phone="300", address="calle 1", account_number="1", bank="banco")
+        rider = Rider(name="rider", phone="310", plate="ABC123")
+        db.add_all([client, rider])
+        db.flush()
+        start = datetime(2025, 1, 1)
+        for i in range(deliveries):
+            delivery = Delivery(client_id=client.id, rider_id=rider.id, package_name="paquete",
+                                receptor_name="receptor", receptor_number=1, delivery_address=f"calle {i}",
+                                state=DeliveryStanding.DELIVERED, delivery_total_amount=12000,
+                                created_at=start + timedelta(minutes=i))
+            delivery.payments = [Payment(total_amount=12000, rider_amount=10000, coop_amount=2000,
+                                         created_at=delivery.created_at)]
+            db.add(delivery)
+        db.commit()
+
+
+async def run(name, requests, concurrency, size):
+    path, params = ENDPOINTS[name]
+    params = {**params, "size": size}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, probes = [], []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, params=params)
+                latencies.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+
+        async def probe():
+            # Desde que la sonda debía salir: incluye lo que el loop tardó en despertarla
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL)
+                await client.get("/token/metrics")
+                probes.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+        async def load():
+            await asyncio.gather(*(one() for _ in range(requests)))
+            done.set()
+
+        await one()  # calentamiento
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(load(), probe())
+        elapsed = time.perf_counter() - started
+
+    return {
+        **percentiles(latencies),
+        "req_per_s": requests / elapsed,
+        "probe": percentiles(probes),
+    }
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deliveries", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--size", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.deliveries)
+    print(f"{args.deliveries} domicilios, {args.requests} peticiones, concurrencia {args.concurrency}")
+    for name in ENDPOINTS:
+        result = asyncio.run(run(name, args.requests, args.concurrency, args.size))
+        print(f"{name:>6}: p50 {result['p50_ms']:8.1f} ms   p99 {result['p99_ms']:8.1f} ms   "
+              f"{result['req_per_s']:7.1f} req/s   /token/metrics p50 {result['probe']['p50_ms']:6.1f} ms "
+              f"p99 {result['probe']['p99_ms']:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,92 @@
+"""Benchmark de PUT /payments/client_settled: pago por pago contra UPDATE por bloques.
+
+Crea los pagos de un cliente en una base SQLite temporal y marca SETTLED la mitad
+con cada estrategia, reportando tiempo total y pagos por segundo:
+    loop  SELECT, flush y commit por cada pago (el handler anterior)
+    set   el endpoint actual: validación y UPDATE ... WHERE id IN (...) por bloques
+Al final se verifica que el ledger cuadre con los pagos (ledger.check).
+
+Uso:
+    python scripts/bench_client_settle.py --payments 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_TMP_DIR = tempfile.mkdtemp(prefix="domicilios-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/domicilios.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["FEE_RULES_RELOAD_SECONDS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from db.db import SessionLocal  # noqa: E402
+from models.models import Client, Rider, Delivery, Payment  # noqa: E402
+from schemas.schemas import DeliveryStanding, ClientSettlementStatus  # noqa: E402
+from utils import ledger  # noqa: E402
+
+
+def seed(payments):
+    with SessionLocal() as db:
+        client = Client(client_name="cliente", phone="300", address="calle 1", account_number="1", bank="banco")
+        rider = Rider(name="rider", phone="310", plate="ABC123")
+        db.add_all([client, rider])
+        db.flush()
+        start = datetime(2025, 1, 1)
+        rows = []
+        for i in range(payments):
+            delivery = Delivery(client_id=client.id, rider_id=rider.id, package_name="paquete",
+                                receptor_name="receptor", receptor_number=1, delivery_address=f"calle {i}",
+                                state=DeliveryStanding.DELIVERED, delivery_total_amount=12000,
+                                created_at=start + timedelta(minutes=i))
+            delivery.payments = [Payment(total_amount=12000, rider_amount=10000, coop_amount=2000,
+                                         created_at=delivery.created_at)]
+            rows.append(delivery)
+        db.add_all(rows)
+        db.commit()
+        return client.id, [delivery.payments[0].id for delivery in rows]
+
+
+def settle_loop(client_id, payment_ids):
+    with SessionLocal() as db:
+        for payment_id in payment_ids:
+            payment = db.query(Payment).filter(Payment.id == payment_id).first()
+            payment.client_settlement_status = ClientSettlementStatus.SETTLED
+            db.flush()
+            db.commit()
+
+
+def settle_set(client_id, payment_ids):
+    with TestClient(main.app) as client:
+        response = client.put(f"/payments/client_settled/{client_id}",
+                              params={"client_settlement_status": ClientSettlementStatus.SETTLED.value},
+                              json={"payments_id": payment_ids})
+        response.raise_for_status()
+
+
+STRATEGIES = {"loop": settle_loop, "set": settle_set}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=1000)
+    args = parser.parse_args()
+
+    client_id, payment_ids = seed(args.payments)
+    half = len(payment_ids) // 2
+    batches = {"loop": payment_ids[:half], "set": payment_ids[half:]}
+
+    print(f"{args.payments} pagos de un cliente, {half} por estrategia")
+    for name, settle in STRATEGIES.items():
+        started = time.perf_counter()
+        settle(client_id, batches[name])
+        elapsed = time.perf_counter() - started
+        print(f"{name:>5}: {elapsed * 1000:8.1f} ms   {len(batches[name]) / elapsed:8.1f} pagos/s")
+
+    with SessionLocal() as db:
+        print("ledger.check:", ledger.check(db) or "ok")
@@ -0,0 +1,112 @@
+"""Benchmark de /token: bcrypt en el pool de hashing contra bcrypt en el event loop.
+
+Lanza logins concurrentes contra la app en proceso (httpx + ASGITransport, un solo
+event loop como en un worker de uvicorn) y reporta logins por segundo, p50/p99 del
+login y el retraso de un endpoint trivial (/token/metrics) consultado cada 10 ms
+durante la carga, que incluye el tiempo que el loop pasó bloqueado:
+    inline  verify_and_update llamado directamente en el loop (antes)
+    pool    verify_and_update en el pool de PASSWORD_HASH_WORKERS hilos (ahora)
+
+Uso:
+    python scripts/bench_login.py --logins 64 --concurrency 16 --rounds 12 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--logins", type=int, default=64)
+parser.add_argument("--concurrency", type=int, default=16)
+parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS")
+parser.add_argument("--workers", type=int, default=4, help="PASSWORD_HASH_WORKERS")
+args = parser.parse_args()
+
+_TMP_DIR = tempfile.mkdtemp(prefix="domicilios-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/domicilios.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["FEE_RULES_RELOAD_SECONDS"] = "0"
+os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+# Sin límite de intentos: se mide bcrypt, no el limitador
+os.environ["LOGIN_USER_CAPACITY"] = os.environ["LOGIN_IP_CAPACITY"] = str(args.logins * 4)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from auth.auth import pwd_context, hash_password, verify_and_update_password_async  # noqa: E402
+from db.db import SessionLocal  # noqa: E402
+from models.models import User  # noqa: E402
+from routes import auth as auth_routes  # noqa: E402
+
+USERS = 8
+PASSWORD = "clave-de-prueba"
+PROBE_INTERVAL = 0.01
+
+
+async def verify_inline(plain_password, hashed_password):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+MODES = {"inline": verify_inline, "pool": verify_and_update_password_async}
+
+
+def seed():
+    hashed = hash_password(PASSWORD)
+    with SessionLocal() as db:
+        db.add_all([User(username=f"usuario{i}", email=f"usuario{i}@example.com", hashed_password=hashed)
+                    for i in range(USERS)])
+        db.commit()
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+async def run(mode):
+    auth_routes.verify_and_update_password_async = MODES[mode]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    logins, probes = [], []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def login(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/token", data={"username": f"usuario{i % USERS}",
+                                                             "password": PASSWORD})
+                logins.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+
+        async def probe():
+            # Desde que la sonda debía salir: incluye lo que el loop tardó en despertarla
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL)
+                await client.get("/token/metrics")
+                probes.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+        async def load():
+            await asyncio.gather(*(login(i) for i in range(args.logins)))
+            done.set()
+
+        started = time.perf_counter()
+        await asyncio.gather(load(), probe())
+        elapsed = time.perf_counter() - started
+
+    return args.logins / elapsed, percentiles(logins), percentiles(probes)
+
+
+if __name__ == "__main__":
+    seed()
+    print(f"{args.logins} logins, concurrencia {args.concurrency}, bcrypt rounds {args.rounds}, "
+          f"{args.workers} hilos de hashing")
+    for mode in MODES:
+        rate, (p50, p99), (probe_p50, probe_p99) = asyncio.run(run(mode))
+        print(f"{mode:>6}: {rate:6.1f} logins/s   p50 {p50:7.1f} ms   p99 {p99:7.1f} ms   "
+              f"/token/metrics p50 {probe_p50:6.1f} ms p99 {probe_p99:7.1f} ms")
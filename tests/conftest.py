@@ -0,0 +1,118 @@
+import os
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+# Base de datos y archivos en un directorio temporal, antes de importar la app
+_TMP_DIR = tempfile.mkdtemp(prefix="domicilios-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/domicilios.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["STATEMENT_DIR"] = os.path.join(_TMP_DIR, "statements")
+os.environ["FEE_RULES_RELOAD_SECONDS"] = "0"
+os.environ["CLIENT_STATEMENT_PERIOD"] = ""
+# Contadores por rider activos: sus listeners corren en todas las pruebas
+os.environ["RIDER_STATS_COUNTERS"] = "true"
+# Costo mínimo de bcrypt: las pruebas de login no miden hashing
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import main  # noqa: E402
+from db.db import Base, SessionLocal, engine, async_engine  # noqa: E402
+from models.models import Client, Rider, Delivery, Payment  # noqa: E402
+from schemas.schemas import DeliveryStanding, PaymentStatus, SettlementStatus, ClientSettlementStatus, \
+    PaymentType  # noqa: E402
+
+START = datetime(2025, 1, 1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    # Cada prueba arranca con las tablas vacías
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _seed_payments(db, n, clients=3, riders=2, seed=1, **fixed):
+    """Crea n domicilios con un pago cada uno y estados al azar (o fijos en ``fixed``)."""
+    rnd = random.Random(seed)
+    client_rows = [Client(client_name=f"cliente {i}", phone=str(3000000000 + i), address="calle 1",
+                          account_number="123", bank="banco") for i in range(clients)]
+    rider_rows = [Rider(name=f"rider {i}", phone=str(3100000000 + i), plate=f"ABC{i:03d}") for i in range(riders)]
+    db.add_all(client_rows + rider_rows)
+    db.flush()
+
+    deliveries = []
+    for i in range(n):
+        created_at = START + timedelta(hours=i)
+        delivery = Delivery(
+            client_id=rnd.choice(client_rows).id,
+            rider_id=rnd.choice(rider_rows).id,
+            package_name="paquete", receptor_name="receptor", receptor_number=1,
+            delivery_address=f"calle {i}",
+            state=fixed.get("state", rnd.choice(list(DeliveryStanding))),
+            delivery_total_amount=50000,
+            created_at=created_at,
+        )
+        delivery.payments = [Payment(
+            total_amount=rnd.choice([10000, 50000]), rider_amount=8000, coop_amount=2000,
+            settlement_status=fixed.get("settlement_status", rnd.choice(list(SettlementStatus))),
+            payment_status=fixed.get("payment_status", rnd.choice(list(PaymentStatus))),
+            client_settlement_status=fixed.get("client_settlement_status",
+                                               rnd.choice(list(ClientSettlementStatus))),
+            payment_type=rnd.choice(list(PaymentType)),
+            created_at=created_at,
+        )]
+        deliveries.append(delivery)
+
+    db.add_all(deliveries)
+    db.commit()
+    return {"clients": [row.id for row in client_rows], "riders": [row.id for row in rider_rows],
+            "deliveries": [row.id for row in deliveries]}
+
+
+@pytest.fixture
+def seed(db):
+    return lambda n, **options: _seed_payments(db, n, **options)
+
+
+@contextmanager
+def _count_queries():
+    """Cuenta las sentencias SQL ejecutadas por los motores sync y async."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def count_queries():
+    return _count_queries
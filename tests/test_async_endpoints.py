@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from db.db import engine, async_engine
+
+
+@contextmanager
+def statements_by_engine():
+    counts = {"sync": 0, "async": 0}
+
+    def counter(name):
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            counts[name] += 1
+        return before_cursor_execute
+
+    listeners = [(engine, counter("sync")), (async_engine.sync_engine, counter("async"))]
+    for target, listener in listeners:
+        event.listen(target, "before_cursor_execute", listener)
+    try:
+        yield counts
+    finally:
+        for target, listener in listeners:
+            event.remove(target, "before_cursor_execute", listener)
+
+
+@pytest.mark.parametrize("path", ["/deliveries/", "/payments/dashboard", "/payments/dashboard?mode=single_pass",
+                                  "/rider/{rider_id}"])
+def test_hot_reads_use_only_the_async_engine(db, seed, client, path):
+    ids = seed(50)
+
+    with statements_by_engine() as counts:
+        response = client.get(path.format(rider_id=ids["riders"][0]))
+
+    assert response.status_code == 200
+    assert counts["async"] > 0
+    # Ninguna consulta en el motor sync, que bloquearía el event loop
+    assert counts["sync"] == 0
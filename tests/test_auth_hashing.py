@@ -0,0 +1,82 @@
+import threading
+
+from passlib.context import CryptContext
+from sqlalchemy import event
+
+from auth import auth
+from db.db import engine
+from models.models import User
+
+PASSWORD = "clave-de-prueba"
+
+
+def add_user(db, username, hashed_password):
+    db.add(User(username=username, email=f"{username}@example.com", hashed_password=hashed_password))
+    db.commit()
+
+
+def login(client, username, password=PASSWORD):
+    return client.post("/token", data={"username": username, "password": password})
+
+
+def test_login_rehashes_password_with_current_rounds(db, client):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=auth.BCRYPT_ROUNDS + 1).hash(PASSWORD)
+    add_user(db, "rehash", old_hash)
+
+    response = login(client, "rehash")
+
+    assert response.status_code == 200
+    db.expire_all()
+    new_hash = db.query(User.hashed_password).filter(User.username == "rehash").scalar()
+    assert new_hash != old_hash
+    assert new_hash.split("$")[2] == f"{auth.BCRYPT_ROUNDS:02d}"
+    assert auth.verify_password(PASSWORD, new_hash)
+    assert not auth.pwd_context.needs_update(new_hash)
+
+
+def test_login_keeps_hash_with_current_rounds(db, client):
+    current_hash = auth.hash_password(PASSWORD)
+    add_user(db, "vigente", current_hash)
+
+    assert login(client, "vigente").status_code == 200
+    assert login(client, "vigente", "otra-clave").status_code == 401
+
+    db.expire_all()
+    assert db.query(User.hashed_password).filter(User.username == "vigente").scalar() == current_hash
+
+
+def test_login_verifies_password_in_hashing_pool(db, client, monkeypatch):
+    add_user(db, "pool", auth.hash_password(PASSWORD))
+    threads = []
+    verify_and_update = auth.pwd_context.verify_and_update
+
+    def recording_verify_and_update(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return verify_and_update(*args, **kwargs)
+
+    monkeypatch.setattr(auth.pwd_context, "verify_and_update", recording_verify_and_update)
+
+    assert login(client, "pool").status_code == 200
+    # bcrypt corre en un hilo del pool, no en el del event loop
+    assert len(threads) == 1
+    assert threads[0].startswith("bcrypt")
+
+
+def test_login_uses_only_the_async_engine(db, client):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=auth.BCRYPT_ROUNDS + 1).hash(PASSWORD)
+    add_user(db, "async", old_hash)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Consulta del usuario y commit del re-hash, ninguno en el motor sync
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        assert login(client, "async").status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert statements == []
+    db.expire_all()
+    assert db.query(User.hashed_password).filter(User.username == "async").scalar() != old_hash
@@ -0,0 +1,86 @@
+from models.models import Payment, Delivery
+from routes.payment_route import SETTLE_CHUNK_SIZE
+from schemas.schemas import ClientSettlementStatus
+from utils import ledger
+
+
+def client_payment_ids(db, client_id, *filters):
+    return [payment_id for payment_id, in db.query(Payment.id).join(Delivery)
+            .filter(Delivery.client_id == client_id, *filters).order_by(Payment.id)]
+
+
+def settle(client, client_id, payment_ids, settlement_status=ClientSettlementStatus.SETTLED):
+    return client.put(f"/payments/client_settled/{client_id}",
+                      params={"client_settlement_status": settlement_status.value},
+                      json={"payments_id": payment_ids})
+
+
+def assert_ledger_consistent(db):
+    assert ledger.check(db) == []
+    assert ledger.summary_for_mode(db, "ledger") == ledger.summary_for_mode(db, "single_pass")
+
+
+def test_settles_in_chunks_with_one_update_per_chunk(db, seed, client, count_queries):
+    ids = seed(SETTLE_CHUNK_SIZE * 2 + 100, clients=1, client_settlement_status=ClientSettlementStatus.PENDING)
+    client_id = ids["clients"][0]
+    payment_ids = client_payment_ids(db, client_id)
+
+    with count_queries() as statements:
+        # Los ids repetidos se descartan
+        response = settle(client, client_id, payment_ids + payment_ids[:10])
+
+    assert response.status_code == 200
+    assert response.json()["updated"] == len(payment_ids)
+    updates = [statement for statement in statements
+               if statement.startswith("UPDATE payments SET") and "client_settlement_status" in statement]
+    assert len(updates) == 3
+
+    db.expire_all()
+    assert client_payment_ids(db, client_id,
+                              Payment.client_settlement_status != ClientSettlementStatus.SETTLED) == []
+    assert_ledger_consistent(db)
+
+
+def test_rejects_foreign_and_missing_ids_without_updating(db, seed, client):
+    ids = seed(60, clients=2, client_settlement_status=ClientSettlementStatus.PENDING)
+    own, other = ids["clients"]
+    own_ids = client_payment_ids(db, own)
+    other_ids = client_payment_ids(db, other)
+    missing_id = max(own_ids + other_ids) + 1
+
+    response = settle(client, own, own_ids + other_ids[:2] + [missing_id])
+
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["missing"] == [missing_id]
+    assert sorted(detail["other_client"]) == other_ids[:2]
+
+    # Todo o nada: ningún pago cambió
+    db.expire_all()
+    assert client_payment_ids(db, own, Payment.client_settlement_status == ClientSettlementStatus.SETTLED) == []
+    assert_ledger_consistent(db)
+
+
+def test_retry_skips_ids_already_in_the_requested_status(db, seed, client, count_queries):
+    ids = seed(40, clients=1, client_settlement_status=ClientSettlementStatus.PENDING)
+    client_id = ids["clients"][0]
+    payment_ids = client_payment_ids(db, client_id)
+
+    assert settle(client, client_id, payment_ids[:5]).status_code == 200
+    # Un reintento con ids ya liquidados responde 200 y solo cambia los demás
+    response = settle(client, client_id, payment_ids)
+
+    assert response.status_code == 200
+    assert response.json()["updated"] == len(payment_ids) - 5
+    assert response.json()["already_in_status"] == payment_ids[:5]
+    db.expire_all()
+    assert client_payment_ids(db, client_id,
+                              Payment.client_settlement_status != ClientSettlementStatus.SETTLED) == []
+    assert_ledger_consistent(db)
+
+    with count_queries() as statements:
+        response = settle(client, client_id, payment_ids)
+    assert response.json()["updated"] == 0
+    assert response.json()["already_in_status"] == payment_ids
+    assert not [statement for statement in statements if statement.startswith("UPDATE")]
+    assert_ledger_consistent(db)
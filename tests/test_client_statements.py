@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from models.models import ClientStatement, Payment, Delivery
+from schemas.schemas import ClientStatementStatus
+from utils import client_statements
+
+
+def close(client, **body):
+    return client.post("/payments/client-statements/close", json={"render_invoices": False, **body})
+
+
+def test_close_without_dates_uses_last_complete_period(db, seed, client):
+    seed(30, clients=2, client_settlement_status="PENDING")
+    start, end = client_statements.last_complete_period(client_statements.CLIENT_STATEMENT_PERIOD or "monthly")
+
+    response = close(client)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert datetime.fromisoformat(report["period_start"]) == start
+    assert datetime.fromisoformat(report["period_end"]) == end
+    assert report["statement_ids"]
+    assert {(row.period_start, row.period_end) for row in db.query(ClientStatement)} == {(start, end)}
+
+
+def test_close_fills_only_the_missing_date(db, client):
+    start, end = client_statements.last_complete_period(client_statements.CLIENT_STATEMENT_PERIOD or "monthly")
+
+    response = close(client, period_start=datetime(2025, 1, 1).isoformat())
+    assert response.status_code == 200
+    assert datetime.fromisoformat(response.json()["period_end"]) == end
+
+    # Un inicio posterior al fin por defecto sigue siendo un rango inválido
+    response = close(client, period_start=end.isoformat())
+    assert response.status_code == 400
+
+
+def test_close_rejects_inverted_range(db, client):
+    response = close(client, period_start="2025-02-01T00:00:00", period_end="2025-01-01T00:00:00")
+    assert response.status_code == 400
+
+
+PERIOD_END = datetime(2025, 1, 1, 12)
+
+
+def seed_billable(seed, n=24):
+    # Entregados, liquidados con el rider y pendientes con el cliente: todos facturables
+    ids = seed(n, clients=1, state="DELIVERED", settlement_status="SETTLED", payment_status="OFFICE",
+               client_settlement_status="PENDING")
+    return ids["clients"][0]
+
+
+def payments_of(db, client_id, *filters):
+    return db.query(Payment).join(Delivery).filter(Delivery.client_id == client_id, *filters) \
+        .order_by(Payment.id).all()
+
+
+def client_row(client, client_id):
+    rows = [row for row in client.get("/payments/clients-payments").json() if row["client_id"] == client_id]
+    return rows[0] if rows else None
+
+
+def statement_status(db, statement_id):
+    db.expire_all()
+    return db.get(ClientStatement, statement_id).status
+
+
+def test_clients_payments_adds_frozen_statement_lines_and_live_payments(db, seed, client):
+    client_id = seed_billable(seed)
+    response = close(client, period_start="2024-12-01T00:00:00", period_end=PERIOD_END.isoformat())
+    statement_id, = response.json()["statement_ids"]
+    statement = db.get(ClientStatement, statement_id)
+    billed = payments_of(db, client_id, Payment.created_at < PERIOD_END)
+    live = payments_of(db, client_id, Payment.created_at >= PERIOD_END)
+    assert statement.total_deliveries == len(billed) and live
+
+    # Cambiar un pago ya facturado no altera el estado de cuenta emitido
+    billed[0].total_amount += 99999
+    db.commit()
+
+    row = client_row(client, client_id)
+    assert row["total_deliveries"] == len(billed) + len(live)
+    assert row["total_amount"] == statement.total_amount + sum(payment.total_amount for payment in live)
+    assert [entry["id"] for entry in row["statements"]] == [statement_id]
+    assert row["payment_ids_list"] == [payment.id for payment in billed + live]
+
+
+def test_statement_moves_between_issued_and_paid_with_client_settlement(db, seed, client):
+    client_id = seed_billable(seed)
+    statement_id, = close(client, period_start="2024-12-01T00:00:00",
+                          period_end=PERIOD_END.isoformat()).json()["statement_ids"]
+    billed = [payment.id for payment in payments_of(db, client_id, Payment.created_at < PERIOD_END)]
+    live = [payment.id for payment in payments_of(db, client_id, Payment.created_at >= PERIOD_END)]
+    assert statement_status(db, statement_id) == ClientStatementStatus.ISSUED
+
+    response = client.put(f"/payments/client_settled/{client_id}", json={"payments_id": billed},
+                          params={"client_settlement_status": "SETTLED"})
+    assert response.status_code == 200
+    assert statement_status(db, statement_id) == ClientStatementStatus.PAID
+    row = client_row(client, client_id)
+    assert row["statements"] == [] and row["payment_ids_list"] == live
+
+    # Un pago que vuelve a PENDING reabre el estado de cuenta y reaparece en el saldo
+    response = client.patch(f"/payments/{billed[0]}", json={"client_settlement_status": "PENDING"})
+    assert response.status_code == 200
+    assert statement_status(db, statement_id) == ClientStatementStatus.ISSUED
+    row = client_row(client, client_id)
+    assert [entry["id"] for entry in row["statements"]] == [statement_id]
+    assert row["payment_ids_list"] == [billed[0]] + live
+    assert row["total_deliveries"] == 1 + len(live)
+
+    response = client.patch(f"/payments/{billed[0]}", json={"client_settlement_status": "SETTLED"})
+    assert response.status_code == 200
+    assert statement_status(db, statement_id) == ClientStatementStatus.PAID
+    assert client_row(client, client_id)["payment_ids_list"] == live
@@ -0,0 +1,33 @@
+from models.models import Payment, Delivery
+from schemas.schemas import ClientSettlementStatus
+
+
+def clients_payments(client, count_queries):
+    with count_queries() as statements:
+        response = client.get("/payments/clients-payments")
+    assert response.status_code == 200
+    return response.json(), len(statements)
+
+
+def test_query_count_does_not_grow_with_payments_or_clients(db, seed, client, count_queries):
+    seed(30, clients=2)
+    small, small_queries = clients_payments(client, count_queries)
+
+    seed(600, clients=15, seed=2)
+    large, large_queries = clients_payments(client, count_queries)
+
+    assert len(large) > len(small)
+    assert large_queries == small_queries
+
+
+def test_payment_ids_are_listed_per_client(db, seed, client, count_queries):
+    seed(200, clients=4)
+    rows, _ = clients_payments(client, count_queries)
+
+    for row in rows:
+        expected = [payment_id for payment_id, in db.query(Payment.id).join(Delivery)
+                    .filter(Delivery.client_id == row["client_id"],
+                            Payment.client_settlement_status != ClientSettlementStatus.SETTLED)
+                    .order_by(Payment.id)]
+        assert row["payment_ids_list"] == expected
+        assert row["saldo_neto"] == row["yo_le_debo_al_cliente"] - row["cliente_me_debe"]
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from routes.delivery_route import _encode_cursor, _decode_cursor
+from models.models import Delivery
+
+
+@pytest.mark.parametrize("size", [5, 50, 200])
+def test_deliveries_by_status_runs_fixed_queries_per_page(db, seed, client, count_queries, size):
+    seed(300, state="DELIVERED")
+
+    with count_queries() as statements:
+        response = client.get("/deliveries/get_deliveries_by_status",
+                              params={"delivery_status": "DELIVERED", "size": size})
+
+    assert response.status_code == 200
+    assert len(response.json()) == size
+    # Un solo SELECT de domicilios con su cliente, sin consultas por fila
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize("size", [5, 50, 200])
+def test_paginated_listing_runs_fixed_queries_per_page(db, seed, client, count_queries, size):
+    seed(300)
+
+    with count_queries() as statements:
+        response = client.get("/deliveries/filtered", params={"time_period": "custom",
+                                                              "start_date": "2024-12-01T00:00:00",
+                                                              "size": size})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == size
+    # Conteo, página con rider y cliente, y pagos con selectinload
+    assert len(statements) == 3
+
+    with count_queries() as statements:
+        response = client.get("/deliveries/filtered", params={"time_period": "custom",
+                                                              "start_date": "2024-12-01T00:00:00",
+                                                              "size": size, "include_total": False,
+                                                              "cursor": response.json()["next_cursor"]})
+    assert response.status_code == 200
+    assert len(statements) == 2
+
+
+def test_cursor_round_trip():
+    delivery = Delivery(id=42, created_at=datetime(2025, 3, 4, 5, 6, 7, 890))
+    assert _decode_cursor(_encode_cursor(delivery)) == (delivery.created_at, 42)
+
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("no-es-un-cursor")
+    assert error.value.status_code == 400
+
+
+def test_cursor_pages_cover_every_delivery_once(db, seed, client):
+    ids = seed(95)
+
+    seen, cursor = [], None
+    while True:
+        params = {"size": 20, "include_total": False}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/deliveries/", params=params).json()
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    # Del más reciente al más antiguo, sin repetidos ni saltos
+    assert seen == sorted(ids["deliveries"], reverse=True)
@@ -0,0 +1,48 @@
+from utils.labels import LabelCache
+
+
+def pdf(size=100):
+    return b"%" * size
+
+
+def test_memory_eviction_prunes_delivery_index():
+    cache = LabelCache(max_bytes=300)
+
+    for delivery_id in range(50):
+        cache.put(f"etiqueta-{delivery_id}", pdf(), [delivery_id])
+
+    # Sin disco: lo que sale de memoria sale del caché y del índice
+    assert cache.stats()["memory_entries"] == 3
+    assert set(cache._by_delivery) == {47, 48, 49}
+    assert set(cache._deliveries_by_key) == {"etiqueta-47", "etiqueta-48", "etiqueta-49"}
+
+
+def test_disk_cap_prunes_delivery_index_and_spilled_entries_stay(tmp_path):
+    cache = LabelCache(max_bytes=200, spill_dir=str(tmp_path), max_disk_entries=4)
+
+    for delivery_id in range(30):
+        cache.put(f"etiqueta-{delivery_id}", pdf(), [delivery_id])
+
+    stats = cache.stats()
+    assert (stats["memory_entries"], stats["disk_entries"]) == (2, 4)
+    assert stats["indexed_deliveries"] == 6
+    assert set(cache._by_delivery) == set(range(24, 30))
+    assert len(list(tmp_path.iterdir())) == 4
+
+    # Una entrada en disco vuelve a memoria y sigue indexada
+    assert cache.get("etiqueta-24") == pdf()
+    assert 24 in cache._by_delivery
+
+
+def test_invalidate_removes_batches_from_every_delivery():
+    cache = LabelCache(max_bytes=10_000)
+    cache.put("etiqueta-1", pdf(), [1])
+    cache.put("lote-1-2", pdf(), [1, 2])
+    cache.put("etiqueta-2", pdf(), [2])
+
+    cache.invalidate(1)
+
+    assert cache.get("etiqueta-1") is None and cache.get("lote-1-2") is None
+    assert cache.get("etiqueta-2") == pdf()
+    assert cache._by_delivery == {2: {"etiqueta-2"}}
+    assert cache._deliveries_by_key == {"etiqueta-2": {2}}
@@ -0,0 +1,163 @@
+import pytest
+from sqlalchemy import func, and_, not_
+
+from models.models import Payment, Delivery
+from schemas.schemas import SettlementStatus, PaymentStatus, ClientSettlementStatus
+from utils import ledger
+
+
+def _count_and_total(db, total, *filters, join=True):
+    query = db.query(func.count(Payment.id), func.sum(total))
+    if join:
+        query = query.join(Delivery, Payment.delivery_id == Delivery.id)
+    count, amount = query.filter(*filters).first()
+    return count or 0, float(amount or 0)
+
+
+def reference_summary(db):
+    """Las siete consultas originales del dashboard, una por contador, con su semántica SQL (NULL incluido)."""
+    delivered = Delivery.state == "DELIVERED"
+    client_open = (delivered, Payment.client_settlement_status != ClientSettlementStatus.SETTLED,
+                   Payment.settlement_status != SettlementStatus.PENDING)
+
+    rider_count, rider_total = _count_and_total(
+        db, Payment.total_amount - Payment.rider_amount,
+        Payment.settlement_status == SettlementStatus.PENDING, Payment.payment_status == PaymentStatus.COURIER,
+        delivered)
+    to_pay_count, to_pay_total = _count_and_total(
+        db, Payment.rider_amount,
+        Payment.payment_status != PaymentStatus.OFFICE, Payment.settlement_status != SettlementStatus.SETTLED,
+        not_(and_(Payment.settlement_status == SettlementStatus.PENDING,
+                  Payment.payment_status == PaymentStatus.COURIER)))
+    _, from_client = _count_and_total(
+        db, Payment.rider_amount,
+        Payment.settlement_status == SettlementStatus.TRANFERRED_TO_CLIENT,
+        Payment.payment_status == PaymentStatus.CLIENT_RECIEVED_TRANSFER)
+    _, from_office = _count_and_total(
+        db, Payment.rider_amount,
+        Payment.settlement_status == SettlementStatus.TRANSFER_TO_OFFICE,
+        Payment.payment_status == PaymentStatus.OFFICE_RECIEVED_TRANSFER)
+    office_count, office_total = _count_and_total(
+        db, Payment.total_amount - (Payment.rider_amount + Payment.coop_amount), *client_open,
+        Payment.payment_status.in_([PaymentStatus.OFFICE_RECIEVED_TRANSFER, PaymentStatus.OFFICE,
+                                    PaymentStatus.COURIER]))
+    client_count, client_total = _count_and_total(
+        db, Payment.rider_amount + Payment.coop_amount, *client_open,
+        Payment.payment_status == PaymentStatus.CLIENT_RECIEVED_TRANSFER)
+    total_count, total_amount = _count_and_total(db, Payment.total_amount, join=False)
+
+    return {
+        "to_pay_rider_total": to_pay_total,
+        "to_pay_rider_count": to_pay_count,
+        "pending_to_rider_from_client": from_client,
+        "pending_to_rider_from_office": from_office,
+        "pendingRiderPayments": rider_count,
+        "pendingRiderAmount": rider_total,
+        "pendingClientPayments": client_count,
+        "pendingClientAmount": client_total,
+        "pendingOfficeToClient": office_count,
+        "pendingOfficeToClientAmount": office_total,
+        "totalTransactions": total_count,
+        "totalAmount": total_amount,
+    }
+
+
+def assert_modes_match(db):
+    reference = reference_summary(db)
+    for mode in ledger.DASHBOARD_QUERY_MODES:
+        summary = ledger.summary_for_mode(db, mode)
+        assert summary.keys() == reference.keys(), mode
+        for name, value in reference.items():
+            assert summary[name] == pytest.approx(value), (mode, name)
+    assert ledger.parity(db, repeat=1)["consistent"]
+    assert ledger.check(db) == []
+    return reference
+
+
+def test_modes_match_on_mixed_states(db, seed):
+    seed(300)
+    summary = assert_modes_match(db)
+    assert summary["totalTransactions"] == 300
+
+
+def test_modes_match_with_null_states(db, seed):
+    seed(60)
+    # Estados NULL como los que deja un INSERT sin los defaults de Python
+    db.query(Payment).filter(Payment.id <= 20).update({Payment.client_settlement_status: None},
+                                                      synchronize_session=False)
+    db.query(Payment).filter(Payment.id.between(10, 30)).update({Payment.settlement_status: None},
+                                                                synchronize_session=False)
+    db.commit()
+    ledger.rebuild(db)
+    assert_modes_match(db)
+
+    # Cambios por el ORM sobre llaves con NULL pasan por los listeners
+    for payment in db.query(Payment).filter(Payment.id <= 5):
+        payment.client_settlement_status = None if payment.client_settlement_status else ClientSettlementStatus.PENDING
+    db.commit()
+    assert_modes_match(db)
+
+
+def test_modes_match_after_settle_and_receive(db, seed, client):
+    ids = seed(200)
+    rider_id, client_id = ids["riders"][0], ids["clients"][0]
+    before = assert_modes_match(db)
+
+    rider_payments = [row.id for row in db.query(Payment.id).join(Delivery)
+                      .filter(Delivery.rider_id == rider_id).limit(40)]
+    response = client.post(f"/payments/riders-payments/{rider_id}/settle", json={"payment_ids": rider_payments})
+    assert response.status_code == 200
+
+    client_payments = [row.id for row in db.query(Payment.id).join(Delivery)
+                       .filter(Delivery.client_id == client_id).limit(30)]
+    response = client.post(f"/payments/clients-payments/{client_id}/receive", json=client_payments,
+                           params={"payment_type": "TRANSFER"})
+    assert response.status_code == 200
+
+    response = client.put(f"/payments/client_settled/{client_id}", json={"payments_id": client_payments},
+                          params={"client_settlement_status": "SETTLED"})
+    assert response.status_code == 200
+
+    db.expire_all()
+    after = assert_modes_match(db)
+    assert after["totalTransactions"] == before["totalTransactions"]
+    settled = db.query(Payment).filter(Payment.id.in_(rider_payments)).all()
+    assert all(payment.settlement_status == SettlementStatus.SETTLED for payment in settled)
+    received = db.query(Payment).filter(Payment.id.in_(client_payments)).all()
+    assert all(payment.payment_status == PaymentStatus.OFFICE_RECIEVED_TRANSFER for payment in received)
+
+
+def test_tracking_keeps_ledger_in_sync_with_bulk_update(db, seed):
+    seed(100)
+    payment_ids = [row.id for row in db.query(Payment.id).limit(50)]
+
+    with ledger.tracking(db, Payment.id.in_(payment_ids)):
+        db.query(Payment).filter(Payment.id.in_(payment_ids)) \
+            .update({Payment.settlement_status: SettlementStatus.CLEARED}, synchronize_session=False)
+    db.commit()
+
+    assert_modes_match(db)
+
+
+def test_payments_without_delivery_only_count_in_totals(db, seed):
+    seed(40)
+    # Un pago sin domicilio cumple las condiciones de varios contadores pero no tiene JOIN
+    db.add(Payment(total_amount=50.0, rider_amount=10.0, coop_amount=5.0,
+                   settlement_status=SettlementStatus.TRANFERRED_TO_CLIENT,
+                   payment_status=PaymentStatus.CLIENT_RECIEVED_TRANSFER))
+    db.commit()
+    summary = assert_modes_match(db)
+    assert summary["totalTransactions"] == 41
+
+    # Al borrar un domicilio sus pagos pasan a contar solo en los totales
+    orphan = db.query(Payment).filter(Payment.delivery_id.is_not(None)).first()
+    db.delete(db.get(Delivery, orphan.delivery_id))
+    db.commit()
+    assert assert_modes_match(db)["totalTransactions"] == 41
+
+    orphan.delivery_id = db.query(Delivery.id).first()[0]
+    db.commit()
+    assert_modes_match(db)
+
+    ledger.rebuild(db)
+    assert_modes_match(db)
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from auth import auth
+from auth.rate_limit import LoginRateLimiter, InMemoryBucketStore, SQLiteBucketStore
+from models.models import User
+from routes import auth as auth_routes
+
+
+def limiter(store, user_capacity=2, ip_capacity=3):
+    # Una ficha por minuto: durante la prueba los buckets no se recargan
+    return LoginRateLimiter(store, user_capacity, 1, ip_capacity, 1)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteBucketStore(str(tmp_path / "buckets.db"))
+    return InMemoryBucketStore()
+
+
+def test_user_bucket_rejects_after_capacity(store):
+    login_limiter = limiter(store, ip_capacity=100)
+
+    assert login_limiter.check("ana", "10.0.0.1") == (True, 0.0)
+    assert login_limiter.check("ana", "10.0.0.2") == (True, 0.0)
+    allowed, retry_after = login_limiter.check("ana", "10.0.0.3")
+
+    assert not allowed
+    assert 59 < retry_after <= 60
+    # Otro usuario no comparte el bucket
+    assert login_limiter.check("beto", "10.0.0.1")[0]
+    assert login_limiter.metrics()["rejected_username"] == 1
+
+
+def test_ip_bucket_rejects_across_usernames(store):
+    login_limiter = limiter(store, user_capacity=100)
+
+    for username in ("ana", "beto", "carla"):
+        assert login_limiter.check(username, "10.0.0.1")[0]
+    assert not login_limiter.check("dario", "10.0.0.1")[0]
+    assert login_limiter.check("dario", "10.0.0.2")[0]
+
+    metrics = login_limiter.metrics()
+    assert (metrics["allowed"], metrics["rejected_ip"], metrics["rejected"]) == (4, 1, 1)
+
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    worker_a, worker_b = limiter(SQLiteBucketStore(path)), limiter(SQLiteBucketStore(path))
+
+    assert worker_a.check("ana", "10.0.0.1")[0]
+    assert worker_b.check("ana", "10.0.0.1")[0]
+    assert not worker_a.check("ana", "10.0.0.1")[0]
+
+
+class LoopCheckingStore(InMemoryBucketStore):
+    """Registra si take corre dentro del event loop."""
+
+    def __init__(self):
+        super().__init__()
+        self.on_loop = []
+
+    def take(self, key, capacity, rate):
+        try:
+            asyncio.get_running_loop()
+            self.on_loop.append(True)
+        except RuntimeError:
+            self.on_loop.append(False)
+        return super().take(key, capacity, rate)
+
+
+def test_login_returns_429_with_retry_after(db, client, monkeypatch):
+    store = LoopCheckingStore()
+    monkeypatch.setattr(auth_routes, "login_limiter", limiter(store))
+    db.add(User(username="limitado", email="limitado@example.com", hashed_password=auth.hash_password("clave")))
+    db.commit()
+    verified = []
+    verify = auth_routes.verify_and_update_password_async
+
+    async def counting_verify(*args):
+        verified.append(args)
+        return await verify(*args)
+
+    monkeypatch.setattr(auth_routes, "verify_and_update_password_async", counting_verify)
+
+    def attempt(password="mala"):
+        return client.post("/token", data={"username": "Limitado", "password": password})
+
+    assert attempt().status_code == 401
+    assert attempt().status_code == 401
+    response = attempt("clave")
+
+    assert response.status_code == 429
+    assert 59 <= int(response.headers["Retry-After"]) <= 60
+    # El intento rechazado no llega a bcrypt
+    assert len(verified) == 2
+    # El store corre en el threadpool, nunca en el event loop
+    assert store.on_loop and not any(store.on_loop)
+    assert client.get("/token/metrics").json()["rejected_username"] == 1
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from models.models import Delivery
+
+# Mismo inicio que los domicilios del seed de conftest (uno por hora)
+START = datetime(2025, 1, 1)
+
+
+def expected_window(db, rider_id, per_rider, start=None, end=None):
+    """Ids de los últimos ``per_rider`` domicilios del rider por (created_at, id), en Python."""
+    deliveries = [delivery for delivery in db.query(Delivery).filter(Delivery.rider_id == rider_id)
+                  if (start is None or delivery.created_at >= start) and (end is None or delivery.created_at <= end)]
+    deliveries.sort(key=lambda delivery: (delivery.created_at, delivery.id), reverse=True)
+    return [delivery.id for delivery in deliveries[:per_rider]]
+
+
+def test_actions_returns_a_list_with_pagination_headers(db, seed, client):
+    seed(30, riders=5)
+
+    response = client.get("/rider/actions", params={"page": 2, "size": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert isinstance(body, list)
+    assert [rider["id"] for rider in body] == [3, 4]
+    assert all("deliveries" in rider for rider in body)
+    headers = response.headers
+    assert (headers["X-Total-Count"], headers["X-Page"], headers["X-Page-Size"], headers["X-Total-Pages"]) == \
+           ("5", "2", "2", "3")
+
+
+def test_deliveries_are_bounded_per_rider(db, seed, client):
+    ids = seed(60, riders=3)
+    # Empates en created_at: el orden lo decide el id
+    db.query(Delivery).filter(Delivery.id <= 20).update({Delivery.created_at: START}, synchronize_session=False)
+    db.commit()
+
+    response = client.get("/rider/actions", params={"deliveries_per_rider": 4})
+
+    assert response.status_code == 200
+    riders = {rider["id"]: rider for rider in response.json()}
+    assert set(riders) == set(ids["riders"])
+    for rider_id in ids["riders"]:
+        deliveries = riders[rider_id]["deliveries"]
+        assert [delivery["id"] for delivery in deliveries] == expected_window(db, rider_id, 4)
+        assert all(len(delivery["payments"]) == 1 for delivery in deliveries)
+
+
+def test_window_applies_after_the_date_range(db, seed, client):
+    ids = seed(60, riders=2)
+    start, end = START + timedelta(hours=10), START + timedelta(hours=30)
+
+    response = client.get("/rider/actions", params={"deliveries_per_rider": 3, "start_date": start.isoformat(),
+                                                    "end_date": end.isoformat()})
+
+    riders = {rider["id"]: rider for rider in response.json()}
+    for rider_id in ids["riders"]:
+        assert [delivery["id"] for delivery in riders[rider_id]["deliveries"]] == \
+               expected_window(db, rider_id, 3, start, end)
+
+
+def test_columnar_format_keeps_the_same_window(db, seed, client):
+    ids = seed(40, riders=2)
+
+    response = client.get("/rider/actions", params={"deliveries_per_rider": 5, "format": "columnar"})
+
+    body = response.json()
+    assert response.headers["X-Total-Count"] == "2"
+    assert body["riders"]["id"] == ids["riders"]
+    expected = [delivery_id for rider_id in ids["riders"] for delivery_id in expected_window(db, rider_id, 5)]
+    assert body["deliveries"]["id"] == expected
+    assert sorted(body["payments"]["delivery_id"]) == sorted(expected)
@@ -0,0 +1,91 @@
+import io
+import zipfile
+from datetime import datetime
+
+from models.models import Payment
+from utils.statements import build_statements, statement_hash, render_statement, statement_store
+
+
+def test_statement_with_payments_without_settlement_status(db, seed):
+    ids = seed(20, riders=1)
+    db.query(Payment).filter(Payment.delivery_id.in_(ids["deliveries"][:5])).update(
+        {Payment.settlement_status: None}, synchronize_session=False)
+    db.commit()
+
+    statement, = build_statements(db, datetime(2025, 1, 1), datetime(2025, 2, 1), ids["riders"])
+
+    statuses = {line["settlement_status"] for line in statement["lines"]}
+    assert None in statuses
+    assert statement["totals"]["payments"] == 20
+    assert sum(statement["rider_amount_by_status"].values()) == statement["totals"]["rider_amount"]
+    assert statement_hash(statement, "pdf")
+    for statement_format in ("csv", "pdf"):
+        assert render_statement(statement, statement_format)
+
+
+def create_job(client, **body):
+    response = client.post("/statements/riders", json=body)
+    assert response.status_code == 202
+    # TestClient corre las tareas en segundo plano antes de devolver la respuesta
+    return client.get(f"/statements/jobs/{response.json()['job_id']}").json()
+
+
+def test_job_lifecycle_cache_and_downloads(db, seed, client):
+    rider_ids = seed(40, riders=2)["riders"]
+    body = {"start_date": "2025-01-01T00:00:00", "end_date": "2025-01-03T00:00:00", "format": "csv",
+            "rider_ids": rider_ids}
+
+    job = create_job(client, **body)
+    assert job["status"] == "done" and job["error"] is None
+    assert set(job["statements"]) == {str(rider_id) for rider_id in rider_ids}
+    assert not any(entry["cached"] for entry in job["statements"].values())
+
+    rider_id = rider_ids[0]
+    response = client.get(f"/statements/jobs/{job['job_id']}/riders/{rider_id}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert f"extracto_rider_{rider_id}_2025-01-01_2025-01-03.csv" in response.headers["content-disposition"]
+    assert response.text.splitlines()[0].startswith("rider_id,rider_name,day,settlement_status")
+
+    response = client.get(f"/statements/jobs/{job['job_id']}/download")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == sorted(f"extracto_rider_{rider_id}_2025-01-01_2025-01-03.csv"
+                                                    for rider_id in rider_ids)
+
+    # El mismo extracto sale del caché de disco en un segundo trabajo
+    again = create_job(client, **body)
+    assert all(entry["cached"] for entry in again["statements"].values())
+    assert {rider: entry["file"] for rider, entry in again["statements"].items()} == \
+        {rider: entry["file"] for rider, entry in job["statements"].items()}
+
+
+def test_job_accepts_dates_with_timezone(db, seed, client):
+    rider_ids = seed(10, riders=1)["riders"]
+
+    job = create_job(client, start_date="2025-01-01T00:00:00Z", rider_ids=rider_ids)
+    assert job["status"] == "done"
+    assert job["params"]["start_date"] == "2025-01-01T00:00:00"
+
+    job = create_job(client, start_date="2025-01-01T05:00:00+05:00", end_date="2025-01-02T00:00:00-05:00",
+                     rider_ids=rider_ids)
+    assert (job["params"]["start_date"], job["params"]["end_date"]) == ("2025-01-01T00:00:00",
+                                                                        "2025-01-02T05:00:00")
+
+    response = client.post("/statements/riders", json={"start_date": "2025-01-02T00:00:00Z",
+                                                       "end_date": "2025-01-02T00:00:00+00:00"})
+    assert response.status_code == 400
+
+
+def test_unknown_or_unfinished_jobs(db, seed, client):
+    rider_ids = seed(10, riders=1)["riders"]
+    job = create_job(client, start_date="2025-01-01T00:00:00", end_date="2025-01-02T00:00:00",
+                     rider_ids=rider_ids)
+
+    assert client.get("/statements/jobs/noexiste").status_code == 404
+    assert client.get(f"/statements/jobs/{job['job_id']}/riders/999999").status_code == 404
+
+    queued = statement_store.new_job({"start_date": "2025-01-01", "end_date": "2025-01-02", "format": "pdf",
+                                      "rider_ids": None})
+    assert client.get(f"/statements/jobs/{queued['job_id']}/download").status_code == 409
+    assert client.get(f"/statements/jobs/{queued['job_id']}/riders/{rider_ids[0]}").status_code == 409
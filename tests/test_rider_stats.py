@@ -0,0 +1,79 @@
+from sqlalchemy import event
+
+from db.db import engine
+from models.models import Payment, Delivery, Rider, RiderStats, FeeRule
+from utils import rider_stats
+from utils.fees import fee_table
+from utils.upsert import increment
+
+
+def stored_counters(db):
+    db.expire_all()
+    return {row.rider_id: tuple(getattr(row, name) for name in rider_stats.COUNTER_COLUMNS)
+            for row in db.query(RiderStats)}
+
+
+def assert_counters_match_recompute(db):
+    assert rider_stats.check(db) == []
+    assert stored_counters(db) == rider_stats.aggregate_by_rider(db.connection())
+
+
+def test_counters_follow_create_settle_and_reprice(db, seed, client):
+    ids = seed(90, riders=3, settlement_status="PENDING", client_settlement_status="PENDING")
+    assert_counters_match_recompute(db)
+
+    # Un rider nuevo con su primer domicilio crea su fila en rider_stats
+    rider = Rider(name="nuevo", phone="3209999999", plate="XYZ999")
+    db.add(rider)
+    db.flush()
+    delivery = db.get(Delivery, ids["deliveries"][0])
+    delivery.rider_id = rider.id
+    db.commit()
+    assert rider.id in stored_counters(db)
+    assert_counters_match_recompute(db)
+
+    rider_id = ids["riders"][0]
+    payment_ids = [payment_id for payment_id, in db.query(Payment.id).join(Delivery)
+                   .filter(Delivery.rider_id == rider_id).limit(15)]
+    response = client.post(f"/payments/riders-payments/{rider_id}/settle", json={"payment_ids": payment_ids})
+    assert response.status_code == 200
+    assert_counters_match_recompute(db)
+
+    before = stored_counters(db)
+    try:
+        assert client.post("/fees/", json={"valid_from": "2024-01-01T00:00:00", "total_amount": 20000,
+                                           "coop_amount": 5000}).status_code == 200
+        response = client.post("/fees/reprice", json={"dry_run": False})
+        assert response.status_code == 200 and response.json()["repriced"] > 0
+    finally:
+        db.query(FeeRule).delete()
+        db.commit()
+        fee_table.load(db)
+
+    after = stored_counters(db)
+    assert after != before
+    assert_counters_match_recompute(db)
+    for rider_id in ids["riders"]:
+        assert client.get(f"/rider/{rider_id}").status_code == 200
+
+
+def test_increment_is_a_single_upsert(db, seed):
+    rider_id = seed(1, riders=1)["riders"][0]
+    db.query(RiderStats).delete()
+    db.commit()
+    table = RiderStats.__table__
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with engine.begin() as conn:
+        event.listen(conn, "before_cursor_execute", before_cursor_execute)
+        increment(conn, table, {"rider_id": rider_id}, {"total_deliveries": 2, "total_earnings": 100.0})
+        increment(conn, table, {"rider_id": rider_id}, {"total_deliveries": 1, "total_earnings": -30.0})
+
+    # Sin UPDATE previo: dos flush que crean la misma fila no chocan en el INSERT
+    assert len(statements) == 2
+    assert all(statement.startswith("INSERT") and "ON CONFLICT" in statement for statement in statements)
+    row = db.get(RiderStats, rider_id)
+    assert (row.total_deliveries, row.total_earnings) == (3, 70.0)
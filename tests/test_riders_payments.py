@@ -0,0 +1,104 @@
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from db.db import engine
+from models.models import Payment, Delivery
+from schemas.schemas import DeliveryStanding, PaymentStatus, SettlementStatus
+
+
+def expected_groups(db, *filters):
+    """(rider_id, estado) -> (domicilios, total, rider) calculado pago por pago en Python."""
+    groups = defaultdict(lambda: [0, 0.0, 0.0])
+    for payment, rider_id in db.query(Payment, Delivery.rider_id).join(Delivery) \
+            .filter(Delivery.state == DeliveryStanding.DELIVERED,
+                    Payment.payment_status != PaymentStatus.OFFICE, *filters):
+        status = payment.settlement_status.value if payment.settlement_status else None
+        group = groups[rider_id, status]
+        group[0] += 1
+        group[1] += payment.total_amount
+        group[2] += payment.rider_amount
+    return {key: tuple(value) for key, value in groups.items()}
+
+
+def actual_groups(rows):
+    return {(row["rider_id"], group["settlement_status"]):
+            (group["total_deliveries"], group["total_amount"], group["rider_amount"])
+            for row in rows for group in row["by_settlement_status"]}
+
+
+def expected_pending(groups):
+    # Como el CASE original en SQL: NULL != 'SETTLED' no es verdadero y no suma
+    return sum(group["rider_amount"] for group in groups
+               if group["settlement_status"] not in (SettlementStatus.SETTLED.value, None))
+
+
+def test_groups_by_rider_and_settlement_status(db, seed, client):
+    seed(300, riders=4)
+
+    rows = client.get("/payments/riders-payments").json()
+
+    assert actual_groups(rows) == expected_groups(db)
+    for row in rows:
+        groups = row["by_settlement_status"]
+        assert row["total_deliveries"] == sum(group["total_deliveries"] for group in groups)
+        assert row["total_amount"] == sum(group["total_amount"] for group in groups)
+        assert row["pending_amount"] == expected_pending(groups)
+        # Con varios estados no hay un estado único
+        assert row["settlement_status"] == (groups[0]["settlement_status"] if len(groups) == 1 else None)
+    assert [row["pending_amount"] for row in rows] == sorted((row["pending_amount"] for row in rows), reverse=True)
+
+
+def test_single_status_and_date_filters(db, seed, client):
+    seed(200, riders=3)
+    start, end = datetime(2025, 1, 3), datetime(2025, 1, 6)
+
+    rows = client.get("/payments/riders-payments", params={"settlement_status": ["SETTLED"],
+                                                           "start_date": start.isoformat(),
+                                                           "end_date": end.isoformat()}).json()
+
+    assert actual_groups(rows) == expected_groups(db, Payment.settlement_status == SettlementStatus.SETTLED,
+                                                  Payment.created_at >= start, Payment.created_at <= end)
+    assert rows and all(row["settlement_status"] == "SETTLED" and row["pending_amount"] == 0 for row in rows)
+
+
+def test_null_settlement_status_is_not_pending(db, seed, client):
+    seed(120, riders=3, state=DeliveryStanding.DELIVERED, payment_status=PaymentStatus.COURIER,
+         settlement_status=SettlementStatus.PENDING)
+    db.query(Payment).filter(Payment.id % 3 == 0).update({Payment.settlement_status: None},
+                                                         synchronize_session=False)
+    db.commit()
+
+    rows = client.get("/payments/riders-payments").json()
+
+    assert actual_groups(rows) == expected_groups(db)
+    for row in rows:
+        null_group, = [group for group in row["by_settlement_status"] if group["settlement_status"] is None]
+        assert null_group["total_deliveries"] > 0 and null_group["pending_amount"] == 0
+        assert row["pending_amount"] == expected_pending(row["by_settlement_status"]) > 0
+
+
+@pytest.mark.parametrize("params", [{}, {"start_date": "2025-01-03T00:00:00", "end_date": "2025-01-06T00:00:00"},
+                                    {"settlement_status": ["UNSETTLED"], "start_date": "2025-01-03T00:00:00"}])
+def test_payments_are_read_through_an_index(db, seed, client, params):
+    seed(300, riders=4)
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if "FROM riders JOIN deliveries" in statement:
+            executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        assert client.get("/payments/riders-payments", params=params).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    (statement, parameters), = executed
+    with engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+    payment_steps = [step for step in plan if " payments " in f"{step} "]
+    assert payment_steps and all("USING INDEX ix_payments_" in step for step in payment_steps), plan
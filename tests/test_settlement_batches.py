@@ -0,0 +1,136 @@
+from models.models import Payment, Delivery, SettlementBatch
+from routes import payment_route
+from schemas.schemas import SettlementStatus, PaymentStatus, SettlementBatchKind
+
+
+def rider_payments(db, rider_id):
+    return db.query(Payment).join(Delivery).filter(Delivery.rider_id == rider_id).order_by(Payment.id).all()
+
+
+def settle(client, rider_id, payment_ids, key=None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(f"/payments/riders-payments/{rider_id}/settle", json={"payment_ids": payment_ids},
+                       headers=headers)
+
+
+def reconciliation(client):
+    response = client.get("/payments/reconciliation")
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_settle_is_journaled_and_reconciled(db, seed, client):
+    rider_id = seed(20, riders=1, settlement_status="PENDING")["riders"][0]
+    payments = rider_payments(db, rider_id)[:5]
+
+    response = settle(client, rider_id, [payment.id for payment in payments])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["payments_count"] == 5 and body["already_settled"] == []
+    assert body["total_amount"] == sum(payment.total_amount for payment in payments)
+    batch = db.get(SettlementBatch, body["batch_id"])
+    assert batch.kind == SettlementBatchKind.RIDER_SETTLEMENT and batch.rider_id == rider_id
+
+    rider, = reconciliation(client)["riders"]
+    assert (rider["rider_id"], rider["batches"], rider["payments_count"]) == (rider_id, 1, 5)
+    assert rider["total_amount"] == body["total_amount"]
+    assert rider["rider_amount"] == sum(payment.rider_amount for payment in payments)
+
+
+def test_repeated_settle_without_key_does_not_journal_settled_payments(db, seed, client):
+    rider_id = seed(20, riders=1, settlement_status="PENDING")["riders"][0]
+    payment_ids = [payment.id for payment in rider_payments(db, rider_id)]
+
+    first = settle(client, rider_id, payment_ids[:3]).json()
+    second = settle(client, rider_id, payment_ids[:5]).json()
+    third = settle(client, rider_id, payment_ids[:5]).json()
+
+    assert second["payments_count"] == 2 and second["already_settled"] == payment_ids[:3]
+    assert third["batch_id"] is None and third["payments_count"] == 0
+    assert third["already_settled"] == payment_ids[:5]
+
+    rider, = reconciliation(client)["riders"]
+    assert (rider["batches"], rider["payments_count"]) == (2, 5)
+    assert rider["total_amount"] == first["total_amount"] + second["total_amount"]
+    assert db.query(SettlementBatch).count() == 2
+
+
+def test_retry_with_same_key_replays_the_stored_result(db, seed, client):
+    rider_id = seed(20, riders=1, settlement_status="PENDING")["riders"][0]
+    payment_ids = [payment.id for payment in rider_payments(db, rider_id)]
+    settle(client, rider_id, payment_ids[:2])
+
+    # El lote con llave incluye pagos ya liquidados; el reintento igual se reconoce
+    first = settle(client, rider_id, payment_ids[:6], key="lote-1")
+    retry = settle(client, rider_id, list(reversed(payment_ids[:6])), key="lote-1")
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert first.json()["payments_count"] == 4
+    assert db.query(SettlementBatch).count() == 2
+
+
+def test_key_reused_for_another_batch_is_rejected(db, seed, client):
+    rider_id = seed(20, riders=1, settlement_status="PENDING")["riders"][0]
+    payment_ids = [payment.id for payment in rider_payments(db, rider_id)]
+
+    assert settle(client, rider_id, payment_ids[:3], key="lote-2").status_code == 200
+    response = settle(client, rider_id, payment_ids[3:6], key="lote-2")
+
+    assert response.status_code == 409
+    db.expire_all()
+    assert all(payment.settlement_status == SettlementStatus.PENDING
+               for payment in rider_payments(db, rider_id)[3:6])
+    assert db.query(SettlementBatch).count() == 1
+
+
+def test_concurrent_request_with_same_key_rolls_back_and_replays(db, seed, client, monkeypatch):
+    rider_id = seed(20, riders=1, settlement_status="PENDING")["riders"][0]
+    payment_ids = [payment.id for payment in rider_payments(db, rider_id)]
+    stored = settle(client, rider_id, payment_ids[:3], key="lote-3").json()
+
+    # La otra petición no ve el lote al empezar, pero choca con la llave única al registrarlo
+    replayed_batch = payment_route._replayed_batch
+    calls = []
+
+    def first_check_misses(*args, **kwargs):
+        calls.append(args)
+        return None if len(calls) == 1 else replayed_batch(*args, **kwargs)
+
+    monkeypatch.setattr(payment_route, "_replayed_batch", first_check_misses)
+    db.query(Payment).filter(Payment.id.in_(payment_ids[:3])) \
+        .update({Payment.settlement_status: SettlementStatus.PENDING}, synchronize_session=False)
+    db.commit()
+
+    response = settle(client, rider_id, payment_ids[:3], key="lote-3")
+
+    assert len(calls) == 2
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert response.json() == stored
+    # El UPDATE de la petición perdedora se deshizo junto con su lote
+    db.expire_all()
+    assert all(payment.settlement_status == SettlementStatus.PENDING
+               for payment in rider_payments(db, rider_id)[:3])
+    assert db.query(SettlementBatch).count() == 1
+
+
+def test_repeated_receive_does_not_journal_received_payments(db, seed, client):
+    client_id = seed(20, clients=1, payment_status="OFFICE")["clients"][0]
+    payment_ids = [payment_id for payment_id, in db.query(Payment.id).join(Delivery)
+                   .filter(Delivery.client_id == client_id).order_by(Payment.id)][:4]
+
+    def receive():
+        return client.post(f"/payments/clients-payments/{client_id}/receive", json=payment_ids,
+                           params={"payment_type": "TRANSFER"}).json()
+
+    first, second = receive(), receive()
+
+    assert first["payments_count"] == 4 and first["already_received"] == []
+    assert second["payments_count"] == 0 and second["already_received"] == payment_ids
+    db.expire_all()
+    assert {payment.payment_status for payment in db.query(Payment).filter(Payment.id.in_(payment_ids))} \
+        == {PaymentStatus.OFFICE_RECIEVED_TRANSFER}
+    entry, = reconciliation(client)["clients"]
+    assert (entry["client_id"], entry["batches"], entry["payments_count"]) == (client_id, 1, 4)
@@ -0,0 +1,345 @@
+"""Estados de cuenta de clientes por periodo de facturación.
+
+Cerrar un periodo copia a ``client_statement_lines`` los pagos entregados, sin
+liquidar con el cliente y aún no facturados creados antes del fin del periodo (los
+que se entregan tarde o siguen pendientes con el rider entran en el siguiente), y
+guarda en ``client_statements`` los saldos de cada cliente. /payments/clients-payments
+suma las líneas de los estados de cuenta emitidos y solo calcula en vivo los pagos
+que todavía no están en ninguno. Un estado de cuenta pasa a PAID cuando todos sus
+pagos quedan liquidados con el cliente.
+
+Uso por consola (por ejemplo desde cron):
+    python -m utils.client_statements close                        # último periodo completo
+    python -m utils.client_statements close 2025-01-01 2025-02-01  # periodo explícito
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, update, func, case, and_, exists, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from db.db import SessionLocal
+from models.models import Payment, Delivery, Client, ClientStatement, ClientStatementLine
+from schemas.schemas import PaymentStatus, SettlementStatus, ClientSettlementStatus, DeliveryStanding, \
+    ClientStatementStatus
+from utils.statements import get_executor, statement_store, statement_hash
+
+# Periodo del cierre automático: "weekly" (lunes a lunes), "monthly" o vacío para desactivarlo
+CLIENT_STATEMENT_PERIOD = os.getenv("CLIENT_STATEMENT_PERIOD", "")
+CLIENT_STATEMENT_CHECK_SECONDS = float(os.getenv("CLIENT_STATEMENT_CHECK_SECONDS", "3600"))
+
+AMOUNT_COLUMNS = ("total_deliveries", "total_amount", "coop_amount", "yo_le_debo_al_cliente", "cliente_me_debe")
+
+_OWED_TO_CLIENT_STATUSES = [PaymentStatus.COURIER, PaymentStatus.OFFICE, PaymentStatus.OFFICE_RECIEVED_TRANSFER]
+_CLIENT_OWES_STATUSES = [PaymentStatus.CLIENT, PaymentStatus.CLIENT_RECIEVED_TRANSFER]
+
+
+def owed_to_client():
+    """Por pago: lo que la empresa le debe al cliente."""
+    return case(
+        (and_(Payment.payment_status.in_(_OWED_TO_CLIENT_STATUSES),
+              Payment.settlement_status != SettlementStatus.PENDING),
+         Payment.total_amount - (Payment.rider_amount + Payment.coop_amount)),
+        else_=0
+    )
+
+
+def client_owes():
+    """Por pago: lo que el cliente le debe a la empresa."""
+    return case(
+        (Payment.payment_status.in_(_CLIENT_OWES_STATUSES), Payment.rider_amount + Payment.coop_amount),
+        else_=0
+    )
+
+
+def open_balance_filters():
+    """Pagos que cuentan en el saldo con el cliente: entregados y sin liquidar con él."""
+    return (Delivery.state == DeliveryStanding.DELIVERED,
+            Payment.client_settlement_status != ClientSettlementStatus.SETTLED)
+
+
+def billable():
+    """Pagos que ya pueden facturarse: lo que se le debe al cliente solo cuenta cuando el rider ya liquidó,
+    así que esos pagos esperan al siguiente cierre mientras sigan PENDING con el rider."""
+    return ~and_(Payment.payment_status.in_(_OWED_TO_CLIENT_STATUSES),
+                 Payment.settlement_status == SettlementStatus.PENDING)
+
+
+def unbilled():
+    return ~exists().where(ClientStatementLine.payment_id == Payment.id)
+
+
+def last_complete_period(period, now=None):
+    """(inicio, fin) del último periodo semanal o mensual ya terminado."""
+    now = now or datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    if period == "weekly":
+        end = today - timedelta(days=today.weekday())
+        return end - timedelta(days=7), end
+    end = datetime(today.year, today.month, 1)
+    start = datetime(end.year - 1, 12, 1) if end.month == 1 else datetime(end.year, end.month - 1, 1)
+    return start, end
+
+
+def close_period(db, period_start, period_end, client_ids=None):
+    """Emite los estados de cuenta del periodo; devuelve los ids creados.
+
+    Todo en una transacción: encabezados, líneas con INSERT ... SELECT y totales
+    calculados desde las líneas insertadas, así siempre cuadran entre sí.
+    """
+    candidates = select(Delivery.client_id).select_from(Payment) \
+        .join(Delivery, Payment.delivery_id == Delivery.id) \
+        .where(*open_balance_filters(), unbilled(), billable(), Payment.created_at < period_end) \
+        .distinct()
+    if client_ids:
+        candidates = candidates.where(Delivery.client_id.in_(client_ids))
+    # Clientes que ya tienen estado de cuenta de este periodo
+    candidates = candidates.where(~exists().where(ClientStatement.client_id == Delivery.client_id,
+                                                  ClientStatement.period_start == period_start,
+                                                  ClientStatement.period_end == period_end))
+
+    statement_clients = [row[0] for row in db.execute(candidates)]
+    if not statement_clients:
+        return []
+
+    try:
+        db.execute(insert(ClientStatement), [
+            {"client_id": client_id, "period_start": period_start, "period_end": period_end,
+             "status": ClientStatementStatus.ISSUED, "created_at": datetime.utcnow()}
+            for client_id in statement_clients
+        ])
+    except IntegrityError:
+        # Otro proceso cerró el mismo periodo al mismo tiempo
+        db.rollback()
+        return []
+
+    statements = select(ClientStatement.id).where(ClientStatement.client_id == Delivery.client_id,
+                                                  ClientStatement.period_start == period_start,
+                                                  ClientStatement.period_end == period_end) \
+        .scalar_subquery()
+    lines = select(
+        statements,
+        Payment.id,
+        Payment.delivery_id,
+        Payment.created_at,
+        Payment.payment_status,
+        Payment.settlement_status,
+        Payment.total_amount,
+        Payment.rider_amount + Payment.coop_amount,
+        owed_to_client(),
+        client_owes(),
+    ).select_from(Payment).join(Delivery, Payment.delivery_id == Delivery.id) \
+        .where(*open_balance_filters(), unbilled(), billable(), Payment.created_at < period_end,
+               Delivery.client_id.in_(statement_clients))
+    db.execute(insert(ClientStatementLine).from_select(
+        ["statement_id", "payment_id", "delivery_id", "payment_created_at", "payment_status", "settlement_status",
+         "total_amount", "coop_amount", "yo_le_debo_al_cliente", "cliente_me_debe"],
+        lines
+    ))
+
+    totals = db.query(
+        ClientStatementLine.statement_id,
+        func.count(ClientStatementLine.id),
+        func.sum(ClientStatementLine.total_amount),
+        func.sum(ClientStatementLine.coop_amount),
+        func.sum(ClientStatementLine.yo_le_debo_al_cliente),
+        func.sum(ClientStatementLine.cliente_me_debe),
+    ).join(ClientStatement, ClientStatement.id == ClientStatementLine.statement_id) \
+        .filter(ClientStatement.period_start == period_start, ClientStatement.period_end == period_end,
+                ClientStatement.client_id.in_(statement_clients)) \
+        .group_by(ClientStatementLine.statement_id).all()
+
+    rows = [
+        {"statement_id": statement_id, **{f"new_{name}": value for name, value in zip(AMOUNT_COLUMNS, amounts)},
+         "new_saldo_neto": amounts[3] - amounts[4]}
+        for statement_id, *amounts in totals
+    ]
+    db.execute(
+        update(ClientStatement.__table__).where(ClientStatement.__table__.c.id == bindparam("statement_id"))
+        .values({name: bindparam(f"new_{name}") for name in (*AMOUNT_COLUMNS, "saldo_neto")}),
+        rows
+    )
+    db.commit()
+    return [row["statement_id"] for row in rows]
+
+
+def refresh_paid(db, payment_ids):
+    """Marca PAID (o de nuevo ISSUED) los estados de cuenta que incluyen estos pagos. No hace commit."""
+    statement_ids = {row[0] for row in db.execute(
+        select(ClientStatementLine.statement_id).where(ClientStatementLine.payment_id.in_(payment_ids)).distinct()
+    )}
+    if not statement_ids:
+        return
+
+    outstanding = {row[0] for row in db.execute(
+        select(ClientStatementLine.statement_id).join(Payment, Payment.id == ClientStatementLine.payment_id)
+        .where(ClientStatementLine.statement_id.in_(statement_ids),
+               Payment.client_settlement_status != ClientSettlementStatus.SETTLED)
+        .distinct()
+    )}
+    paid = statement_ids - outstanding
+
+    if paid:
+        db.execute(update(ClientStatement)
+                   .where(ClientStatement.id.in_(paid), ClientStatement.status != ClientStatementStatus.PAID)
+                   .values(status=ClientStatementStatus.PAID, paid_at=datetime.utcnow())
+                   .execution_options(synchronize_session=False))
+    if outstanding:
+        db.execute(update(ClientStatement)
+                   .where(ClientStatement.id.in_(outstanding), ClientStatement.status != ClientStatementStatus.ISSUED)
+                   .values(status=ClientStatementStatus.ISSUED, paid_at=None)
+                   .execution_options(synchronize_session=False))
+
+
+def statement_payload(statement, client, lines):
+    return {
+        "id": statement.id,
+        "client_id": client.id,
+        "client_name": client.client_name,
+        "client_phone": client.phone,
+        "period_start": statement.period_start.isoformat(),
+        "period_end": statement.period_end.isoformat(),
+        **{name: getattr(statement, name) for name in (*AMOUNT_COLUMNS, "saldo_neto")},
+        "lines": [
+            {
+                "payment_id": line.payment_id,
+                "delivery_id": line.delivery_id,
+                "date": line.payment_created_at.isoformat() if line.payment_created_at else "",
+                "payment_status": line.payment_status.value if line.payment_status else "",
+                "total_amount": line.total_amount,
+                "yo_le_debo_al_cliente": line.yo_le_debo_al_cliente,
+                "cliente_me_debe": line.cliente_me_debe,
+            }
+            for line in lines
+        ],
+    }
+
+
+def render_invoice(payload):
+    """PDF de la cuenta de cobro de un estado de cuenta."""
+    from io import BytesIO
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    height = letter[1]
+
+    def header():
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(40, height - 50, f"Estado de cuenta #{payload['id']} - {payload['client_name']}")
+        p.setFont("Helvetica", 10)
+        p.drawString(40, height - 68, f"Teléfono: {payload['client_phone']}")
+        p.drawString(40, height - 82, f"Periodo: {payload['period_start'][:10]} a {payload['period_end'][:10]}")
+        p.setFont("Helvetica-Bold", 10)
+        for x, text in ((40, "Pago"), (100, "Domicilio"), (170, "Fecha"), (260, "Estado"), (420, "Le debo"),
+                        (500, "Me debe")):
+            p.drawString(x, height - 110, text)
+        p.setFont("Helvetica", 10)
+        return height - 126
+
+    y = header()
+    for line in payload["lines"]:
+        if y < 120:
+            p.showPage()
+            y = header()
+        p.drawString(40, y, str(line["payment_id"]))
+        p.drawString(100, y, str(line["delivery_id"]))
+        p.drawString(170, y, line["date"][:10])
+        p.drawString(260, y, line["payment_status"])
+        p.drawRightString(470, y, f"{line['yo_le_debo_al_cliente']:,.0f}")
+        p.drawRightString(550, y, f"{line['cliente_me_debe']:,.0f}")
+        y -= 16
+
+    p.setFont("Helvetica-Bold", 10)
+    for label, name in (("Domicilios", "total_deliveries"), ("Total recaudado", "total_amount"),
+                        ("Le debo al cliente", "yo_le_debo_al_cliente"), ("El cliente me debe", "cliente_me_debe"),
+                        ("Saldo neto", "saldo_neto")):
+        y -= 16
+        p.drawString(300, y, label)
+        p.drawRightString(550, y, f"{payload[name]:,.0f}")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def render_invoices(db, statement_ids):
+    """Renderiza en el pool de procesos las cuentas de cobro que falten; devuelve cuántas se generaron."""
+    statements = db.query(ClientStatement, Client) \
+        .join(Client, Client.id == ClientStatement.client_id) \
+        .filter(ClientStatement.id.in_(statement_ids)).all()
+    if not statements:
+        return 0
+
+    lines_by_statement = {}
+    for line in db.query(ClientStatementLine) \
+            .filter(ClientStatementLine.statement_id.in_([statement.id for statement, _ in statements])) \
+            .order_by(ClientStatementLine.statement_id, ClientStatementLine.payment_id):
+        lines_by_statement.setdefault(line.statement_id, []).append(line)
+
+    pending = []
+    for statement, client in statements:
+        payload = statement_payload(statement, client, lines_by_statement.get(statement.id, []))
+        key = statement_hash(payload, "pdf")
+        statement.invoice_file = key
+        if not statement_store.has_file(key, "pdf"):
+            pending.append((key, payload))
+
+    for (key, _), pdf in zip(pending, get_executor().map(render_invoice, [payload for _, payload in pending])):
+        statement_store.write_file(key, "pdf", pdf)
+
+    db.commit()
+    return len(pending)
+
+
+def close_and_render(db, period_start, period_end, client_ids=None, with_invoices=True):
+    statement_ids = close_period(db, period_start, period_end, client_ids)
+    rendered = render_invoices(db, statement_ids) if with_invoices and statement_ids else 0
+    return {"period_start": period_start, "period_end": period_end,
+            "statement_ids": statement_ids, "invoices_rendered": rendered}
+
+
+_scheduler = None
+
+
+def start_scheduler(session_factory, period=CLIENT_STATEMENT_PERIOD, interval=CLIENT_STATEMENT_CHECK_SECONDS):
+    """Hilo que cierra el último periodo completo cuando aún no está cerrado."""
+    global _scheduler
+    if period not in ("weekly", "monthly") or _scheduler is not None:
+        return
+
+    def run():
+        while True:
+            try:
+                with session_factory() as db:
+                    close_and_render(db, *last_complete_period(period))
+            except Exception as error:
+                print(f"client_statements: no se pudo cerrar el periodo ({error})")
+            time.sleep(interval)
+
+    _scheduler = threading.Thread(target=run, name="client-statements-scheduler", daemon=True)
+    _scheduler.start()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command != "close":
+        print(__doc__)
+        sys.exit(2)
+
+    if len(sys.argv) >= 4:
+        start, end = datetime.fromisoformat(sys.argv[2]), datetime.fromisoformat(sys.argv[3])
+    else:
+        start, end = last_complete_period(CLIENT_STATEMENT_PERIOD or "monthly")
+
+    session = SessionLocal()
+    try:
+        report = close_and_render(session, start, end)
+        print(f"periodo {start:%Y-%m-%d} a {end:%Y-%m-%d}: {len(report['statement_ids'])} estados de cuenta, "
+              f"{report['invoices_rendered']} cuentas de cobro")
+    finally:
+        session.close()
@@ -0,0 +1,75 @@
+"""Motor de asignación automática de domicilios pendientes a riders.
+
+Greedy con heaps: cada domicilio va al rider de menor costo, donde el costo es su
+carga actual (domicilios ASSIGNED/IN_PROGRESS más los ya asignados en el plan) y se
+suma DISPATCH_ZONE_PENALTY si el rider no tiene trabajo en la zona del domicilio.
+Hay un heap global y uno por zona con los riders afines; las entradas viejas se
+descartan de forma perezosa comparando contra la carga vigente. Con 14 zonas cada
+asignación cuesta O(14 + log riders).
+"""
+import heapq
+import os
+from collections import defaultdict
+
+DISPATCH_ZONE_PENALTY = float(os.getenv("DISPATCH_ZONE_PENALTY", "3"))
+DISPATCH_MAX_LOAD = int(os.getenv("DISPATCH_MAX_LOAD", "0"))  # 0 = sin tope
+
+
+def _pop_valid(heap, loads, max_load):
+    """Tope del heap cuya carga coincide con la vigente y no supera el tope."""
+    while heap:
+        load, rider_id = heap[0]
+        if load != loads[rider_id] or (max_load and load >= max_load):
+            heapq.heappop(heap)
+            continue
+        return load, rider_id
+    return None
+
+
+def plan_assignments(deliveries, riders, zone_penalty=DISPATCH_ZONE_PENALTY, max_load=DISPATCH_MAX_LOAD):
+    """Propone una asignación.
+
+    deliveries: lista de (delivery_id, zona o None), en orden de prioridad.
+    riders: dict rider_id -> (carga actual, conjunto de zonas con trabajo abierto).
+    Devuelve (lista de (delivery_id, rider_id, zona), ids sin rider disponible).
+    """
+    loads = {rider_id: load for rider_id, (load, _) in riders.items()}
+    affinity = {rider_id: set(zones) for rider_id, (_, zones) in riders.items()}
+
+    global_heap = [(load, rider_id) for rider_id, load in loads.items()]
+    heapq.heapify(global_heap)
+    zone_heaps = defaultdict(list)
+    for rider_id, zones in affinity.items():
+        for zone in zones:
+            zone_heaps[zone].append((loads[rider_id], rider_id))
+    for heap in zone_heaps.values():
+        heapq.heapify(heap)
+
+    # Las zonas con más domicilios primero; dentro de cada zona se respeta el orden recibido
+    by_zone = defaultdict(list)
+    for delivery_id, zone in deliveries:
+        by_zone[zone].append(delivery_id)
+
+    assignments, unassigned = [], []
+    for zone, delivery_ids in sorted(by_zone.items(), key=lambda item: -len(item[1])):
+        for delivery_id in delivery_ids:
+            best_any = _pop_valid(global_heap, loads, max_load)
+            if best_any is None:
+                unassigned.append(delivery_id)
+                continue
+
+            choice = best_any[1]
+            best_zone = _pop_valid(zone_heaps[zone], loads, max_load) if zone is not None else None
+            if best_zone is not None and best_zone[0] <= best_any[0] + zone_penalty:
+                choice = best_zone[1]
+
+            loads[choice] += 1
+            assignments.append((delivery_id, choice, zone))
+
+            if zone is not None:
+                affinity[choice].add(zone)
+            heapq.heappush(global_heap, (loads[choice], choice))
+            for rider_zone in affinity[choice]:
+                heapq.heappush(zone_heaps[rider_zone], (loads[choice], choice))
+
+    return assignments, unassigned
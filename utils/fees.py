@@ -0,0 +1,139 @@
+"""Motor de tarifas: reglas de la tabla fee_rules compiladas en memoria.
+
+Cada regla fija total_amount y coop_amount para una combinación de zona, cliente y
+tamaño de paquete (None = cualquiera) dentro de un rango de fechas. Las reglas se
+compilan en un dict por llave con sus fechas de inicio ordenadas, así que cotizar un
+domicilio son como máximo ocho búsquedas en el dict más un bisect, sin consultas.
+
+Cualquier cambio en las reglas sube la versión de la fila tocada; un hilo revisa la
+firma de la tabla cada FEE_RULES_RELOAD_SECONDS y recompila si cambió, para que los
+demás workers tomen las reglas nuevas. Sin regla aplicable se usa utils.mapping.
+"""
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from itertools import product
+
+from sqlalchemy import func, case
+
+from models.models import FeeRule
+from utils.mapping import get_delivery_fee
+
+DEFAULT_COOP_AMOUNT = float(os.getenv("DEFAULT_COOP_AMOUNT", "2000"))
+FEE_RULES_RELOAD_SECONDS = float(os.getenv("FEE_RULES_RELOAD_SECONDS", "30"))  # 0 = sin recarga periódica
+
+Fee = namedtuple("Fee", "total_amount coop_amount rule_id")
+
+# Orden de búsqueda de la más específica a la más general; el cliente pesa más que la zona
+_SPECIFICITY = [
+    (use_location, use_client, use_size)
+    for use_client, use_location, use_size in product((True, False), repeat=3)
+]
+
+
+def next_version(db):
+    """Versión para la próxima regla creada o modificada."""
+    return (db.query(func.max(FeeRule.version)).scalar() or 0) + 1
+
+
+def _signature(db):
+    return tuple(db.query(func.max(FeeRule.version), func.count(FeeRule.id),
+                          func.sum(case((FeeRule.is_active, 1), else_=0))).one())
+
+
+class FeeTable:
+
+    def __init__(self):
+        self._rules = {}
+        self._signature = None
+        self.version = 0
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def load(self, db):
+        """Compila las reglas activas y reemplaza la tabla en memoria de una sola vez."""
+        signature = _signature(db)
+        grouped = defaultdict(list)
+        for rule in db.query(FeeRule).filter(FeeRule.is_active):
+            key = (rule.delivery_location, rule.client_id, rule.package_size)
+            grouped[key].append((rule.valid_from, rule.id, rule.valid_to,
+                                 Fee(rule.total_amount, rule.coop_amount, rule.id)))
+
+        rules = {}
+        for key, entries in grouped.items():
+            entries.sort(key=lambda entry: (entry[0], entry[1]))
+            rules[key] = ([entry[0] for entry in entries], [(entry[2], entry[3]) for entry in entries])
+
+        with self._lock:
+            self._rules = rules
+            self._signature = signature
+            self.version = signature[0] or 0
+            self.loaded_at = datetime.utcnow()
+        return len(grouped)
+
+    def refresh(self, db):
+        """Recompila solo si la tabla cambió desde la última carga."""
+        if _signature(db) != self._signature:
+            self.load(db)
+            return True
+        return False
+
+    def _match(self, key, at):
+        entry = self._rules.get(key)
+        if entry is None:
+            return None
+        starts, fees = entry
+        # La regla vigente más reciente; si ya venció se prueba la anterior
+        for index in range(bisect_right(starts, at) - 1, -1, -1):
+            valid_to, fee = fees[index]
+            if valid_to is None or at < valid_to:
+                return fee
+        return None
+
+    def quote(self, location, client_id=None, package_size=None, at=None):
+        """Tarifa para un domicilio; Fee con rule_id None si salió del valor por zona."""
+        at = at or datetime.utcnow()
+        for use_location, use_client, use_size in _SPECIFICITY:
+            fee = self._match((location if use_location else None,
+                               client_id if use_client else None,
+                               package_size if use_size else None), at)
+            if fee is not None:
+                return fee
+
+        total_amount = get_delivery_fee(location)
+        if total_amount is None:
+            return None
+        return Fee(total_amount, DEFAULT_COOP_AMOUNT, None)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "keys": len(self._rules),
+            "rules": sum(len(starts) for starts, _ in self._rules.values()),
+            "loaded_at": self.loaded_at,
+            "reload_seconds": FEE_RULES_RELOAD_SECONDS,
+        }
+
+    def start_watcher(self, session_factory, interval=FEE_RULES_RELOAD_SECONDS):
+        """Hilo que recompila la tabla cuando otro worker cambia las reglas."""
+        if not interval or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    with session_factory() as db:
+                        self.refresh(db)
+                except Exception as error:
+                    print(f"fee_rules: no se pudo recargar ({error})")
+
+        self._watcher = threading.Thread(target=watch, name="fee-rules-watcher", daemon=True)
+        self._watcher.start()
+
+
+fee_table = FeeTable()
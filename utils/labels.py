@@ -0,0 +1,228 @@
+"""Render de etiquetas de domicilios en PDF con ReportLab."""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from utils.mapping import split_address
+
+HALF_LETTER = (letter[0], letter[1] / 2)  # (612, 396)
+
+LABEL_RENDER_WORKERS = int(os.getenv("LABEL_RENDER_WORKERS", "2"))
+LABEL_CACHE_MAX_BYTES = int(os.getenv("LABEL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+LABEL_CACHE_DIR = os.getenv("LABEL_CACHE_DIR")
+LABEL_CACHE_DISK_ENTRIES = int(os.getenv("LABEL_CACHE_DISK_ENTRIES", "5000"))
+
+_executor = None
+
+
+def get_executor():
+    """Pool de procesos para renderizar lotes sin bloquear el event loop."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=LABEL_RENDER_WORKERS)
+    return _executor
+
+
+def label_from_delivery(delivery):
+    """Campos impresos en la etiqueta a partir de un Delivery con rider y client cargados."""
+    address, location = split_address(delivery.delivery_address)
+    return {
+        "id": delivery.id,
+        "rider_name": delivery.rider.name if delivery.rider else "Sin asignar",
+        "client_name": delivery.client.client_name if delivery.client else "Desconocido",
+        "package_name": delivery.package_name,
+        "delivery_address": address,
+        "delivery_location": location or "",
+        "receptor_name": delivery.receptor_name,
+        "receptor_number": delivery.receptor_number,
+        "created_at": delivery.created_at,
+        "delivery_comment": delivery.delivery_comment,
+        "delivery_total_amount": delivery.delivery_total_amount,
+    }
+
+
+def draw_label(p, label, top):
+    """Dibuja una etiqueta con su primera línea 46 puntos debajo de ``top``."""
+    y = top - 46
+    p.setFont("Helvetica", 14)
+    for text in (
+        f"ID: {label['id']}",
+        f"Rider: {label['rider_name']}",
+        f"Cliente: {label['client_name']}",
+        f"Nombre Paquete: {label['package_name']}",
+        f"Dirección: {label['delivery_address']} ",
+        f"Barrio: {label['delivery_location']}",
+        f"Receptor: {label['receptor_name']} ",
+        f"Número Receptor: {label['receptor_number']} ",
+        f"Fecha creación: {label['created_at']}",
+        f"Comentario: {label['delivery_comment']}",
+        f"Monto a cobrar: {label['delivery_total_amount']}",
+    ):
+        p.drawString(30, y, text)
+        y -= 20
+
+
+def render_labels(labels, labels_per_sheet=1):
+    """PDF con una etiqueta por media carta, o dos por hoja carta."""
+    page_size = HALF_LETTER if labels_per_sheet == 1 else letter
+    page_height = page_size[1]
+
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=page_size)
+
+    for index, label in enumerate(labels):
+        slot = index % labels_per_sheet
+        if index and slot == 0:
+            p.showPage()
+        draw_label(p, label, page_height - slot * HALF_LETTER[1])
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def render_label(label):
+    return render_labels([label])
+
+
+def label_hash(label):
+    """Hash de los campos impresos: si alguno cambia, la etiqueta es otra."""
+    raw = json.dumps(label, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LabelCache:
+    """LRU de PDFs renderizados limitado en bytes, con derrame opcional a disco.
+
+    Las entradas se indexan por hash de contenido y por id de domicilio, para
+    poder descartarlas cuando el domicilio cambia; el índice por domicilio se poda
+    cada vez que una llave sale del caché (desalojo, tope de disco o invalidate).
+    """
+
+    def __init__(self, max_bytes, spill_dir=None, max_disk_entries=5000):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._size = 0
+        self._by_delivery = {}
+        self._deliveries_by_key = {}
+        self._lock = threading.Lock()
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.pdf")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if key in self._disk:
+                try:
+                    with open(self._path(key), "rb") as file:
+                        pdf = file.read()
+                except OSError:
+                    self._disk.pop(key, None)
+                    self._forget(key)
+                else:
+                    self._disk.pop(key)
+                    self._remove_file(key)
+                    self._store(key, pdf)
+                    self.hits += 1
+                    return pdf
+
+            self.misses += 1
+            return None
+
+    def put(self, key, pdf, delivery_ids):
+        with self._lock:
+            for delivery_id in delivery_ids:
+                self._by_delivery.setdefault(delivery_id, set()).add(key)
+            self._deliveries_by_key.setdefault(key, set()).update(delivery_ids)
+            self._store(key, pdf)
+
+    def _store(self, key, pdf):
+        if key in self._memory:
+            self._size -= len(self._memory.pop(key))
+        self._memory[key] = pdf
+        self._size += len(pdf)
+
+        while self._size > self.max_bytes and len(self._memory) > 1:
+            old_key, old_pdf = self._memory.popitem(last=False)
+            self._size -= len(old_pdf)
+            if not self._spill(old_key, old_pdf):
+                self._forget(old_key)
+
+    def _spill(self, key, pdf):
+        """Pasa la entrada a disco; False si no hay disco o no se pudo escribir."""
+        if not self.spill_dir:
+            return False
+        try:
+            with open(self._path(key), "wb") as file:
+                file.write(pdf)
+        except OSError:
+            return False
+        self._disk[key] = True
+
+        while len(self._disk) > self.max_disk_entries:
+            old_key, _ = self._disk.popitem(last=False)
+            self._remove_file(old_key)
+            self._forget(old_key)
+        return True
+
+    def _forget(self, key):
+        """Quita la llave del índice por domicilio cuando sale del caché."""
+        for delivery_id in self._deliveries_by_key.pop(key, ()):
+            keys = self._by_delivery.get(delivery_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_delivery[delivery_id]
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, delivery_id):
+        """Descarta las etiquetas (y lotes) que incluyen el domicilio."""
+        with self._lock:
+            for key in list(self._by_delivery.get(int(delivery_id), ())):
+                if key in self._memory:
+                    self._size -= len(self._memory.pop(key))
+                if self._disk.pop(key, None):
+                    self._remove_file(key)
+                self._forget(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "indexed_deliveries": len(self._by_delivery),
+            }
+
+
+label_cache = LabelCache(LABEL_CACHE_MAX_BYTES, LABEL_CACHE_DIR, LABEL_CACHE_DISK_ENTRIES)
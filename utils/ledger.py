@@ -0,0 +1,329 @@
+"""Ledger materializado de pagos para /payments/dashboard.
+
+La tabla ``payment_ledger`` guarda, por cada combinación de
+(settlement_status, payment_status, client_settlement_status, estado del domicilio,
+si el pago tiene domicilio), el número de pagos y la suma de sus montos. Se mantiene incrementalmente en cada
+flush de la sesión, así el dashboard lee unas pocas filas en vez de recorrer
+``payments JOIN deliveries`` siete veces.
+
+Uso por consola:
+    python -m utils.ledger rebuild   # reconstruye el ledger desde las tablas
+    python -m utils.ledger check     # compara el ledger contra las tablas
+    python -m utils.ledger parity    # compara y cronometra los modos del dashboard
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import select, func, case, and_, or_, not_, insert, delete, event, inspect, type_coerce
+
+from db.db import SessionLocal, DbSession
+from models.models import Payment, Delivery, PaymentLedger, LEDGER_NULL_KEY
+from schemas.schemas import SettlementStatus, PaymentStatus, ClientSettlementStatus, DeliveryStanding
+from utils.upsert import increment
+
+KEY_COLUMNS = ("settlement_status", "payment_status", "client_settlement_status", "delivery_state", "has_delivery")
+AMOUNT_COLUMNS = ("payments_count", "total_amount", "rider_amount", "coop_amount")
+
+_ZERO = (0, 0.0, 0.0, 0.0)
+_PENDING_FLUSH_KEY = "payment_ledger_before"
+
+# Modo de consulta del dashboard: "ledger" (tabla materializada) o
+# "single_pass" (un solo recorrido de payments LEFT JOIN deliveries con SUM(CASE ...))
+DASHBOARD_QUERY_MODES = ("ledger", "single_pass")
+DASHBOARD_QUERY_MODE = os.getenv("DASHBOARD_QUERY_MODE", "ledger")
+
+
+def aggregate_by_key(conn, where=None):
+    """Agrupa los pagos (opcionalmente filtrados) por la llave del ledger.
+
+    Incluye los pagos sin domicilio (has_delivery False): las consultas originales de
+    totalTransactions/totalAmount no hacían JOIN y los cuentan; las demás sí lo hacían.
+    """
+    has_delivery = Delivery.id.is_not(None)
+    stmt = select(
+        Payment.settlement_status,
+        Payment.payment_status,
+        Payment.client_settlement_status,
+        Delivery.state,
+        has_delivery,
+        func.count(Payment.id),
+        func.sum(Payment.total_amount),
+        func.sum(Payment.rider_amount),
+        func.sum(Payment.coop_amount),
+    ).select_from(Payment).outerjoin(Delivery, Payment.delivery_id == Delivery.id) \
+        .group_by(Payment.settlement_status, Payment.payment_status,
+                  Payment.client_settlement_status, Delivery.state, has_delivery)
+
+    if where is not None:
+        stmt = stmt.where(where)
+
+    return {
+        (*row[:4], bool(row[4])): (row[5], float(row[6] or 0), float(row[7] or 0), float(row[8] or 0))
+        for row in conn.execute(stmt)
+    }
+
+
+def _upsert(conn, key, delta):
+    """Suma ``delta`` a la fila de la llave, creándola si no existe, en una sola sentencia."""
+    # NULL en la llave se guarda como LEDGER_NULL_KEY para que el índice único la cubra
+    keys = {name: LEDGER_NULL_KEY if value is None else value for name, value in zip(KEY_COLUMNS, key)}
+    increment(conn, PaymentLedger.__table__, keys, dict(zip(AMOUNT_COLUMNS, delta)), updated_at=datetime.utcnow())
+
+
+def apply_deltas(conn, before, after):
+    """Suma al ledger la diferencia entre dos agregados del mismo conjunto de pagos."""
+    for key in set(before) | set(after):
+        old = before.get(key, _ZERO)
+        new = after.get(key, _ZERO)
+        delta = [n - o for n, o in zip(new, old)]
+        if any(delta):
+            _upsert(conn, key, delta)
+
+
+@contextmanager
+def tracking(db, where):
+    """Mantiene el ledger alrededor de UPDATE/INSERT masivos que no pasan por el ORM.
+
+    ``where`` debe seleccionar el mismo conjunto de pagos antes y después del cambio
+    (por ejemplo por ids), no por los estados que se van a modificar.
+    """
+    conn = db.connection()
+    before = aggregate_by_key(conn, where)
+    yield
+    apply_deltas(conn, before, aggregate_by_key(conn, where))
+
+
+def _affected(payment_ids, delivery_ids):
+    clauses = []
+    if payment_ids:
+        clauses.append(Payment.id.in_(payment_ids))
+    if delivery_ids:
+        clauses.append(Payment.delivery_id.in_(delivery_ids))
+    return or_(*clauses)
+
+
+def _before_flush(session, flush_context, instances):
+    payment_ids, delivery_ids = set(), set()
+
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, Payment) and obj.id is not None:
+            payment_ids.add(obj.id)
+        elif isinstance(obj, Delivery) and obj.id is not None:
+            if obj in session.deleted or inspect(obj).attrs.state.history.has_changes():
+                delivery_ids.add(obj.id)
+
+    if delivery_ids:
+        # Al borrar un domicilio el flush deja delivery_id en NULL: se siguen sus pagos por id
+        payment_ids.update(session.connection().scalars(
+            select(Payment.id).where(Payment.delivery_id.in_(delivery_ids))))
+
+    before =aggregate_by_key(session.connection(), _affected(payment_ids, delivery_ids)) \
+        if payment_ids or delivery_ids else {}
+
+    session.info[_PENDING_FLUSH_KEY] = (payment_ids, delivery_ids, before)
+
+
+def _after_flush(session, flush_context):
+    payment_ids, delivery_ids, before = session.info.pop(_PENDING_FLUSH_KEY, (set(), set(), {}))
+    payment_ids |= {obj.id for obj in session.new if isinstance(obj, Payment)}
+
+    if not payment_ids and not delivery_ids:
+        return
+
+    conn = session.connection()
+    apply_deltas(conn, before, aggregate_by_key(conn, _affected(payment_ids, delivery_ids)))
+
+
+# Sobre DbSession para cubrir tanto SessionLocal como AsyncSessionLocal
+event.listen(DbSession, "before_flush", _before_flush)
+event.listen(DbSession, "after_flush", _after_flush)
+
+
+def rebuild(db):
+    """Reconstruye el ledger completo desde payments/deliveries."""
+    conn = db.connection()
+    conn.execute(delete(PaymentLedger))
+    rows = [
+        {**dict(zip(KEY_COLUMNS, key)), **dict(zip(AMOUNT_COLUMNS, amounts))}
+        for key, amounts in aggregate_by_key(conn).items()
+    ]
+    if rows:
+        conn.execute(insert(PaymentLedger), rows)
+    db.commit()
+    return len(rows)
+
+
+def ensure_built(db):
+    """Construye el ledger si está vacío pero ya hay pagos (bases creadas con create_all)."""
+    if db.query(PaymentLedger.id).first() is None and db.query(Payment.id).first() is not None:
+        rebuild(db)
+
+
+def check(db, tolerance=1e-6):
+    """Devuelve las llaves en las que el ledger no coincide con las tablas."""
+    expected = aggregate_by_key(db.connection())
+    stored = {
+        tuple(getattr(row, name) for name in KEY_COLUMNS): tuple(getattr(row, name) for name in AMOUNT_COLUMNS)
+        for row in db.query(PaymentLedger).all()
+    }
+
+    mismatches = []
+    for key in set(expected) | set(stored):
+        exp = expected.get(key, _ZERO)
+        got = stored.get(key, _ZERO)
+        if any(abs(e - g) > tolerance for e, g in zip(exp, got)):
+            mismatches.append({
+                "key": {name: getattr(value, "value", value) for name, value in zip(KEY_COLUMNS, key)},
+                "expected": dict(zip(AMOUNT_COLUMNS, exp)),
+                "ledger": dict(zip(AMOUNT_COLUMNS, got)),
+            })
+    return mismatches
+
+
+def _summary_columns(settlement_status, payment_status, client_status, state, has_delivery, n, total, rider, coop):
+    """Expresiones SUM(CASE ...) de cada contador del dashboard.
+
+    Los contadores con condición solo cuentan pagos con domicilio, como las consultas
+    originales con JOIN; totalTransactions y totalAmount cuentan todos los pagos.
+    """
+    def count_if(condition):
+        return func.sum(case((and_(has_delivery, condition), n), else_=0))
+
+    def sum_if(condition, amount):
+        return func.sum(case((and_(has_delivery, condition), amount), else_=0))
+
+    rider_pending = and_(settlement_status == SettlementStatus.PENDING,
+                         payment_status == PaymentStatus.COURIER,
+                         state == DeliveryStanding.DELIVERED)
+    to_pay_rider = and_(payment_status != PaymentStatus.OFFICE,
+                        settlement_status != SettlementStatus.SETTLED,
+                        not_(and_(settlement_status == SettlementStatus.PENDING,
+                                  payment_status == PaymentStatus.COURIER)))
+    from_client = and_(settlement_status == SettlementStatus.TRANFERRED_TO_CLIENT,
+                       payment_status == PaymentStatus.CLIENT_RECIEVED_TRANSFER)
+    from_office = and_(settlement_status == SettlementStatus.TRANSFER_TO_OFFICE,
+                       payment_status == PaymentStatus.OFFICE_RECIEVED_TRANSFER)
+    client_open = and_(state == DeliveryStanding.DELIVERED,
+                       client_status != ClientSettlementStatus.SETTLED,
+                       settlement_status != SettlementStatus.PENDING)
+    office_to_client = and_(client_open, payment_status.in_([PaymentStatus.OFFICE_RECIEVED_TRANSFER,
+                                                             PaymentStatus.OFFICE,
+                                                             PaymentStatus.COURIER]))
+    client_to_office = and_(client_open, payment_status == PaymentStatus.CLIENT_RECIEVED_TRANSFER)
+
+    return [
+        count_if(to_pay_rider).label("to_pay_rider_count"),
+        sum_if(to_pay_rider, rider).label("to_pay_rider_total"),
+        sum_if(from_client, rider).label("pending_to_rider_from_client"),
+        sum_if(from_office, rider).label("pending_to_rider_from_office"),
+        count_if(rider_pending).label("pendingRiderPayments"),
+        sum_if(rider_pending, total - rider).label("pendingRiderAmount"),
+        count_if(client_to_office).label("pendingClientPayments"),
+        sum_if(client_to_office, rider + coop).label("pendingClientAmount"),
+        count_if(office_to_client).label("pendingOfficeToClient"),
+        sum_if(office_to_client, total - (rider + coop)).label("pendingOfficeToClientAmount"),
+        func.sum(n).label("totalTransactions"),
+        func.sum(total).label("totalAmount"),
+    ]
+
+
+_COUNT_FIELDS = {"to_pay_rider_count", "pendingRiderPayments", "pendingClientPayments",
+                 "pendingOfficeToClient", "totalTransactions"}
+
+
+def _summary_from_row(row):
+    return {
+        name: int(value or 0) if name in _COUNT_FIELDS else float(value or 0)
+        for name, value in row._asdict().items()
+    }
+
+
+def dashboard_summary(db):
+    """Contadores del dashboard calculados sobre el ledger en una sola consulta."""
+    # Las llaves NULL se guardan como LEDGER_NULL_KEY; se devuelven a NULL para que
+    # las comparaciones den lo mismo que sobre payments
+    keys = [type_coerce(func.nullif(column, LEDGER_NULL_KEY), column.type)
+            for column in (getattr(PaymentLedger, name) for name in KEY_COLUMNS[:4])]
+    row = db.execute(select(*_summary_columns(
+        *keys,
+        PaymentLedger.has_delivery,
+        PaymentLedger.payments_count,
+        PaymentLedger.total_amount,
+        PaymentLedger.rider_amount,
+        PaymentLedger.coop_amount,
+    ))).one()
+    return _summary_from_row(row)
+
+
+def dashboard_summary_single_pass(db):
+    """Contadores del dashboard en un solo recorrido de payments LEFT JOIN deliveries."""
+    row = db.execute(select(*_summary_columns(
+        Payment.settlement_status,
+        Payment.payment_status,
+        Payment.client_settlement_status,
+        Delivery.state,
+        Delivery.id.is_not(None),
+        1,
+        Payment.total_amount,
+        Payment.rider_amount,
+        Payment.coop_amount,
+    )).select_from(Payment).outerjoin(Delivery, Payment.delivery_id == Delivery.id)).one()
+    return _summary_from_row(row)
+
+
+def summary_for_mode(db, mode=None):
+    mode = mode or DASHBOARD_QUERY_MODE
+    if mode == "single_pass":
+        return dashboard_summary_single_pass(db)
+    return dashboard_summary(db)
+
+
+def parity(db, repeat=5):
+    """Ejecuta todos los modos, compara sus resultados y reporta la latencia de cada uno."""
+    results, timings = {}, {}
+    for mode in DASHBOARD_QUERY_MODES:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            results[mode] = summary_for_mode(db, mode)
+        timings[mode] = (time.perf_counter() - started) / repeat * 1000
+
+    reference = results[DASHBOARD_QUERY_MODES[0]]
+    differences = {
+        mode: {name: (reference[name], value) for name, value in summary.items()
+               if abs(reference[name] - value) > 1e-6}
+        for mode, summary in results.items()
+    }
+    return {
+        "consistent": not any(differences.values()),
+        "differences": {mode: diff for mode, diff in differences.items() if diff},
+        "latency_ms": timings,
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    session = SessionLocal()
+    try:
+        if command == "rebuild":
+            print(f"ledger reconstruido: {rebuild(session)} llaves")
+        elif command == "check":
+            differences = check(session)
+            for difference in differences:
+                print(difference)
+            print("ledger consistente" if not differences else f"{len(differences)} llaves con diferencias")
+            sys.exit(1 if differences else 0)
+        elif command == "parity":
+            report = parity(session)
+            for mode, latency in report["latency_ms"].items():
+                print(f"{mode}: {latency:.2f} ms")
+            print(report["differences"] or "modos consistentes")
+            sys.exit(0 if report["consistent"] else 1)
+        else:
+            print(__doc__)
+            sys.exit(2)
+    finally:
+        session.close()
@@ -1,3 +1,5 @@
+import re
+
 from schemas.schemas import DeliveryLocations
 
 
@@ -21,4 +23,16 @@ delivery_fees = {
 
 
 def get_delivery_fee(location: DeliveryLocations):
-    return delivery_fees.get(location)
\ No newline at end of file
+    return delivery_fees.get(location)
+
+
+# new_delivery guarda la ubicación como sufijo de la dirección: "Calle 1 # 2-3 (Envigado)"
+_LOCATION_SUFFIX = re.compile(r"^(?P<address>.*?)\s*\((?P<location>[^()]*)\)\s*$")
+
+
+def split_address(delivery_address: str):
+    """Separa la dirección y la ubicación guardada como sufijo entre paréntesis."""
+    match = _LOCATION_SUFFIX.match(delivery_address or "")
+    if not match:
+        return delivery_address, None
+    return match.group("address"), match.group("location")
@@ -0,0 +1,223 @@
+"""Resumen de actividad por rider para /rider/{rider_id}.
+
+El resumen sale de dos consultas agrupadas (domicilios por estado y montos de sus
+pagos). Con RIDER_STATS_COUNTERS=true además se mantiene la tabla ``rider_stats``
+con los mismos contadores por rider: en cada flush se agregan antes y después los
+domicilios tocados y se suma la diferencia, igual que el ledger de pagos; los
+INSERT/UPDATE masivos la mantienen con ``tracking`` y ``record_inserted``.
+
+Uso por consola:
+    python -m utils.rider_stats rebuild   # reconstruye los contadores desde las tablas
+    python -m utils.rider_stats check     # compara los contadores contra las tablas
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import select, func, case, insert, delete, event, inspect
+
+from db.db import SessionLocal, DbSession
+from models.models import Payment, Delivery, RiderStats
+from schemas.schemas import DeliveryStanding, SettlementStatus
+from utils.upsert import increment
+
+RIDER_STATS_COUNTERS = os.getenv("RIDER_STATS_COUNTERS", "false").lower() in ("1", "true", "yes")
+
+COUNTER_COLUMNS = ("total_deliveries", "pending_deliveries", "in_progress_deliveries", "completed_deliveries",
+                   "total_earnings", "pending_payments")
+
+_ZERO = (0, 0, 0, 0, 0.0, 0.0)
+_PENDING_FLUSH_KEY = "rider_stats_before"
+
+
+def aggregate_by_rider(conn, where=None):
+    """Contadores por rider de los domicilios (opcionalmente filtrados) y sus pagos."""
+    def count_state(state):
+        return func.sum(case((Delivery.state == state, 1), else_=0))
+
+    deliveries = select(
+        Delivery.rider_id,
+        func.count(Delivery.id),
+        count_state(DeliveryStanding.PENDING),
+        count_state(DeliveryStanding.IN_PROGRESS),
+        count_state(DeliveryStanding.DELIVERED),
+    ).where(Delivery.rider_id.is_not(None)).group_by(Delivery.rider_id)
+
+    payments = select(
+        Delivery.rider_id,
+        func.sum(Payment.rider_amount),
+        func.sum(case((Payment.settlement_status == SettlementStatus.PENDING, Payment.rider_amount), else_=0)),
+    ).select_from(Payment).join(Delivery, Payment.delivery_id == Delivery.id) \
+        .where(Delivery.rider_id.is_not(None)).group_by(Delivery.rider_id)
+
+    if where is not None:
+        deliveries = deliveries.where(where)
+        payments = payments.where(where)
+
+    counters = {
+        row[0]: (row[1], int(row[2] or 0), int(row[3] or 0), int(row[4] or 0), 0.0, 0.0)
+        for row in conn.execute(deliveries)
+    }
+    for rider_id, earnings, pending in conn.execute(payments):
+        counters[rider_id] = counters[rider_id][:4] + (float(earnings or 0), float(pending or 0))
+    return counters
+
+
+def apply_deltas(conn, before, after):
+    """Suma a rider_stats la diferencia entre dos agregados de los mismos domicilios."""
+    for rider_id in set(before) | set(after):
+        old = before.get(rider_id, _ZERO)
+        new = after.get(rider_id, _ZERO)
+        delta = [n - o for n, o in zip(new, old)]
+        if any(delta):
+            # Un solo INSERT ... ON CONFLICT: dos flush que crean el mismo rider no chocan
+            increment(conn, RiderStats.__table__, {"rider_id": rider_id}, dict(zip(COUNTER_COLUMNS, delta)),
+                      updated_at=datetime.utcnow())
+
+
+@contextmanager
+def tracking(db, where):
+    """Mantiene rider_stats alrededor de UPDATE masivos que no pasan por el ORM.
+
+    ``where`` filtra domicilios y debe seleccionar los mismos antes y después del cambio.
+    """
+    if not RIDER_STATS_COUNTERS:
+        yield
+        return
+    conn = db.connection()
+    before = aggregate_by_rider(conn, where)
+    yield
+    apply_deltas(conn, before, aggregate_by_rider(conn, where))
+
+
+def record_inserted(db, delivery_ids):
+    """Suma a rider_stats domicilios (y sus pagos) recién insertados sin el ORM."""
+    if RIDER_STATS_COUNTERS and delivery_ids:
+        conn = db.connection()
+        apply_deltas(conn, {}, aggregate_by_rider(conn, Delivery.id.in_(delivery_ids)))
+
+
+def _delivery_id_of(payment):
+    if payment.delivery_id is not None:
+        return payment.delivery_id
+    return payment.delivery.id if payment.delivery is not None else None
+
+
+def _before_flush(session, flush_context, instances):
+    delivery_ids = set()
+
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, Delivery) and obj.id is not None:
+            attrs = inspect(obj).attrs
+            if obj in session.deleted or attrs.state.history.has_changes() or attrs.rider_id.history.has_changes():
+                delivery_ids.add(obj.id)
+        elif isinstance(obj, Payment):
+            # También el domicilio anterior si el pago cambió de domicilio
+            delivery_ids.update(inspect(obj).attrs.delivery_id.history.deleted)
+            delivery_ids.add(_delivery_id_of(obj))
+
+    for obj in session.new:
+        if isinstance(obj, Payment):
+            delivery_ids.add(_delivery_id_of(obj))
+
+    delivery_ids.discard(None)
+    before = aggregate_by_rider(session.connection(), Delivery.id.in_(delivery_ids)) if delivery_ids else {}
+
+    session.info[_PENDING_FLUSH_KEY] = (delivery_ids, before)
+
+
+def _after_flush(session, flush_context):
+    delivery_ids, before = session.info.pop(_PENDING_FLUSH_KEY, (set(), {}))
+    for obj in session.new:
+        if isinstance(obj, Delivery):
+            delivery_ids.add(obj.id)
+        elif isinstance(obj, Payment):
+            delivery_ids.add(obj.delivery_id)
+    delivery_ids.discard(None)
+
+    if not delivery_ids:
+        return
+
+    conn = session.connection()
+    apply_deltas(conn, before, aggregate_by_rider(conn, Delivery.id.in_(delivery_ids)))
+
+
+# Sobre DbSession para cubrir tanto SessionLocal como AsyncSessionLocal
+if RIDER_STATS_COUNTERS:
+    event.listen(DbSession, "before_flush", _before_flush)
+    event.listen(DbSession, "after_flush", _after_flush)
+
+
+def rebuild(db):
+    """Reconstruye rider_stats completo desde deliveries/payments."""
+    conn = db.connection()
+    conn.execute(delete(RiderStats))
+    rows = [
+        {"rider_id": rider_id, **dict(zip(COUNTER_COLUMNS, counters))}
+        for rider_id, counters in aggregate_by_rider(conn).items()
+    ]
+    if rows:
+        conn.execute(insert(RiderStats), rows)
+    db.commit()
+    return len(rows)
+
+
+def ensure_built(db):
+    """Construye los contadores si están activados, vacíos y ya hay domicilios con rider."""
+    if not RIDER_STATS_COUNTERS:
+        return
+    if db.query(RiderStats.rider_id).first() is None and \
+            db.query(Delivery.id).filter(Delivery.rider_id.is_not(None)).first() is not None:
+        rebuild(db)
+
+
+def check(db, tolerance=1e-6):
+    """Devuelve los riders cuyos contadores no coinciden con las tablas."""
+    expected = aggregate_by_rider(db.connection())
+    stored = {
+        row.rider_id: tuple(getattr(row, name) for name in COUNTER_COLUMNS)
+        for row in db.query(RiderStats).all()
+    }
+
+    mismatches = []
+    for rider_id in set(expected) | set(stored):
+        exp = expected.get(rider_id, _ZERO)
+        got = stored.get(rider_id, _ZERO)
+        if any(abs(e - g) > tolerance for e, g in zip(exp, got)):
+            mismatches.append({
+                "rider_id": rider_id,
+                "expected": dict(zip(COUNTER_COLUMNS, exp)),
+                "stored": dict(zip(COUNTER_COLUMNS, got)),
+            })
+    return mismatches
+
+
+def summary(db, rider_id):
+    """Contadores de un rider: de rider_stats si está activado, si no con las consultas agrupadas."""
+    if RIDER_STATS_COUNTERS:
+        row = db.get(RiderStats, rider_id)
+        counters = tuple(getattr(row, name) for name in COUNTER_COLUMNS) if row else _ZERO
+    else:
+        counters = aggregate_by_rider(db.connection(), Delivery.rider_id == rider_id).get(rider_id, _ZERO)
+    return dict(zip(COUNTER_COLUMNS, counters))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    session = SessionLocal()
+    try:
+        if command == "rebuild":
+            print(f"rider_stats reconstruido: {rebuild(session)} riders")
+        elif command == "check":
+            differences = check(session)
+            for difference in differences:
+                print(difference)
+            print("rider_stats consistente" if not differences else f"{len(differences)} riders con diferencias")
+            sys.exit(1 if differences else 0)
+        else:
+            print(__doc__)
+            sys.exit(2)
+    finally:
+        session.close()
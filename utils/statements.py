@@ -0,0 +1,219 @@
+"""Extractos de pago de riders (PDF o CSV) generados como trabajos en segundo plano.
+
+Los montos de todos los riders salen de una consulta agrupada por rider, día y
+estado de liquidación. Cada extracto se renderiza en el pool de procesos y se
+guarda en STATEMENT_DIR/cache con el hash de su contenido, así un extracto que no
+cambió no se vuelve a renderizar. El estado de cada trabajo vive en
+STATEMENT_DIR/jobs/<job_id>.json para que cualquier worker pueda servirlo.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from sqlalchemy import func
+
+from models.models import Payment, Delivery, Rider
+
+STATEMENT_DIR = os.getenv("STATEMENT_DIR", "./statements")
+STATEMENT_RENDER_WORKERS = int(os.getenv("STATEMENT_RENDER_WORKERS", "2"))
+
+MEDIA_TYPES = {"pdf": "application/pdf", "csv": "text/csv"}
+
+_AMOUNT_FIELDS = ("payments", "total_amount", "rider_amount", "coop_amount")
+
+_executor = None
+
+
+def get_executor():
+    """Pool de procesos para renderizar extractos sin bloquear el event loop."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=STATEMENT_RENDER_WORKERS)
+    return _executor
+
+
+def build_statements(db, start_date, end_date, rider_ids=None):
+    """Datos del extracto de cada rider activo (o de rider_ids) en [start_date, end_date)."""
+    riders = db.query(Rider.id, Rider.name, Rider.phone, Rider.plate)
+    riders = riders.filter(Rider.id.in_(rider_ids)) if rider_ids else riders.filter(Rider.is_active)
+    riders = riders.order_by(Rider.id).all()
+    if not riders:
+        return []
+
+    day = func.date(Payment.created_at)
+    rows = db.query(
+        Delivery.rider_id,
+        day.label("day"),
+        Payment.settlement_status,
+        func.count(Payment.id).label("payments"),
+        func.sum(Payment.total_amount).label("total_amount"),
+        func.sum(Payment.rider_amount).label("rider_amount"),
+        func.sum(Payment.coop_amount).label("coop_amount"),
+    ).join(Delivery, Payment.delivery_id == Delivery.id) \
+        .filter(Delivery.rider_id.in_([rider.id for rider in riders]),
+                Payment.created_at >= start_date,
+                Payment.created_at < end_date) \
+        .group_by(Delivery.rider_id, day, Payment.settlement_status) \
+        .order_by(Delivery.rider_id, day, Payment.settlement_status).all()
+
+    lines = defaultdict(list)
+    for row in rows:
+        lines[row.rider_id].append({
+            "day": str(row.day),
+            "settlement_status": row.settlement_status.value if row.settlement_status else None,
+            "payments": row.payments,
+            "total_amount": float(row.total_amount or 0),
+            "rider_amount": float(row.rider_amount or 0),
+            "coop_amount": float(row.coop_amount or 0),
+        })
+
+    statements = []
+    for rider in riders:
+        rider_lines = lines[rider.id]
+        by_status = defaultdict(float)
+        for line in rider_lines:
+            # Los pagos sin estado van bajo "": json.dumps(sort_keys=True) no ordena None con str
+            by_status[line["settlement_status"] or ""] += line["rider_amount"]
+        statements.append({
+            "rider_id": rider.id,
+            "rider_name": rider.name,
+            "rider_phone": rider.phone,
+            "plate": rider.plate,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "lines": rider_lines,
+            "totals": {field: sum(line[field] for line in rider_lines) for field in _AMOUNT_FIELDS},
+            "rider_amount_by_status": dict(by_status),
+        })
+    return statements
+
+
+def statement_hash(statement, statement_format):
+    raw = json.dumps({"statement": statement, "format": statement_format}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def render_statement_csv(statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["rider_id", "rider_name", "day", "settlement_status", *_AMOUNT_FIELDS])
+    for line in statement["lines"]:
+        writer.writerow([statement["rider_id"], statement["rider_name"], line["day"], line["settlement_status"],
+                         *(line[field] for field in _AMOUNT_FIELDS)])
+    writer.writerow([statement["rider_id"], statement["rider_name"], "TOTAL", "",
+                     *(statement["totals"][field] for field in _AMOUNT_FIELDS)])
+    return buffer.getvalue().encode("utf-8")
+
+
+def render_statement_pdf(statement):
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    height = letter[1]
+
+    def header():
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(40, height - 50, f"Extracto de pagos - {statement['rider_name']} (#{statement['rider_id']})")
+        p.setFont("Helvetica", 10)
+        p.drawString(40, height - 68, f"Placa: {statement['plate']}   Teléfono: {statement['rider_phone']}")
+        p.drawString(40, height - 82, f"Periodo: {statement['start_date'][:10]} a {statement['end_date'][:10]}")
+        p.setFont("Helvetica-Bold", 10)
+        for x, text in ((40, "Día"), (130, "Estado"), (300, "Pagos"), (360, "Total"), (450, "Rider")):
+            p.drawString(x, height - 110, text)
+        p.setFont("Helvetica", 10)
+        return height - 126
+
+    y = header()
+    for line in statement["lines"]:
+        if y < 80:
+            p.showPage()
+            y = header()
+        p.drawString(40, y, line["day"])
+        p.drawString(130, y, line["settlement_status"] or "")
+        p.drawRightString(330, y, str(line["payments"]))
+        p.drawRightString(420, y, f"{line['total_amount']:,.0f}")
+        p.drawRightString(510, y, f"{line['rider_amount']:,.0f}")
+        y -= 16
+
+    totals = statement["totals"]
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(40, y - 8, "TOTAL")
+    p.drawRightString(330, y - 8, str(totals["payments"]))
+    p.drawRightString(420, y - 8, f"{totals['total_amount']:,.0f}")
+    p.drawRightString(510, y - 8, f"{totals['rider_amount']:,.0f}")
+
+    p.setFont("Helvetica", 10)
+    y -= 32
+    for status, amount in sorted(statement["rider_amount_by_status"].items()):
+        p.drawString(40, y, f"{status}: {amount:,.0f}")
+        y -= 14
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def render_statement(statement, statement_format):
+    if statement_format == "csv":
+        return render_statement_csv(statement)
+    return render_statement_pdf(statement)
+
+
+class StatementStore:
+    """Archivos de extractos y estado de trabajos en disco."""
+
+    def __init__(self, base_dir):
+        self.cache_dir = os.path.join(base_dir, "cache")
+        self.jobs_dir = os.path.join(base_dir, "jobs")
+
+    def _ensure_dirs(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def file_path(self, key, statement_format):
+        return os.path.join(self.cache_dir, f"{key}.{statement_format}")
+
+    def has_file(self, key, statement_format):
+        return os.path.exists(self.file_path(key, statement_format))
+
+    def write_file(self, key, statement_format, content):
+        self._ensure_dirs()
+        path = self.file_path(key, statement_format)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+    def new_job(self, params):
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "created_at": datetime.utcnow().isoformat(),
+               "finished_at": None, "params": params, "statements": {}, "error": None}
+        self.save_job(job)
+        return job
+
+    def save_job(self, job):
+        self._ensure_dirs()
+        path = os.path.join(self.jobs_dir, f"{job['job_id']}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(job, file)
+        os.replace(tmp_path, path)
+
+    def get_job(self, job_id):
+        # El job_id es un uuid hex: nada de rutas arbitrarias
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(self.jobs_dir, f"{job_id}.json")) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+
+statement_store = StatementStore(STATEMENT_DIR)
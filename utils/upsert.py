@@ -0,0 +1,39 @@
+"""Suma incremental sobre tablas de contadores (payment_ledger, rider_stats).
+
+Dos flush concurrentes que crean la misma fila no pueden hacer UPDATE y luego
+INSERT: ambos ven rowcount 0 y el segundo INSERT choca con la llave. En SQLite
+y MySQL se usa un solo INSERT ... ON CONFLICT / ON DUPLICATE KEY que suma sobre
+la fila existente; en otros motores se conserva UPDATE y luego INSERT.
+"""
+from sqlalchemy import and_, update, insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def increment(conn, table, keys, amounts, **extra):
+    """Suma ``amounts`` a la fila de ``keys`` o la inserta con esos valores.
+
+    ``keys`` deben ser las columnas de la llave primaria o de un índice único, sin
+    NULL; ``extra`` (por ejemplo updated_at) se escribe tal cual en ambos casos.
+    """
+    values = {**keys, **amounts, **extra}
+
+    if conn.dialect.name == "sqlite":
+        stmt = sqlite_insert(table).values(values)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={**{name: table.c[name] + stmt.excluded[name] for name in amounts},
+                  **{name: stmt.excluded[name] for name in extra}}
+        ))
+    elif conn.dialect.name == "mysql":
+        stmt = mysql_insert(table).values(values)
+        conn.execute(stmt.on_duplicate_key_update(
+            **{name: table.c[name] + stmt.inserted[name] for name in amounts},
+            **{name: stmt.inserted[name] for name in extra}
+        ))
+    else:
+        result = conn.execute(update(table).where(and_(*[table.c[name] == value for name, value in keys.items()]))
+                              .values({**{name: table.c[name] + value for name, value in amounts.items()},
+                                       **extra}))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(values))
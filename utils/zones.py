@@ -0,0 +1,95 @@
+import math
+from itertools import combinations
+
+from schemas.schemas import DeliveryLocations
+from utils.mapping import split_address
+
+_LOCATIONS_BY_VALUE = {location.value.lower(): location for location in DeliveryLocations}
+
+# Punto de partida de las rutas (la oficina está en Medellín)
+ROUTE_ORIGIN = DeliveryLocations.MEDELLIN
+
+# Centro aproximado (lat, lon) de cada zona
+ZONE_COORDINATES = {
+    DeliveryLocations.MEDELLIN: (6.2476, -75.5658),
+    DeliveryLocations.BELEN: (6.2306, -75.5990),
+    DeliveryLocations.LA_ESTRELLA: (6.1576, -75.6430),
+    DeliveryLocations.ENVIGADO: (6.1710, -75.5870),
+    DeliveryLocations.ITAGUI: (6.1719, -75.6114),
+    DeliveryLocations.CALDAS: (6.0910, -75.6357),
+    DeliveryLocations.SABANETA: (6.1515, -75.6166),
+    DeliveryLocations.SAN_ANTONIO: (6.1830, -75.6600),
+    DeliveryLocations.BELLO: (6.3373, -75.5579),
+    DeliveryLocations.COPACABANA: (6.3463, -75.5089),
+    DeliveryLocations.BARBOSA: (6.4386, -75.3310),
+    DeliveryLocations.GIRARDOTA: (6.3770, -75.4460),
+    DeliveryLocations.SAN_CRISTOBAL: (6.2780, -75.6370),
+    DeliveryLocations.MACHADO: (6.3330, -75.5200),
+}
+
+# Factor sobre la distancia en línea recta para aproximar la distancia por vía
+ROAD_FACTOR = 1.3
+
+
+def _haversine_km(a, b):
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def _build_distances():
+    distances = {(zone, zone): 0.0 for zone in ZONE_COORDINATES}
+    for a, b in combinations(ZONE_COORDINATES, 2):
+        km = round(_haversine_km(ZONE_COORDINATES[a], ZONE_COORDINATES[b]) * ROAD_FACTOR, 1)
+        distances[(a, b)] = distances[(b, a)] = km
+    return distances
+
+
+# Tabla de distancias (km) entre zonas, calculada una sola vez al importar
+ZONE_DISTANCES_KM = _build_distances()
+
+
+def location_from_address(delivery_address: str):
+    """DeliveryLocations guardada como sufijo de la dirección, o None si no se reconoce."""
+    _, location = split_address(delivery_address)
+    if not location:
+        return None
+    return _LOCATIONS_BY_VALUE.get(location.strip().lower())
+
+
+def _route_length(route, origin):
+    stops = [origin, *route]
+    return sum(ZONE_DISTANCES_KM[(a, b)] for a, b in zip(stops, stops[1:]))
+
+
+def order_zones(zones, origin=ROUTE_ORIGIN):
+    """Ordena las zonas a visitar partiendo de origin.
+
+    Vecino más cercano sobre la tabla de distancias y luego 2-opt para deshacer
+    cruces; con 14 zonas como máximo ambas pasadas son inmediatas.
+    """
+    pending = set(zones)
+    route = []
+    current = origin
+    while pending:
+        current = min(pending, key=lambda zone: (ZONE_DISTANCES_KM[(current, zone)], zone.name))
+        pending.remove(current)
+        route.append(current)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                if _route_length(candidate, origin) < _route_length(route, origin) - 1e-9:
+                    route = candidate
+                    improved = True
+    return route
+
+
+def route_legs(route, origin=ROUTE_ORIGIN):
+    """Distancia en km de cada parada desde la anterior (la primera desde origin)."""
+    stops = [origin, *route]
+    return [ZONE_DISTANCES_KM[(a, b)] for a, b in zip(stops, stops[1:])]